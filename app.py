@@ -2,31 +2,27 @@ import streamlit as st
 import numpy as np
 import json
 import os
+from contextlib import contextmanager
 from PIL import Image
 
-# GLOBAL RAM TUNING (First thing after imports)
-try:
-    import torch
-    torch.set_grad_enabled(False)
-    torch.set_num_threads(1)
-except:
-    pass
-
+# LAZY ENGINE IMPORTS: torch, OpenCV, the canvas component and the paint/render
+# engines are imported where they are first used (see render_dashboard), so the
+# landing page never pays for them. utils/startup.py can pre-warm them.
 from utils.export_utils import convert_to_downloadable, create_comparison_image
-from utils.lighting_utils import extract_lighting_maps
-from utils.mask_utils import merge_masks, smooth_mask, dilate_mask
-from ui.lasso_canvas import render_lasso_tool, render_click_tool, render_box_tool
-from paint_ai.paint_engine import apply_realistic_paint
-from utils.render_utils import render_high_res
+from utils.startup import start_warmup
 from streamlit_javascript import st_javascript
 
 # --- Universal Version Bridge (Monkey Patch for Canvas & Fragments) ---
 import streamlit.elements.image as st_image
+from utils.frame_transport import frame_to_url
 # FORCE overwrite to ensure consistency across versions
-def patched_image_to_url(data, width, height, clamp, channels, format, image_id):
-    from streamlit.runtime import runtime
-    # Use the modern media manager API
-    return runtime.get_instance().media_file_mgr.add(data, "image/png", image_id)
+def patched_image_to_url(data, width, *args):
+    # The canvas passes (height, clamp, channels, format, image_id); st.image omits height
+    image_id = args[-1]
+    from streamlit import runtime
+    # Use the modern media manager API. Backgrounds go out as cached JPEG/WebP
+    # (see utils/frame_transport.py) instead of a fresh lossless PNG every repaint.
+    return frame_to_url(runtime.get_instance().media_file_mgr, data, image_id)
 st_image.image_to_url = patched_image_to_url
 
 # Hybrid Fragment Decorator (Survives any version)
@@ -45,6 +41,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Optional: preload engine modules in the server process (VISUALIZER_WARMUP)
+start_warmup()
+
 # --- Room Visualization Logic ---
 st.markdown("""
 <style>
@@ -137,17 +136,7 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-from utils.image_utils import resize_image_max_side, pil_to_cv2, cv2_to_pil
-def hex_to_lab(hex_code):
-    import numpy as np
-    import cv2
-    hex_code = hex_code.lstrip('#')
-    rgb = tuple(int(hex_code[i:i+2], 16) for i in (0, 2, 4))
-    rgb_arr = np.array([[list(rgb)]], dtype=np.uint8) 
-    bgr_arr = cv2.cvtColor(rgb_arr, cv2.COLOR_RGB2BGR)
-    lab_arr = cv2.cvtColor(bgr_arr, cv2.COLOR_BGR2LAB)
-    return lab_arr[0][0]
-
+from utils.image_utils import pil_to_cv2, cv2_to_pil
 
 # --- Session State ---
 if 'state' not in st.session_state:
@@ -167,6 +156,9 @@ if 'state' not in st.session_state:
         'compare_mode': False,
         'segmentation_mode': 'Walls (Default)',
         'selected_object_index': -1,
+        'object_prompts': {}, # {mask_idx: click prompts + low-res SAM logits (paint_ai/object_refiner.py)}
+        'mask_polygons': {}, # {mask_idx: lasso polygons in preview coordinates (vector masks)}
+        'mask_version': 0, # Bumped whenever a mask is edited in place
         'ai_ready': False # Lazy AI flag
     }
 
@@ -195,6 +187,105 @@ if 'selection_state' not in st.session_state:
         'layer_index': 0
     }
 
+@contextmanager
+def session_run():
+    """
+    Holds this session in the idle-spill store for the duration of the run (other
+    sessions' sweeps never spill it mid-run) and records what it holds.
+    """
+    from utils.session_store import get_session_store, current_session_id
+    extra_bytes = 0 # The full-resolution original is spooled to disk, not held here
+    if 'base_image' in st.session_state:
+        bw, bh = st.session_state.base_image.size
+        extra_bytes += bw * bh * 3
+    with get_session_store().run(
+        current_session_id(),
+        st.session_state.state,
+        predictor=st.session_state.get('predictor'),
+        caches=[st.session_state.get('mask_cache'), st.session_state.get('paint_bases')],
+        extra_bytes=extra_bytes,
+    ):
+        # Under memory pressure: spill other sessions, drop caches (see utils/memory_governor.py)
+        from utils.memory_governor import get_memory_governor
+        get_memory_governor().check(current_session_id())
+        yield
+
+def run_scheduled(op, fn, label="Request", with_ticket=False):
+    """
+    Runs fn() once the job scheduler admits it (see utils/job_scheduler.py), showing the
+    queue position meanwhile. Stops the run if the server is saturated or the job is cancelled.
+    with_ticket=True calls fn(ticket) instead, for long jobs that watch ticket.cancel_event.
+    """
+    from utils.job_scheduler import get_job_scheduler, SchedulerBusy, JobCancelled
+    from utils.session_store import current_session_id
+    status = st.empty()
+    try:
+        with get_job_scheduler().slot(op, current_session_id(),
+                                      on_wait=lambda pos: status.info(f"⏳ {label} queued (position {pos})...")) as ticket:
+            status.empty()
+            return fn(ticket) if with_ticket else fn()
+    except SchedulerBusy:
+        status.warning("⏳ Server is busy. Please try again in a moment.")
+        st.stop()
+    except JobCancelled:
+        st.stop()
+
+def render_export_png():
+    """
+    Full-resolution PNG of the current paint job. Served from the export cache when an
+    identical render spec was exported before (by any session); otherwise rendered from
+    the spooled original and cached. Returns (png_bytes, from_cache), or (None, False)
+    if the original is gone.
+    """
+    from utils.export_cache import render_spec_key, get_export, put_export
+    from utils.upload_spool import open_spooled
+    state = st.session_state.state
+    path = st.session_state.get('full_res_path')
+    # Clicked objects are re-decoded with the export tier's larger model when one fits in memory
+    refine_model = None
+    if state.get('object_prompts') and state.get('ai_ready'):
+        from paint_ai.model_registry import select_export_model
+        refine_model = select_export_model(getattr(st.session_state.get('predictor'), 'model_type', None))
+    key = None
+    if path:
+        # Spool files are named by content hash: the original's identity
+        key = render_spec_key(os.path.basename(path), state['masks'], state['wall_assignments'],
+                              mask_logits=state.get('object_prompts'), mask_polygons=state.get('mask_polygons'),
+                              refine_model=refine_model)
+        cached = get_export(key)
+        if cached is not None:
+            return cached, True
+
+    # Full-resolution decode happens only here, from the spooled original
+    full_img = open_spooled(path)
+    if full_img is None:
+        return None, False
+    from utils.render_utils import render_high_res
+    from utils.memory_governor import get_memory_governor
+
+    def render():
+        mask_logits = state.get('object_prompts')
+        if refine_model:
+            from paint_ai.model_registry import load_predictor
+            from paint_ai.object_refiner import refine_for_export
+            predictor = load_predictor(refine_model)
+            if predictor is not None:
+                mask_logits = refine_for_export(predictor, np.array(full_img.convert("RGB")), state['masks'],
+                                                mask_logits, state['wall_assignments'])
+        return render_high_res(
+            full_img,
+            state['masks'],
+            state['wall_assignments'],
+            mask_logits=mask_logits,
+            mask_polygons=state.get('mask_polygons'),
+            tile_rows=get_memory_governor().export_tile_rows(full_img.size) # Low-memory mode under pressure
+        )
+
+    high_res_cv2 = run_scheduled("export", render, "4K export")
+    download_bytes = convert_to_downloadable(cv2_to_pil(high_res_cv2))
+    put_export(key, download_bytes)
+    return download_bytes, False
+
 def undo():
     if st.session_state.state['history']:
         st.session_state.state['wall_assignments'] = st.session_state.state['history'].pop()
@@ -219,6 +310,18 @@ uploaded_file = st.sidebar.file_uploader("Upload Room Image", type=["jpg", "png"
 
 @smart_fragment
 def render_dashboard(tool_mode, compare_mode=False, seg_mode="Walls (Default)", lasso_op="Add"):
+    # Fragment reruns skip the main script: hold the session for this run too
+    with session_run():
+        _render_dashboard(tool_mode, compare_mode, seg_mode, lasso_op)
+
+def _render_dashboard(tool_mode, compare_mode, seg_mode, lasso_op):
+    # Engine imports (cached in sys.modules after the first run or warm-up)
+    from utils.mask_utils import smooth_mask
+    from utils.color_utils import hex_to_lab
+    from paint_ai.paint_engine import PaintBasisCache
+    from ui.lasso_canvas import render_lasso_tool, render_click_tool, render_box_tool
+    from paint_ai.sam_loader import embed_image # torch itself loads lazily, on the first embed
+
     # --- ROBUST DEVICE DETECTION ---
     js_width = st.session_state.get('screen_width', 0)
     is_mobile = (js_width > 0 and js_width < 1100)
@@ -365,27 +468,71 @@ def render_dashboard(tool_mode, compare_mode=False, seg_mode="Walls (Default)",
         # --- LAZY AI AND LIGHTING INITIALIZATION ---
         # 1. AI FIRST (Highest RAM risk)
         if "AI" in tool_mode and not st.session_state.state.get('ai_ready'):
-            from paint_ai.sam_loader import get_sam_predictor, download_model_if_needed
+            from paint_ai.sam_loader import download_model_if_needed
+            from paint_ai.model_registry import get_tiered_predictor
             if download_model_if_needed():
                 with st.spinner("🧠 Connecting AI (one-time setup)..."):
                     import gc
                     gc.collect() 
-                    st.session_state.predictor = get_sam_predictor()
+                    # Fastest model that fits (MobileSAM if installed, else ViT-B)
+                    st.session_state.predictor, model_type = get_tiered_predictor("interactive")
                     if st.session_state.predictor:
+                        add_log(f"AI model: {model_type}")
                         # DEFERRED: set_image will happen on first click to save RAM
                         st.session_state.state['ai_ready'] = True
                         st.session_state.state['ai_image_embedded'] = False
+                        # Project loaded with a saved embedding: skip the image encoder
+                        pending = st.session_state.pop('pending_embedding', None)
+                        if pending is not None:
+                            from paint_ai.sam_loader import restore_embedding
+                            if restore_embedding(st.session_state.predictor, pending):
+                                st.session_state.state['ai_image_embedded'] = True
+                                add_log("Restored saved AI embedding")
                         gc.collect()
 
         # 2. LIGHTING SECOND (Wait for AI to settle)
         if st.session_state.state.get('lighting_maps') is None:
+            import cv2 # cv2.error: OpenCV's failed allocations
             try:
                 with st.spinner("🌤 Analyzing lighting..."):
                     from utils.lighting_utils import extract_lighting_maps
-                    st.session_state.state['lighting_maps'] = extract_lighting_maps(st.session_state.base_image)
-            except Exception as e:
+                    from utils.memory_governor import retry_on_memory_error
+                    from utils.session_store import current_session_id
+                    st.session_state.state['lighting_maps'] = retry_on_memory_error(
+                        lambda: extract_lighting_maps(st.session_state.base_image), current_session_id())
+            except (MemoryError, cv2.error):
                 st.error(f"Memory limit hit during analysis. Please use a smaller image.")
                 return
+
+        # 2b. REGION GRAPH (superpixels for lasso snapping / region growing, no model needed)
+        if st.session_state.state.get('region_graph') is None and "Lasso" in tool_mode:
+            try:
+                with st.spinner("🧩 Analyzing regions..."):
+                    from utils.region_graph import build_region_graph
+                    st.session_state.state['region_graph'] = build_region_graph(st.session_state.base_image)
+            except Exception as e:
+                add_log(f"Region graph unavailable: {e}")
+                st.session_state.state['region_graph'] = False # Don't retry every rerun
+
+        # 3. BACKGROUND WALL SCAN (optional): streams regions coarse-to-fine, clickable as they arrive
+        auto_job = st.session_state.get('auto_wall_job')
+        if auto_job is not None and ("AI" not in tool_mode or not st.session_state.state.get('auto_scan')):
+            auto_job.cancel() # User left the AI tools: stop the remaining work
+            st.session_state.auto_wall_job = None
+        elif (auto_job is None and "AI" in tool_mode and st.session_state.state.get('auto_scan')
+              and st.session_state.get('predictor')):
+            from paint_ai.wall_segmenter import WallSegmenter, AutoSegmentationJob
+            from utils.job_scheduler import get_job_scheduler
+            from utils.session_store import current_session_id
+            with st.spinner("🧠 Embedding image for AI..."):
+                run_scheduled("embed", lambda: embed_image(st.session_state.predictor, np.array(st.session_state.base_image)), "AI embedding")
+                st.session_state.state['ai_image_embedded'] = True
+            segmenter = WallSegmenter(st.session_state.predictor.model, predictor=st.session_state.predictor)
+            st.session_state.auto_wall_job = AutoSegmentationJob(
+                segmenter, np.array(st.session_state.base_image), st.session_state.state['lighting_maps'],
+                scheduler=get_job_scheduler(), session_id=current_session_id()
+            )
+            add_log("Background wall scan started")
     # ---------------------------------------------
 
     if 'base_image' in st.session_state:
@@ -473,17 +620,24 @@ def render_dashboard(tool_mode, compare_mode=False, seg_mode="Walls (Default)",
         base_cv2 = pil_to_cv2(st.session_state.base_image)
         
         # Repaint logic (using caching)
-        current_hash = str(st.session_state.state['wall_assignments'])
+        current_hash = f"{st.session_state.state['wall_assignments']}|{st.session_state.state.get('mask_version', 0)}"
         if (st.session_state.state.get('cached_assignments_hash') == current_hash and 
             st.session_state.state.get('cached_paint_cv2') is not None):
             canvas_cv2 = st.session_state.state['cached_paint_cv2'].copy()
         else:
             canvas_cv2 = base_cv2.copy()
+            # Per-layer paint bases: a color change is a multiply-add + LAB->RGB per layer
+            if 'paint_bases' not in st.session_state:
+                st.session_state.paint_bases = PaintBasisCache()
             for mask_idx, paint_data in st.session_state.state['wall_assignments'].items():
                 if 0 <= mask_idx < len(st.session_state.state['masks']):
                     # FIX: Remove dilate_mask here. Smooth is enough, engine handles edges with alpha.
-                    mask = smooth_mask(st.session_state.state['masks'][mask_idx])
-                    canvas_cv2 = apply_realistic_paint(canvas_cv2, mask, paint_data['lab'], paint_data['finish'].lower(), paint_data['reflectance'], st.session_state.state['lighting_maps'])
+                    layer_key = (st.session_state.state.get('image_id'), mask_idx, st.session_state.state.get('mask_version', 0))
+                    basis = st.session_state.paint_bases.get(
+                        layer_key, lambda: smooth_mask(st.session_state.state['masks'][mask_idx]),
+                        st.session_state.state['lighting_maps'], paint_data['finish'].lower(), paint_data['reflectance']
+                    )
+                    canvas_cv2 = basis.apply(canvas_cv2, paint_data['lab'])
             st.session_state.state['cached_paint_cv2'] = canvas_cv2.copy()
             st.session_state.state['cached_assignments_hash'] = current_hash
 
@@ -518,6 +672,26 @@ def render_dashboard(tool_mode, compare_mode=False, seg_mode="Walls (Default)",
                     x, y = value['x'], value['y']
                     st.toast(f"🎯 Point Detected at {x}, {y}!", icon="🎯")
                     add_log(f"Click Detected: {x}, {y}")
+
+                    # 0. REFINE SELECTED OBJECT (+/- points, reusing its low-res logits)
+                    sel_idx = st.session_state.state.get('selected_object_index', -1)
+                    click_action = st.session_state.state.get('click_action', "New Object")
+                    obj_prompts = st.session_state.state.setdefault('object_prompts', {})
+                    if click_action != "New Object" and sel_idx in obj_prompts and st.session_state.get('predictor'):
+                        from paint_ai.object_refiner import refine_object
+                        if st.session_state.state.get('ai_image_embedded'):
+                            embed_image(st.session_state.predictor, np.array(st.session_state.base_image)) # Hash check only
+                        else:
+                            run_scheduled("embed", lambda: embed_image(st.session_state.predictor, np.array(st.session_state.base_image)), "AI embedding")
+                        st.session_state.state['ai_image_embedded'] = True
+                        refined = run_scheduled("decode", lambda: refine_object(st.session_state.predictor, obj_prompts[sel_idx], x, y,
+                                                positive=(click_action == "Refine: Add Area")), "AI selection")
+                        save_history()
+                        st.session_state.state['masks'][sel_idx] = smooth_mask(refined)
+                        st.session_state.state['mask_version'] = st.session_state.state.get('mask_version', 0) + 1
+                        add_log(f"Refined object #{sel_idx} ({len(obj_prompts[sel_idx]['points'])} points)")
+                        st.session_state.canvas_key_id += 1
+                        st.rerun()
                     
                     # 1. CHECK FOR HIT ON EXISTING OBJECT (Edit Mode)
                     # Check in reverse order (top-most first)
@@ -541,6 +715,13 @@ def render_dashboard(tool_mode, compare_mode=False, seg_mode="Walls (Default)",
                     for i, mask in enumerate(st.session_state.state['masks']):
                          if mask[y, x]:
                              candidates.append({'mask': mask, 'id': f"arch_{i}"})
+
+                    # Partial results of the background wall scan (if running)
+                    auto_job = st.session_state.get('auto_wall_job')
+                    if auto_job is not None:
+                        auto_hit = auto_job.hit_test(x, y)
+                        if auto_hit is not None:
+                            candidates.append({'mask': smooth_mask(auto_hit['segmentation']), 'id': "auto_scan"})
                     
                     if 'predictor' in st.session_state:
                         # EAGER EMBEDDING ON FIRST CLICK
@@ -548,13 +729,30 @@ def render_dashboard(tool_mode, compare_mode=False, seg_mode="Walls (Default)",
                             with st.spinner("🧠 Embedding image for AI..."):
                                 import gc
                                 gc.collect()
-                                st.session_state.predictor.set_image(np.array(st.session_state.base_image))
+                                run_scheduled("embed", lambda: embed_image(st.session_state.predictor, np.array(st.session_state.base_image)), "AI embedding")
                                 st.session_state.state['ai_image_embedded'] = True
                                 gc.collect()
                                 
-                        import torch
-                        with torch.inference_mode():
-                            p_masks, _, _ = st.session_state.predictor.predict(point_coords=np.array([[x, y]]), point_labels=np.array([1]), multimask_output=True)
+                        # CANDIDATE CACHE: depth cycling / repeat clicks skip the decoder and smoothing
+                        from paint_ai.candidate_cache import MaskCandidateCache
+                        if 'mask_cache' not in st.session_state:
+                            st.session_state.mask_cache = MaskCandidateCache()
+                        cache_key = st.session_state.mask_cache.make_key(
+                            getattr(st.session_state.predictor, 'embedding_id', None), x, y, seg_mode)
+                        cached = st.session_state.mask_cache.get(cache_key)
+                        pinpoint_logits = None # Kept for refinement/export
+                        if cached is None:
+                            import torch
+                            def decode_click():
+                                with torch.inference_mode():
+                                    return st.session_state.predictor.predict(point_coords=np.array([[x, y]]), point_labels=np.array([1]), multimask_output=True)
+                            p_masks, p_scores, pinpoint_logits = run_scheduled("decode", decode_click, "AI selection")
+                            smoothed_masks = [smooth_mask(m) for m in p_masks]
+                            st.session_state.mask_cache.put(cache_key, p_masks, p_scores, smoothed_masks, pinpoint_logits)
+                        else:
+                            smoothed_masks = cached['smoothed']
+                            pinpoint_logits = cached['logits']
+                            add_log("Candidate cache hit")
                         
                         # SEGMENTATION MODE LOGIC: Influence candidate selection
                         # SAM p_masks indices: 0 (Smallest/Detail), 1 (Medium/Object), 2 (Whole/Largest)
@@ -566,7 +764,7 @@ def render_dashboard(tool_mode, compare_mode=False, seg_mode="Walls (Default)",
                             indices = [1, 0, 2] # Usually index 1 is best for walls
                             
                         for j in indices:
-                            candidates.append({'mask': smooth_mask(p_masks[j]), 'id': f"pinpoint_{j}"})
+                            candidates.append({'mask': smoothed_masks[j], 'id': f"pinpoint_{j}"})
                         add_log(f"SAM Generated {len(candidates)} candidates")
                     st.toast(f"AI found {len(candidates)} wall options", icon="🤖")
 
@@ -585,11 +783,19 @@ def render_dashboard(tool_mode, compare_mode=False, seg_mode="Walls (Default)",
                         else:
                             chosen_idx = len(st.session_state.state['masks'])
                             st.session_state.state['masks'].append(selected_candidate['mask'])
+                            if selected_candidate['id'].startswith('pinpoint_'):
+                                from paint_ai.object_refiner import new_object_state
+                                j = int(selected_candidate['id'].split('_')[1])
+                                st.session_state.state.setdefault('object_prompts', {})[chosen_idx] = new_object_state(
+                                    st.session_state.predictor, x, y,
+                                    None if pinpoint_logits is None else pinpoint_logits[j])
                         
                         st.session_state.state['wall_assignments'][chosen_idx] = {
                             'id': ui_color['id'], 'hex': ui_color['hex'], 'lab': ui_color['lab'],
                             'finish': selected_finish, 'reflectance': selected_reflectance
                         }
+                        # Auto-select so "Refine" clicks apply to this object
+                        st.session_state.state['selected_object_index'] = chosen_idx
                         st.toast("✅ Paint Applied!", icon="🎨")
                         st.session_state.canvas_key_id += 1
                         st.rerun()
@@ -605,14 +811,16 @@ def render_dashboard(tool_mode, compare_mode=False, seg_mode="Walls (Default)",
                         with st.spinner("🧠 Embedding image for AI..."):
                             import gc
                             gc.collect()
-                            st.session_state.predictor.set_image(np.array(st.session_state.base_image))
+                            run_scheduled("embed", lambda: embed_image(st.session_state.predictor, np.array(st.session_state.base_image)), "AI embedding")
                             st.session_state.state['ai_image_embedded'] = True
                             gc.collect()
                             
                     import torch
-                    with torch.inference_mode():
-                        # SAM Box prediction
-                        p_masks, _, _ = st.session_state.predictor.predict(box=np.array(box), multimask_output=True)
+                    def decode_box():
+                        with torch.inference_mode():
+                            # SAM Box prediction
+                            return st.session_state.predictor.predict(box=np.array(box), multimask_output=True)
+                    p_masks, _, _ = run_scheduled("decode", decode_box, "AI selection")
                     
                     # Same segmentation preference as click
                     if seg_mode == "Small Objects": indices = [0, 1, 2]
@@ -638,17 +846,40 @@ def render_dashboard(tool_mode, compare_mode=False, seg_mode="Walls (Default)",
         else:
             # Lasso UI inside fragment
             lasso_key = f"lasso_tool_{st.session_state.canvas_key_id}"
-            lasso_mask = render_lasso_tool(img_disp, key=lasso_key, canvas_width=display_width)
+            lasso_mask, lasso_polygons = render_lasso_tool(img_disp, key=lasso_key, canvas_width=display_width, return_polygons=True)
             if lasso_mask is not None and np.any(lasso_mask):
-                if st.button("Apply Paint" if lasso_op == "Add" else "Apply Remove", type="primary"):
+                region_graph = st.session_state.state.get('region_graph')
+                grow = False
+                if region_graph:
+                    from utils.region_graph import snap_mask_to_regions, grow_region
+                    if st.session_state.state.get('lasso_snap', True):
+                        snapped = snap_mask_to_regions(region_graph, lasso_mask)
+                        if np.any(snapped):
+                            lasso_mask = snapped
+                            lasso_polygons = [] # Superpixel edges: keep the raster mask
+                    if lasso_op == "Add":
+                        grow = st.button("Grow Similar Region & Apply")
+                        if grow:
+                            lasso_mask = grow_region(region_graph, lasso_mask)
+                            lasso_polygons = []
+                if grow or st.button("Apply Paint" if lasso_op == "Add" else "Apply Remove", type="primary"):
                     save_history()
                     if lasso_op == "Add":
                         idx = len(st.session_state.state['masks'])
                         st.session_state.state['masks'].append(lasso_mask)
                         st.session_state.state['wall_assignments'][idx] = {'id': ui_color['id'], 'hex': ui_color['hex'], 'lab': ui_color['lab'], 'finish': selected_finish, 'reflectance': selected_reflectance}
+                        if lasso_polygons:
+                            # Vector copy: export rasterizes the polygon at full resolution
+                            st.session_state.state.setdefault('mask_polygons', {})[idx] = lasso_polygons
                     else:
                         for idx in list(st.session_state.state['wall_assignments'].keys()):
+                            if not np.any(st.session_state.state['masks'][idx] & lasso_mask):
+                                continue # Untouched: keeps its logits/polygons for the export
                             st.session_state.state['masks'][idx] = np.logical_and(st.session_state.state['masks'][idx], np.logical_not(lasso_mask))
+                            # Logits no longer describe the edited mask: export falls back to the binary mask
+                            st.session_state.state.get('object_prompts', {}).pop(idx, None)
+                            st.session_state.state.get('mask_polygons', {}).pop(idx, None)
+                        st.session_state.state['mask_version'] = st.session_state.state.get('mask_version', 0) + 1
                     st.session_state.canvas_key_id += 1
                     st.rerun()
 
@@ -658,16 +889,10 @@ def render_dashboard(tool_mode, compare_mode=False, seg_mode="Walls (Default)",
                 # Vertical Stack for Mobile
                 if st.button("Download High Quality (4K) Image", key="dl_btn_mobile", use_container_width=True):
                     with st.spinner("Generating 4K Render..."):
-                        # Decompress full res image
-                        import io
-                        if 'full_res_bytes' in st.session_state:
-                            full_img = Image.open(io.BytesIO(st.session_state.full_res_bytes))
-                            high_res_cv2 = render_high_res(
-                                full_img, 
-                                st.session_state.state['masks'], 
-                                st.session_state.state['wall_assignments']
-                            )
-                            download_bytes = convert_to_downloadable(cv2_to_pil(high_res_cv2))
+                        download_bytes, from_cache = render_export_png()
+                        if download_bytes is not None:
+                            if from_cache:
+                                st.caption("⚡ Served from the render cache (no re-render needed)")
                             st.download_button(
                                 "Confirm 4K Download", 
                                 download_bytes, 
@@ -685,21 +910,46 @@ def render_dashboard(tool_mode, compare_mode=False, seg_mode="Walls (Default)",
                 with c1:
                     if st.button("Generate High Quality (4K) Download", key="dl_btn_desktop"):
                         with st.spinner("Preparing 4K resolution image (this takes a few seconds)..."):
-                            # Decompress full res image for rendering
-                            import io
-                            full_img = Image.open(io.BytesIO(st.session_state.full_res_bytes))
-                            high_res_cv2 = render_high_res(
-                                full_img, 
-                                st.session_state.state['masks'], 
-                                st.session_state.state['wall_assignments']
-                            )
-                            download_bytes = convert_to_downloadable(cv2_to_pil(high_res_cv2))
-                            st.download_button("Confirm 4K Download", download_bytes, "painted_room_4k.png", "image/png")
+                            download_bytes, from_cache = render_export_png()
+                            if download_bytes is not None:
+                                if from_cache:
+                                    st.caption("⚡ Served from the render cache (no re-render needed)")
+                                st.download_button("Confirm 4K Download", download_bytes, "painted_room_4k.png", "image/png")
+                            else:
+                                st.error("Original image data lost. Please re-upload.")
                 with c2:
                     st.image(create_comparison_image(st.session_state.base_image, cv2_to_pil(canvas_cv2)), caption="Comparison")
 
 
 
+def apply_catalog_color(m_idx, match):
+    """Paints an object with a catalog color (keeps its finish)."""
+    save_history()
+    st.session_state.state['wall_assignments'][m_idx].update({
+        'id': match['id'], 'hex': match['hex'].lower(), 'lab': match['lab'], 'reflectance': match['reflectance']
+    })
+    st.session_state.pop(f"sidebar_h_{m_idx}", None) # Picker re-reads the new color
+
+def render_color_matches(m_idx):
+    """Closest catalog paints to the color already on the object's surface (original photo)."""
+    lighting_maps = st.session_state.state.get('lighting_maps')
+    masks = st.session_state.state['masks']
+    if lighting_maps is None or 'base_image' not in st.session_state or m_idx >= len(masks):
+        return
+    from utils.color_sampling import match_mask_to_catalog
+    sample, matches = match_mask_to_catalog(np.array(st.session_state.base_image), masks[m_idx], lighting_maps, k=3)
+    if not matches:
+        return
+    st.caption("🔍 Closest paints to the current surface")
+    for rank, match in enumerate(matches):
+        c_sw, c_name, c_use = st.columns([1, 4, 2], vertical_alignment="center")
+        c_sw.markdown(f"<div style='width:22px;height:22px;border-radius:4px;background:{match['hex']};border:1px solid #888'></div>",
+                      unsafe_allow_html=True)
+        c_name.caption(f"{match['name']} · {match['brand']} (ΔE {match['delta_e']:.1f})")
+        if c_use.button("Use", key=f"sidebar_match_{m_idx}_{rank}"):
+            apply_catalog_color(m_idx, match)
+            st.rerun()
+
 @smart_fragment
 def sidebar_controller_fragment():
     # --- Unified Sidebar Manager ---
@@ -723,10 +973,25 @@ def sidebar_controller_fragment():
             ], index=["Walls (Default)", "Small Objects", "Floors/Whole"].index(st.session_state.state.get('segmentation_mode', 'Walls (Default)')),
             key="sidebar_seg_mode")
             st.session_state.state['segmentation_mode'] = seg_mode
+
+            if "AI Click" in tool_mode:
+                click_action = st.radio("Click Action", ["New Object", "Refine: Add Area", "Refine: Remove Area"],
+                                        horizontal=False, key="sidebar_click_action",
+                                        help="Refine adds include/exclude points to the selected object.")
+                st.session_state.state['click_action'] = click_action
+
+            auto_scan = st.toggle("Pre-scan walls in background", value=st.session_state.state.get('auto_scan', False), key="sidebar_auto_scan")
+            st.session_state.state['auto_scan'] = auto_scan
+            auto_job = st.session_state.get('auto_wall_job')
+            if auto_scan and auto_job is not None:
+                st.caption(f"Found {len(auto_job.masks)} regions" + ("" if auto_job.done else " (scanning...)"))
     
     if "Lasso" in tool_mode or "Drag Box" in tool_mode:
         with st.expander("🎨 Operation", expanded=True):
             lasso_op = st.radio("Operation", ["Add", "Remove"], horizontal=True, key="sidebar_lasso_op")
+            if "Lasso" in tool_mode:
+                lasso_snap = st.toggle("Snap to edges", value=st.session_state.state.get('lasso_snap', True), key="sidebar_lasso_snap")
+                st.session_state.state['lasso_snap'] = lasso_snap
 
     st.markdown("### 👁 View Settings")
     compare_mode = st.toggle("Compare Before/After", value=st.session_state.state.get('compare_mode', False), key="sidebar_compare_toggle")
@@ -759,12 +1024,16 @@ def sidebar_controller_fragment():
                                         key=f"sidebar_f_{m_idx}")
                 
                 if new_h != data['hex'] or new_f.lower() != data['finish'].lower():
+                    from utils.color_utils import hex_to_lab
                     st.session_state.state['wall_assignments'][m_idx].update({
                         'hex': new_h, 'lab': hex_to_lab(new_h), 'finish': new_f
                     })
                     st.session_state.state['selected_object_index'] = m_idx
                     st.rerun() 
                 
+                if is_expanded:
+                    render_color_matches(m_idx)
+
                 if st.button(f"Remove Object #{m_idx}", key=f"sidebar_rem_{m_idx}"):
                     save_history()
                     del st.session_state.state['wall_assignments'][m_idx]
@@ -780,53 +1049,219 @@ def sidebar_controller_fragment():
         st.write(f"Device: {'Tablet/Mobile' if is_mobile_debug else 'Desktop'}")
         st.write(f"Screen: {debug_js_width}px")
         st.write(f"AI: {'Ready' if st.session_state.state.get('ai_ready') else 'Wait'}")
+        from utils.session_store import get_session_store, current_session_id
+        session_report = get_session_store().report()
+        my_bytes = get_session_store().session_bytes(current_session_id())
+        st.write(f"Session RAM: {my_bytes / 1e6:.1f} MB")
+        st.write(f"Node: {len(session_report)} sessions, {sum(r['bytes'] for r in session_report) / 1e6:.0f} MB, "
+                 f"{sum(r['spilled'] for r in session_report)} spilled")
+        from utils.memory_governor import get_memory_governor
+        st.write(f"Memory: {get_memory_governor().describe()}")
+        from utils.job_scheduler import get_job_scheduler
+        st.write(f"Jobs: {get_job_scheduler().describe()}")
+        from utils.export_cache import cache_usage
+        cached_count, cached_bytes = cache_usage()
+        st.write(f"Export cache: {cached_count} renders, {cached_bytes / 1e6:.0f} MB")
         if st.button("🔄 Reset Global State", key="debug_reset_global"):
             st.session_state.clear(); st.rerun()
 
     return tool_mode, compare_mode, seg_mode, lasso_op
 
-with st.sidebar:
+def new_image_state(image_id, **fields):
+    """Fresh state dict for a newly opened image (upload or project)."""
+    # Stop any background scan of the previous image
+    if st.session_state.get('auto_wall_job') is not None:
+        st.session_state.auto_wall_job.cancel()
+    st.session_state.auto_wall_job = None
+    if 'mask_cache' in st.session_state:
+        st.session_state.mask_cache.clear()
+    if 'paint_bases' in st.session_state:
+        st.session_state.paint_bases.clear()
+    st.session_state.pop('pending_embedding', None)
+    state = {
+        'masks': [],
+        'wall_assignments': {},
+        'history': [],
+        'image_id': image_id,
+        'lighting_maps': None,
+        'region_graph': None,
+        'cached_paint_cv2': None,
+        'cached_assignments_hash': "",
+        'debug_logs': [],
+        'compare_mode': False,
+        'selected_object_index': -1,
+        'object_prompts': {},
+        'mask_polygons': {},
+        'mask_version': 0,
+        'ai_ready': False
+    }
+    state.update(fields)
+    return state
+
+def project_sidebar():
+    """Save the current room to a project file / open a saved one."""
+    from utils.project_io import PROJECT_EXTENSION
+    with st.expander("💾 Project", expanded=False):
+        if 'base_image' in st.session_state and st.session_state.state.get('image_id'):
+            if st.button("Prepare project file", key="project_prepare"):
+                from utils.project_io import save_project
+                from utils.upload_spool import read_spooled
+                from paint_ai.sam_loader import export_embedding
+                full_res_bytes = read_spooled(st.session_state.get('full_res_path'))
+                if full_res_bytes is None:
+                    st.error("Original image data lost. Please re-upload.")
+                    return
+                embedding = None
+                if st.session_state.state.get('ai_image_embedded'):
+                    embedding = export_embedding(st.session_state.get('predictor'))
+                st.session_state.project_bytes = save_project(
+                    st.session_state.state, full_res_bytes,
+                    st.session_state.base_image, embedding=embedding
+                )
+            if st.session_state.get('project_bytes'):
+                st.download_button(f"⬇️ Download ({len(st.session_state.project_bytes) / 1e6:.1f} MB)",
+                                   st.session_state.project_bytes, file_name=f"room.{PROJECT_EXTENSION}",
+                                   mime="application/zip", key="project_download")
+
+        project_file = st.file_uploader("Open Project", type=[PROJECT_EXTENSION], key="project_upload")
+        if project_file is not None:
+            project_file_id = f"{project_file.name}_{project_file.size}"
+            if st.session_state.get('project_file_id') != project_file_id:
+                from utils.project_io import load_project
+                try:
+                    project = load_project(project_file.getvalue())
+                except ValueError as e:
+                    st.error(f"Could not open project: {e}")
+                    return
+                st.session_state.project_file_id = project_file_id
+                st.session_state.state = new_image_state(f"project_{project['image_sha256']}", **project['state'])
+                from utils.upload_spool import spool_bytes
+                st.session_state.full_res_path = spool_bytes(project['full_res_bytes'])
+                st.session_state.base_image = project['base_image']
+                st.session_state.project_bytes = None
+                if project['embedding'] is not None:
+                    st.session_state.pending_embedding = project['embedding']
+                st.session_state.canvas_key_id += 1
+                add_log(f"Opened project ({len(project['state']['masks'])} masks)")
+                st.rerun() # Redraw the sidebar object list for the loaded room
+
+def video_sidebar():
+    """Walkthrough video: paint the clip's first frame, then render the whole clip (utils/video_pipeline.py)."""
+    with st.expander("🎬 Walkthrough Video", expanded=False):
+        video_file = st.file_uploader("Room video", type=["mp4", "mov", "avi", "webm"], key="video_upload")
+        if video_file is None:
+            return
+        video_file_id = f"{video_file.name}_{video_file.size}"
+        if st.session_state.get('video_file_id') != video_file_id:
+            from utils.upload_spool import spool_upload
+            st.session_state.video_file_id = video_file_id
+            st.session_state.video_path = spool_upload(video_file)
+            st.session_state.walkthrough = None
+
+        video_image_id = f"video_{os.path.basename(st.session_state.video_path)}"
+        if st.session_state.state.get('image_id') != video_image_id:
+            if st.button("Paint on first frame", key="video_first_frame", use_container_width=True):
+                from utils.video_pipeline import first_frame, VIDEO_MAX_SIDE
+                from utils.upload_spool import spool_bytes
+                from utils.image_utils import load_preview
+                from utils.memory_governor import get_memory_governor
+                frame = first_frame(st.session_state.video_path, VIDEO_MAX_SIDE)
+                if frame is None:
+                    st.error("Could not read this video.")
+                    return
+                # The first frame becomes the room photo (4K export works on it too)
+                st.session_state.state = new_image_state(video_image_id)
+                st.session_state.full_res_path = spool_bytes(convert_to_downloadable(Image.fromarray(frame)))
+                limit = get_memory_governor().preview_max_side(480 if is_mobile else 700)
+                st.session_state.base_image = load_preview(st.session_state.full_res_path, limit)
+                st.session_state.project_bytes = None
+                st.session_state.canvas_key_id += 1
+                add_log("Opened video first frame")
+                st.rerun()
+            return
+
+        if not st.session_state.state['wall_assignments']:
+            st.caption("Paint the walls on the first frame, then render the walkthrough.")
+        elif st.button("Render painted walkthrough", key="video_render", use_container_width=True):
+            import tempfile
+            import threading
+            from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+            from utils.job_scheduler import JobCancelled
+            from utils.video_pipeline import render_video, read_frames, video_info
+            fps, frame_count, _ = video_info(st.session_state.video_path)
+            fd, out_path = tempfile.mkstemp(suffix=".mp4")
+            os.close(fd)
+            state = st.session_state.state
+            progress = st.progress(0.0, text=f"🎬 Painting {frame_count} frames...")
+            ctx = get_script_run_ctx()
+            step = max(1, frame_count // 100) # Bounds progress messages on long clips
+
+            def on_frame(index, _masks):
+                # Called from the track stage, a pipeline thread when stages overlap
+                if index % step == 0 and frame_count:
+                    if get_script_run_ctx() is None:
+                        add_script_run_ctx(threading.current_thread(), ctx)
+                    progress.progress(min(1.0, (index + 1) / frame_count),
+                                      text=f"🎬 Painting frame {index + 1} of {frame_count}...")
+
+            def render(ticket):
+                stats = render_video(read_frames(st.session_state.video_path), state['masks'], state['wall_assignments'],
+                                     out_path, fps, on_frame=on_frame, cancel_event=ticket.cancel_event,
+                                     mask_logits=state.get('object_prompts'), mask_polygons=state.get('mask_polygons'))
+                if ticket.cancel_event.is_set():
+                    raise JobCancelled("walkthrough render cancelled") # Don't keep a truncated clip
+                return stats
+
+            try:
+                stats = run_scheduled("video", render, "Walkthrough render", with_ticket=True)
+                progress.empty()
+                with open(out_path, "rb") as f:
+                    st.session_state.walkthrough = {'bytes': f.read(), 'stats': stats}
+                add_log(f"Walkthrough: {stats['frames']} frames at {stats['fps']:.1f} fps")
+            finally:
+                os.remove(out_path)
+
+        walkthrough = st.session_state.get('walkthrough')
+        if walkthrough:
+            stats = walkthrough['stats']
+            st.video(walkthrough['bytes'])
+            st.caption(f"{stats['frames']} frames in {stats['seconds']:.1f}s ({stats['fps']:.1f} fps)")
+            st.download_button("⬇️ Download video", walkthrough['bytes'], file_name="painted_walkthrough.mp4",
+                               mime="video/mp4", key="video_download")
+
+# Project save/open and video renders read this session's arrays: hold it meanwhile
+with st.sidebar, session_run():
     st.markdown("---")
     tool_mode, compare_mode, seg_mode, lasso_op = sidebar_controller_fragment()
+    project_sidebar()
+    video_sidebar()
 
 try:
     if uploaded_file:
         # 1. FAST IMAGE LOAD (Ghost Mode)
         current_file_id = f"{uploaded_file.name}_{uploaded_file.size}"
-        if st.session_state.state.get('image_id') != current_file_id:
-            import gc, io
+        # Tracked separately from image_id: opening a project must not be undone by the upload widget
+        if st.session_state.get('upload_id') != current_file_id:
+            from utils.image_utils import load_preview
+            from utils.upload_spool import spool_upload
+            st.session_state.upload_id = current_file_id
+            st.session_state.project_bytes = None
             # Reset state on new file
-            st.session_state.state = {
-                'masks': [],
-                'wall_assignments': {},
-                'history': [],
-                'image_id': current_file_id,
-                'lighting_maps': None,
-                'cached_paint_cv2': None,
-                'cached_assignments_hash': "",
-                'debug_logs': [],
-                'compare_mode': False,
-                'selected_object_index': -1,
-                'ai_ready': False
-            }
+            st.session_state.state = new_image_state(current_file_id)
             st.session_state.canvas_key_id += 1
             
-            # Use Ghost Load: Open, Resize, then CLOSE and clear
-            image_raw = Image.open(uploaded_file).convert("RGB")
-            
-            # Store as BYTES to save massive RAM
-            img_byte_arr = io.BytesIO()
-            image_raw.save(img_byte_arr, format='JPEG', quality=75) # Aggressive compression for stability
-            st.session_state.full_res_bytes = img_byte_arr.getvalue()
+            # Stream the original to disk undecoded: export decodes it at full resolution
+            st.session_state.full_res_path = spool_upload(uploaded_file)
             
-            # Resize aggressively for cloud RAM limits
-            limit = 480 if is_mobile else 700
-            st.session_state.base_image = resize_image_max_side(image_raw, limit)
-            
-            # Clear large raw image immediately
-            del image_raw
-            gc.collect()
-        
+            # Preview via reduced-resolution (draft) decode, sized aggressively for cloud RAM limits
+            # (and smaller still while the server is under memory pressure)
+            from utils.memory_governor import get_memory_governor
+            limit = get_memory_governor().preview_max_side(480 if is_mobile else 700)
+            st.session_state.base_image = load_preview(st.session_state.full_res_path, limit)
+
+    # Opened projects and video first frames stay on screen without an upload
+    image_id = str(st.session_state.state.get('image_id') or "")
+    if 'base_image' in st.session_state and (uploaded_file or image_id.startswith(("project_", "video_"))):
         # 2. RENDER DASHBOARD
         render_dashboard(tool_mode, compare_mode=st.session_state.state['compare_mode'], seg_mode=seg_mode, lasso_op=lasso_op)
 
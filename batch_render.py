@@ -0,0 +1,238 @@
+"""
+Headless batch renderer: paints the same room in every color of a collection.
+
+    python batch_render.py --project room.vizproj --brand "DreamCo Paints" \
+        --collection "Modern Minimalist" --out renders/
+
+    python batch_render.py --project room.vizproj --image original.jpg \
+        --colors "#F5F5F0:matte,#36454F:silk" --masks 0,2 --workers 4
+
+Masks come from a project file saved in the app (💾 Project). Target masks
+(--masks, default: every painted object) get each variant color; the other
+painted objects keep their saved colors and their place in the paint order. Lighting maps, full-resolution masks
+and the untouched background are computed once and shared by all variants.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Shared, read-only render inputs of a worker process (set once by _init_worker)
+_job = None
+
+
+def load_palette_colors(brand=None, collection=None, finish=None):
+    """Colors of brands/palettes.json (via the indexed catalog), optionally filtered."""
+    from brands.catalog import get_catalog
+    catalog = get_catalog()
+    return [catalog.record(i) for i in np.flatnonzero(catalog.select(brand, collection, finish))]
+
+
+def parse_color_list(spec):
+    """'#hex[:finish],...' -> color dicts (finish defaults to matte)."""
+    colors = []
+    for item in spec.split(","):
+        hex_code, _, finish = item.strip().partition(":")
+        colors.append({'id': hex_code.lstrip('#'), 'name': hex_code, 'hex': hex_code,
+                       'finish_available': [finish or "matte"]})
+    return colors
+
+
+def build_variants(colors, finishes=None):
+    """One variant per (color, finish); finishes limits the finishes each color offers."""
+    variants = []
+    for color in colors:
+        available = [f.lower() for f in color.get('finish_available', ["matte"])]
+        for finish in available:
+            if finishes and finish not in finishes:
+                continue
+            variants.append({
+                'name': f"{color['id']}_{finish}",
+                'hex': color['hex'],
+                'finish': finish,
+                'reflectance': color.get('reflectance', 0.5),
+                'color_name': color.get('name', color['hex']),
+            })
+    return variants
+
+
+def prepare_job(image, project_state, target_indices=None):
+    """
+    Everything variants share, computed once: full-res lighting maps, and the
+    layers from the first target on, cropped to the targets' union bounding box.
+    Layers keep the project's paint order (wall_assignments order; targets without
+    a saved color go last), so a saved object painted over a target still covers
+    it. Objects painted before the first target are baked into the background.
+    """
+    from paint_ai.paint_engine import apply_realistic_paint
+    from utils.lighting_utils import extract_lighting_maps
+    from utils.render_utils import upscale_mask
+
+    full = np.array(image.convert("RGB"))
+    h_full, w_full = full.shape[:2]
+    lighting = extract_lighting_maps(full)
+
+    masks = project_state['masks']
+    assignments = project_state['wall_assignments']
+    if target_indices is None:
+        target_indices = sorted(assignments.keys()) or list(range(len(masks)))
+
+    # 1. UPSCALE EVERY MASK ONCE, IN PAINT ORDER
+    order = list(assignments.keys()) + [i for i in target_indices if i not in assignments]
+    full_masks = {}
+    for idx in order:
+        if idx < len(masks) and idx not in full_masks:
+            full_masks[idx] = upscale_mask(
+                masks[idx], (w_full, h_full),
+                obj_state=project_state.get('object_prompts', {}).get(idx),
+                polygons=project_state.get('mask_polygons', {}).get(idx),
+            )
+    order = [idx for idx in full_masks if idx in target_indices or full_masks[idx].any()]
+
+    # 2. CROP TO THE TARGETS' UNION BOX: variants only change these pixels
+    targets = [full_masks[i] for i in order if i in target_indices and full_masks[i].any()]
+    if not targets:
+        raise ValueError("None of the target masks cover any pixels")
+    x, y, w, h = cv2.boundingRect(np.logical_or.reduce(targets).astype(np.uint8))
+    crop = (slice(y, y + h), slice(x, x + w))
+    first = next(n for n, idx in enumerate(order) if idx in target_indices and full_masks[idx].any())
+
+    def paint_saved(image, idx):
+        data = assignments[idx]
+        return apply_realistic_paint(image, full_masks[idx], data['lab'], finish=data['finish'].lower(),
+                                     reflectance=data.get('reflectance', 0.5), lighting_maps=lighting)
+
+    # 3. BACKGROUND: objects below the first target are painted once, not per variant
+    base = full
+    for idx in order[:first]:
+        base = paint_saved(base, idx)
+    # Outside the crop, saved objects above the targets look the same in every variant
+    background = base
+    for idx in order[first:]:
+        if idx not in target_indices:
+            background = paint_saved(background, idx)
+
+    # 4. PER-VARIANT LAYERS: targets get the variant color, others their saved one
+    crop_layers = []
+    for idx in order[first:]:
+        mask = np.ascontiguousarray(full_masks[idx][crop])
+        if idx in target_indices:
+            crop_layers.append({'mask': mask, 'saved': None})
+        elif mask.any():
+            data = assignments[idx]
+            crop_layers.append({'mask': mask, 'saved': {'lab': data['lab'], 'finish': data['finish'].lower(),
+                                                        'reflectance': data.get('reflectance', 0.5)}})
+    return {
+        'background': background,
+        'crop': crop,
+        'crop_background': np.ascontiguousarray(base[crop]),
+        'crop_lighting': {k: np.ascontiguousarray(v[crop]) for k, v in lighting.items()},
+        'crop_layers': crop_layers,
+    }
+
+
+def render_variant(job, variant):
+    """Paints one variant over the shared background; returns the full-res RGB image."""
+    from paint_ai.paint_engine import hex_to_lab
+    from paint_ai.paint_kernel import get_paint_function
+    paint = get_paint_function()
+    lab = hex_to_lab(variant['hex'])
+    painted = job['crop_background'].copy() # Shared by every variant: paint a private copy in place
+    for layer in job['crop_layers']:
+        saved = layer['saved'] or {'lab': lab, 'finish': variant['finish'], 'reflectance': variant['reflectance']}
+        painted = paint(painted, layer['mask'], saved['lab'], finish=saved['finish'],
+                        reflectance=saved['reflectance'],
+                        lighting_maps=job['crop_lighting'], inplace=True)
+    result = job['background'].copy()
+    result[job['crop']] = painted
+    return result
+
+
+def _init_worker(job):
+    global _job
+    _job = job
+    cv2.setNumThreads(1) # Parallelism comes from the pool
+
+
+def _render_to_disk(variant, out_dir, fmt, quality):
+    start = time.perf_counter()
+    image = render_variant(_job, variant)
+    path = os.path.join(out_dir, f"{variant['name']}.{fmt}")
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if fmt == "jpg" else [cv2.IMWRITE_PNG_COMPRESSION, 3]
+    cv2.imwrite(path, cv2.cvtColor(image, cv2.COLOR_RGB2BGR), params)
+    return path, time.perf_counter() - start
+
+
+def run_batch(job, variants, out_dir, workers=None, fmt="jpg", quality=92, log=print):
+    """
+    Renders all variants across a process pool, writing each file as soon as it
+    is done. Returns the manifest (one entry per written file).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    manifest = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(job,)) as pool:
+        futures = {pool.submit(_render_to_disk, v, out_dir, fmt, quality): v for v in variants}
+        for done, future in enumerate(as_completed(futures), 1):
+            variant = futures[future]
+            path, seconds = future.result()
+            manifest.append(dict(variant, path=path, seconds=round(seconds, 3)))
+            elapsed = time.perf_counter() - start
+            log(f"[{done}/{len(variants)}] {os.path.basename(path)} {seconds:.2f}s | "
+                f"{done / elapsed:.2f} variants/s, ETA {(len(variants) - done) * elapsed / done:.0f}s")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a room in many paint colors without the UI.")
+    parser.add_argument("--project", required=True, help="Project file saved from the app (.vizproj)")
+    parser.add_argument("--image", help="Full-resolution image to render (default: the project's image)")
+    parser.add_argument("--brand", help="Brand name in brands/palettes.json")
+    parser.add_argument("--collection", help="Collection name in brands/palettes.json")
+    parser.add_argument("--colors", help="Explicit colors: '#hex[:finish],...' (overrides the palette)")
+    parser.add_argument("--finishes", help="Only these finishes, e.g. 'matte,silk'")
+    parser.add_argument("--masks", help="Mask indices to recolor (default: every painted object)")
+    parser.add_argument("--out", default="renders", help="Output directory")
+    parser.add_argument("--format", choices=["jpg", "png"], default="jpg")
+    parser.add_argument("--quality", type=int, default=92, help="JPEG quality")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    from utils.project_io import load_project
+
+    with open(args.project, "rb") as f:
+        project = load_project(f.read())
+    image = Image.open(args.image) if args.image else Image.open(io.BytesIO(project['full_res_bytes']))
+
+    colors = parse_color_list(args.colors) if args.colors else load_palette_colors(args.brand, args.collection)
+    finishes = [f.strip().lower() for f in args.finishes.split(",")] if args.finishes else None
+    variants = build_variants(colors, finishes)
+    if not variants:
+        print("No colors match the given brand/collection/finishes.", file=sys.stderr)
+        return 1
+    targets = [int(i) for i in args.masks.split(",")] if args.masks else None
+
+    t0 = time.perf_counter()
+    job = prepare_job(image, project['state'], targets)
+    print(f"Prepared {image.size[0]}x{image.size[1]} in {time.perf_counter() - t0:.2f}s, "
+          f"rendering {len(variants)} variants")
+
+    t0 = time.perf_counter()
+    manifest = run_batch(job, variants, args.out, args.workers, args.format, args.quality)
+    elapsed = time.perf_counter() - t0
+    with open(os.path.join(args.out, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Done: {len(manifest)} renders in {elapsed:.1f}s ({len(manifest) / elapsed:.2f} variants/s) -> {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from utils.color_utils import hex_to_rgb, rgb_to_cielab, rgb_to_lab8, cielab_to_din99o, delta_e_2000
+
+PALETTES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "palettes.json")
+FINISHES = ("matte", "silk", "gloss")
+
+
+class PaletteCatalog:
+    """
+    Columnar view of a palettes.json catalog: one row per color, numpy arrays per field.
+    lab is true CIELAB computed from hex (what the engine actually paints);
+    lab8 is the OpenCV 8-bit LAB the paint engine takes.
+    Nearest-color queries pre-select candidates with a KD-tree in DIN99o space
+    (Euclidean distance there tracks CIEDE2000) and rank them by exact CIEDE2000.
+    """
+    def __init__(self, palettes):
+        rows = []
+        self.brands = []
+        self.collections = [] # (brand index, collection name)
+        for b in palettes['brands']:
+            self.brands.append(b['name'])
+            for c in b['collections']:
+                self.collections.append((len(self.brands) - 1, c['name']))
+                for color in c['colors']:
+                    rows.append((color, len(self.brands) - 1, len(self.collections) - 1))
+
+        self.ids = np.array([r[0]['id'] for r in rows], dtype=object)
+        self.names = np.array([r[0]['name'] for r in rows], dtype=object)
+        self.hexes = np.array([r[0]['hex'].upper() for r in rows], dtype=object)
+        self.brand_idx = np.array([r[1] for r in rows], dtype=np.int32)
+        self.collection_idx = np.array([r[2] for r in rows], dtype=np.int32)
+        self.reflectance = np.array([r[0].get('reflectance', 0.5) for r in rows], dtype=np.float32)
+        self.finish_available = np.array(
+            [[f in [x.lower() for x in r[0].get('finish_available', FINISHES)] for f in FINISHES] for r in rows],
+            dtype=bool
+        ).reshape(-1, len(FINISHES))
+
+        self.rgb = hex_to_rgb(self.hexes.tolist()) if rows else np.zeros((0, 3), np.uint8)
+        self.lab = rgb_to_cielab(self.rgb)
+        self.lab8 = rgb_to_lab8(self.rgb)
+        self._tree = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def tree(self):
+        """scipy cKDTree over DIN99o coordinates, built on first use (None if scipy is missing)."""
+        if self._tree is None and len(self):
+            try:
+                from scipy.spatial import cKDTree
+            except ImportError:
+                return None
+            self._tree = cKDTree(cielab_to_din99o(self.lab))
+        return self._tree
+
+    def select(self, brand=None, collection=None, finish=None):
+        """Boolean row mask for the given filters (names, case-sensitive; finish any case)."""
+        keep = np.ones(len(self), dtype=bool)
+        if brand is not None:
+            keep &= self.brand_idx == (self.brands.index(brand) if brand in self.brands else -1)
+        if collection is not None:
+            ids = [i for i, (_, name) in enumerate(self.collections) if name == collection]
+            keep &= np.isin(self.collection_idx, ids)
+        if finish is not None:
+            finish = finish.lower()
+            keep &= self.finish_available[:, FINISHES.index(finish)] if finish in FINISHES else False
+        return keep
+
+    def record(self, i, delta_e=None):
+        """Row i as a dict in the app's color format (plus brand/collection/delta_e)."""
+        brand_i, collection_name = self.collections[self.collection_idx[i]]
+        out = {
+            'id': self.ids[i], 'name': self.names[i], 'hex': self.hexes[i],
+            'lab': self.lab8[i], 'reflectance': float(self.reflectance[i]),
+            'brand': self.brands[brand_i], 'collection': collection_name,
+            'finish_available': [f for f, ok in zip(FINISHES, self.finish_available[i]) if ok],
+        }
+        if delta_e is not None:
+            out['delta_e'] = float(delta_e)
+        return out
+
+    def nearest(self, lab, k=5, brand=None, collection=None, finish=None, candidates=64):
+        """
+        k closest catalog colors to one or more true-CIELAB colors by CIEDE2000.
+        lab: (3,) or (M, 3). Returns (indices, delta_e) of shape (k,) or (M, k), best first;
+        fewer than k columns when the filters leave fewer colors.
+        """
+        lab = np.asarray(lab, dtype=np.float32)
+        single = lab.ndim == 1
+        queries = lab.reshape(-1, 3)
+        keep = self.select(brand, collection, finish)
+        pool = np.flatnonzero(keep)
+        k = min(k, len(pool))
+        if k == 0:
+            empty = np.zeros((len(queries), 0))
+            return (empty[0].astype(np.intp), empty[0]) if single else (empty.astype(np.intp), empty)
+
+        tree = self.tree
+        if tree is not None and len(pool) > candidates:
+            # DIN99o pre-selection, widened until every query has enough in-filter candidates
+            n = min(len(self), max(candidates, k * 4))
+            while True:
+                _, cand = tree.query(cielab_to_din99o(queries), k=n)
+                cand = cand.reshape(len(queries), -1)
+                in_filter = keep[cand]
+                if in_filter.sum(axis=1).min() >= min(candidates, len(pool)) or n == len(self):
+                    break
+                n = min(len(self), n * 4)
+        else:
+            cand = np.broadcast_to(pool, (len(queries), len(pool)))
+            in_filter = np.ones(cand.shape, dtype=bool)
+
+        de = delta_e_2000(queries[:, None, :], self.lab[cand])
+        de = np.where(in_filter, de, np.inf)
+        order = np.argsort(de, axis=1)[:, :k]
+        idx = np.take_along_axis(cand, order, axis=1)
+        dist = np.take_along_axis(de, order, axis=1)
+        return (idx[0], dist[0]) if single else (idx, dist)
+
+    def closest(self, lab, k=5, **filters):
+        """nearest() for one color, as records (dicts with delta_e)."""
+        idx, dist = self.nearest(lab, k=k, **filters)
+        return [self.record(i, d) for i, d in zip(idx, dist)]
+
+
+def load_catalog(path=PALETTES_PATH):
+    with open(path) as f:
+        return PaletteCatalog(json.load(f))
+
+
+@lru_cache(maxsize=None)
+def get_catalog(path=PALETTES_PATH):
+    """The catalog for a palettes file, loaded once per process."""
+    return load_catalog(path)
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+class MaskCandidateCache:
+    """
+    LRU cache of decoded SAM candidates per click location.
+    Key: (image embedding id, quantized click position, segmentation mode).
+    Masks are stored bit-packed (1 bit/pixel), so a 700px preview costs ~60KB
+    per mask instead of ~500KB; depth cycling and repeat clicks skip the decoder
+    and smooth_mask entirely. The low-res logits (float16, ~128KB per candidate)
+    are kept too, so objects picked from a hit still get logit refinement and
+    logit-based export upscaling.
+    """
+    def __init__(self, max_entries=64, quantum=8):
+        self.max_entries = max_entries
+        self.quantum = quantum # Clicks within the same quantum x quantum cell share candidates
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, embedding_id, x, y, seg_mode):
+        return (embedding_id, int(x) // self.quantum, int(y) // self.quantum, seg_mode)
+
+    @staticmethod
+    def _pack(masks):
+        masks = np.asarray(masks, dtype=bool)
+        return np.packbits(masks.reshape(len(masks), -1), axis=1), masks.shape
+
+    @staticmethod
+    def _unpack(packed, shape):
+        n = int(np.prod(shape[1:]))
+        return np.unpackbits(packed, axis=1, count=n).astype(bool).reshape(shape)
+
+    def get(self, key):
+        """Returns {'masks', 'scores', 'smoothed', 'logits'} for a key, or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return {
+            'masks': self._unpack(*entry['masks']),
+            'scores': entry['scores'],
+            'smoothed': self._unpack(*entry['smoothed']),
+            'logits': entry['logits'],
+        }
+
+    def put(self, key, masks, scores, smoothed, logits=None):
+        self._entries[key] = {
+            'masks': self._pack(masks),
+            'scores': np.asarray(scores, dtype=np.float32),
+            'smoothed': self._pack(smoothed),
+            'logits': None if logits is None else np.asarray(logits, dtype=np.float16),
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def nbytes(self):
+        return sum(e['masks'][0].nbytes + e['smoothed'][0].nbytes + e['scores'].nbytes
+                   + (0 if e['logits'] is None else e['logits'].nbytes)
+                   for e in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,104 @@
+import importlib.util
+import os
+
+from utils.memory_utils import available_memory
+from utils.model_utils import MODEL_ARTIFACTS, get_model_path, verify_artifact
+
+# Model tiers in order of preference. "interactive" serves clicks/boxes on the
+# preview (latency matters), "export" re-decodes clicked objects on the
+# full-resolution original at export time (quality matters). Override per
+# deployment, e.g. VISUALIZER_EXPORT_MODELS=vit_l,vit_b (empty disables it)
+MODEL_TIERS = {
+    "interactive": os.environ.get("VISUALIZER_INTERACTIVE_MODELS", "vit_t,vit_b").split(","),
+    "export": os.environ.get("VISUALIZER_EXPORT_MODELS", "vit_h,vit_l,vit_b").split(","),
+}
+
+# Keep this much free after loading a model (embeddings, renders, other sessions)
+MEMORY_HEADROOM_MB = int(os.environ.get("VISUALIZER_MODEL_HEADROOM_MB", "512"))
+
+# Model types loaded in this process (their memory is already paid for)
+_loaded_types = set()
+
+
+def is_model_available(model_type):
+    """True if the model's package is installed and its checkpoint is on disk."""
+    artifact = MODEL_ARTIFACTS.get(model_type)
+    if artifact is None:
+        return False
+    if importlib.util.find_spec(artifact.get("package", "segment_anything")) is None:
+        return False
+    return verify_artifact(get_model_path(model_type), artifact["sha256"])
+
+
+def fits_in_memory(model_type, free_bytes=None):
+    """True if loading the model leaves MEMORY_HEADROOM_MB free (or memory is unknown)."""
+    if model_type in _loaded_types:
+        return True
+    if free_bytes is None:
+        free_bytes = available_memory()
+    if free_bytes is None:
+        return True
+    needed = (MODEL_ARTIFACTS[model_type]["memory_mb"] + MEMORY_HEADROOM_MB) * 1024 * 1024
+    return free_bytes >= needed
+
+
+def select_model_type(request="interactive"):
+    """
+    Picks the model type for a request (a MODEL_TIERS key).
+    Walks the tier's preference list and returns the first model that is
+    installed, on disk and fits in memory. Falls back to the smallest
+    available model of the tier, then to None.
+    """
+    tier = [m.strip() for m in MODEL_TIERS.get(request, MODEL_TIERS["interactive"]) if m.strip()]
+    available = [m for m in tier if is_model_available(m)]
+    if not available:
+        return None
+
+    free_bytes = available_memory()
+    for model_type in available:
+        if fits_in_memory(model_type, free_bytes):
+            return model_type
+    return min(available, key=lambda m: MODEL_ARTIFACTS[m]["memory_mb"])
+
+
+def select_export_model(interactive_type=None):
+    """
+    Model type for export-time refinement, or None to export the interactive masks as is.
+    Only an export-tier model larger than the interactive one qualifies (the same model
+    would just repeat the preview), and only if it fits in memory: unlike
+    select_model_type there is no fallback, an export never overcommits memory.
+    """
+    model_type = select_model_type("export")
+    if model_type is None or not fits_in_memory(model_type):
+        return None
+    if MODEL_ARTIFACTS[model_type]["memory_mb"] <= MODEL_ARTIFACTS.get(interactive_type, {}).get("memory_mb", 0):
+        return None
+    return model_type
+
+
+def load_predictor(model_type):
+    """A fresh SamPredictor on the (shared, cached) model, or None if it can't be loaded."""
+    from paint_ai.sam_loader import load_sam_model, get_predictor
+
+    sam = load_sam_model(model_type)
+    if sam is None:
+        return None
+    _loaded_types.add(model_type)
+    predictor = get_predictor(sam)
+    predictor.model_type = model_type # Saved embeddings only restore onto the same model
+    return predictor
+
+
+def get_tiered_predictor(request="interactive"):
+    """
+    Returns (predictor, model_type) for a request, or (None, None) if no model is available.
+    Every tier returns a segment_anything SamPredictor, so callers don't care which model answered.
+    """
+    model_type = select_model_type(request)
+    if model_type is None:
+        return None, None
+
+    predictor = load_predictor(model_type)
+    if predictor is None:
+        return None, None
+    return predictor, model_type
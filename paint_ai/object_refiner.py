@@ -0,0 +1,113 @@
+import cv2
+import numpy as np
+
+# Per-object prompt state kept in the session:
+# {'points': [[x, y], ...], 'labels': [1/0, ...],
+#  'logits': (256, 256) float16 low-res logits of the current mask, or None,
+#  'frame': (input_h, input_w, grid_scale) mapping the logit grid onto the image}
+
+# Export refinement keeps the larger model's mask only if it overlaps the preview this much
+EXPORT_MIN_IOU = 0.8
+
+
+def _logit_frame(predictor):
+    """Resized-input size and logit-grid scale (256 / encoder input size) of the predictor."""
+    ih, iw = predictor.input_size
+    return (int(ih), int(iw), 256 / predictor.model.image_encoder.img_size)
+
+
+def new_object_state(predictor, x, y, logits=None):
+    """Prompt state for an object created from a single positive click."""
+    return {
+        'points': [[int(x), int(y)]],
+        'labels': [1],
+        'logits': None if logits is None else np.asarray(logits, dtype=np.float16),
+        'frame': _logit_frame(predictor),
+    }
+
+
+def refine_object(predictor, obj_state, x, y, positive=True):
+    """
+    Adds a positive (include) or negative (exclude) point to an object and re-decodes it.
+    The previous low-res logits are fed back as mask_input, so SAM refines the
+    existing mask instead of starting over; a single-mask decode is enough.
+    Updates obj_state in place and returns the new boolean mask (image resolution).
+    """
+    import torch
+    obj_state['points'].append([int(x), int(y)])
+    obj_state['labels'].append(1 if positive else 0)
+
+    mask_input = None
+    if obj_state.get('logits') is not None:
+        mask_input = obj_state['logits'].astype(np.float32)[None, :, :]
+
+    with torch.inference_mode():
+        masks, _, logits = predictor.predict(
+            point_coords=np.array(obj_state['points']),
+            point_labels=np.array(obj_state['labels']),
+            mask_input=mask_input,
+            multimask_output=False,
+        )
+    obj_state['logits'] = logits[0].astype(np.float16)
+    obj_state['frame'] = _logit_frame(predictor)
+    return masks[0]
+
+
+def refine_for_export(predictor, image_np, masks, object_prompts, mask_indices, min_iou=EXPORT_MIN_IOU):
+    """
+    Re-decodes clicked objects with a larger model (the "export" tier) on the
+    full-resolution image, so their export edges come from the better decoder.
+    Click points are scaled from preview to image coordinates and the preview
+    logits seed the decode, as in refine_object. The candidate that best overlaps
+    the preview mask is kept only if its IoU reaches min_iou: the export must show
+    the object the user picked. Returns a new {mask_idx: state} dict; the session's
+    states are untouched (their logits stay on the interactive model's grid).
+    """
+    import torch
+    from paint_ai.sam_loader import embed_image
+    refined = dict(object_prompts)
+    embedded = False
+    for m_idx in mask_indices:
+        obj_state = object_prompts.get(m_idx)
+        if obj_state is None or not obj_state.get('points') or m_idx >= len(masks):
+            continue
+        preview = np.asarray(masks[m_idx], dtype=bool)
+        if not embedded:
+            embed_image(predictor, image_np)
+            embedded = True
+        mask_input = None
+        if obj_state.get('logits') is not None:
+            mask_input = obj_state['logits'].astype(np.float32)[None, :, :]
+        with torch.inference_mode():
+            candidates, _, logits = predictor.predict(
+                point_coords=np.array(obj_state['points'], dtype=np.float64) * (image_np.shape[1] / preview.shape[1]),
+                point_labels=np.array(obj_state['labels']),
+                mask_input=mask_input,
+                multimask_output=True,
+            )
+        ious = []
+        for candidate in candidates:
+            small = cv2.resize(candidate.astype(np.uint8) * 255, (preview.shape[1], preview.shape[0]),
+                               interpolation=cv2.INTER_AREA) > 127
+            ious.append(np.logical_and(small, preview).sum() / max(1, np.logical_or(small, preview).sum()))
+        best = int(np.argmax(ious))
+        if ious[best] >= min_iou:
+            refined[m_idx] = {**obj_state, 'logits': logits[best].astype(np.float16), 'frame': _logit_frame(predictor)}
+    return refined
+
+
+def logits_to_mask(obj_state, size, threshold=0.0):
+    """
+    Upsamples an object's low-res logits straight to size=(width, height).
+    Bilinear on logits gives smooth, resolution-independent edges, unlike
+    nearest-neighbour upscaling of the binary preview mask. The result is raw SAM
+    output: render_utils.upscale_mask adds the preview's smooth_mask cleanup.
+    """
+    ih, iw, grid_scale = obj_state['frame']
+    width, height = size
+    # Pixel-centre aligned affine from the (padded) logit grid to the output image
+    sx = width / (iw * grid_scale)
+    sy = height / (ih * grid_scale)
+    M = np.array([[sx, 0, 0.5 * sx - 0.5], [0, sy, 0.5 * sy - 0.5]], dtype=np.float64)
+    full = cv2.warpAffine(obj_state['logits'].astype(np.float32), M, (width, height), flags=cv2.INTER_LINEAR)
+    return full > threshold
@@ -1,15 +1,8 @@
 import cv2
 import numpy as np
+from collections import OrderedDict
 from utils.lighting_utils import extract_lighting_maps
-
-def hex_to_lab(hex_color):
-    """Converts hex string to LAB numpy array."""
-    hex_color = hex_color.lstrip('#')
-    r = int(hex_color[0:2], 16)
-    g = int(hex_color[2:4], 16)
-    b = int(hex_color[4:6], 16)
-    rgb_pixel = np.array([[[r, g, b]]], dtype=np.uint8)
-    return cv2.cvtColor(rgb_pixel, cv2.COLOR_RGB2LAB)[0][0]
+from utils.color_utils import hex_to_lab # Re-exported: callers import it from the engine
 
 def apply_realistic_paint(final_image_rgb, mask, target_lab, finish="matte", reflectance=0.5, lighting_maps=None):
     """
@@ -140,3 +133,115 @@ def apply_realistic_paint(final_image_rgb, mask, target_lab, finish="matte", ref
     output[slice_y, slice_x] = blended.astype(np.uint8)
     
     return output
+
+
+class PaintBasis:
+    """
+    Precomputed per-layer coefficients of apply_realistic_paint for one mask, finish
+    and reflectance. Over the layer's bounding box the engine is affine in the target
+    color, so a color change only costs
+        L = (t_l * gain) * desat + texture,  a/b = (t - 128) * desat + 128
+    plus LAB->RGB and the alpha blend. Output is identical to apply_realistic_paint.
+    """
+    def __init__(self, mask, lighting_maps, finish="matte", reflectance=0.5):
+        self.empty = not np.any(mask)
+        if self.empty:
+            return
+        x, y, w, h = cv2.boundingRect(mask.astype(np.uint8))
+        self.slices = (slice(y, y+h), slice(x, x+w))
+
+        orig_l_norm = lighting_maps["l_norm"][self.slices]
+        shadow_map = lighting_maps["shadow_strength"][self.slices]
+        texture_detail = lighting_maps["texture_detail"][self.slices]
+
+        # Same expressions (and float32 rounding) as apply_realistic_paint
+        if finish == "gloss":
+            self.gain = np.power(orig_l_norm, 1.2)
+        else:
+            opacity = 0.85 if finish == "matte" else 0.75
+            self.gain = (orig_l_norm * (1.0 - opacity) + 0.5 * opacity) * 2.0 # x2 is exact
+        self.desat = 1.0 - (shadow_map * 0.4)
+        self.texture = texture_detail * reflectance * 1.5
+
+        from utils.mask_utils import feather_mask
+        alpha = feather_mask(mask[self.slices], blur_radius=1)
+        # Fully covered pixels just take the paint; only the soft edge needs a float blend
+        self.solid = alpha == 1.0
+        self.edge = np.nonzero((alpha > 0) & ~self.solid)
+        edge_alpha = alpha[self.edge][:, None]
+        self.edge_alpha = edge_alpha
+        self.edge_inv_alpha = 1.0 - edge_alpha
+
+        self._last_lab = None
+        self._last_painted = None
+
+    def paint(self, target_lab):
+        """Painted RGB (uint8) of the layer's bounding box for a target LAB color."""
+        t_l, t_a, t_b = (np.float32(v) for v in target_lab)
+        key = (float(t_l), float(t_a), float(t_b))
+        if key == self._last_lab:
+            return self._last_painted
+
+        lab = np.empty(self.gain.shape + (3,), dtype=np.uint8)
+        l = np.multiply(self.gain, t_l)
+        np.multiply(l, self.desat, out=l)
+        np.add(l, self.texture, out=l)
+        np.clip(l, 0, 255, out=l)
+        lab[..., 0] = l
+        lab[..., 1] = (t_a - 128) * self.desat + 128
+        lab[..., 2] = (t_b - 128) * self.desat + 128
+        painted = cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
+
+        self._last_lab, self._last_painted = key, painted # Unchanged layers re-composite for free
+        return painted
+
+    def apply(self, final_image_rgb, target_lab):
+        """Drop-in for apply_realistic_paint(final_image_rgb, mask, target_lab, ...)."""
+        if self.empty:
+            return final_image_rgb
+        output = final_image_rgb.copy()
+        roi = output[self.slices]
+        painted = self.paint(target_lab)
+        edge_blend = self.edge_inv_alpha * roi[self.edge].astype(np.float32) + self.edge_alpha * painted[self.edge].astype(np.float32)
+        np.copyto(roi, painted, where=self.solid[..., None])
+        roi[self.edge] = edge_blend.astype(np.uint8)
+        return output
+
+    def nbytes(self):
+        if self.empty:
+            return 0
+        arrays = (self.gain, self.desat, self.texture, self.solid, self.edge_alpha, self.edge_inv_alpha,
+                  *self.edge, self._last_painted)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+
+class PaintBasisCache:
+    """
+    PaintBasis per painted layer, keyed by (layer key, finish, reflectance).
+    The layer key must change whenever the mask or lighting does (e.g. image id +
+    mask index + mask version); stale entries age out of the LRU.
+    """
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, layer_key, mask_fn, lighting_maps, finish, reflectance):
+        """Cached basis; mask_fn() is only called (e.g. smooth_mask) when it must be built."""
+        key = (layer_key, finish, reflectance)
+        basis = self._entries.get(key)
+        if basis is None:
+            basis = PaintBasis(mask_fn(), lighting_maps, finish, reflectance)
+            self._entries[key] = basis
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        self._entries.move_to_end(key)
+        return basis
+
+    def clear(self):
+        self._entries.clear()
+
+    def nbytes(self):
+        return sum(b.nbytes() for b in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,181 @@
+"""
+Optional fused paint kernel (Numba).
+
+apply_realistic_paint makes about a dozen full-crop temporaries (fills, lighting,
+desaturation, clipped L, uint8 casts, merge, float ROI copies, blend). The kernel
+below computes paint, LAB->RGB and the alpha blend per pixel in one pass, in place
+on the output ROI, with rows spread across threads. LAB->RGB is a per-call table
+built with cv2, so results match the reference. Without Numba every entry point
+falls back to the NumPy reference in paint_engine.
+
+    python -m paint_ai.paint_kernel   # tolerance check + benchmark against the reference
+"""
+import os
+import time
+
+import numpy as np
+
+from paint_ai.paint_engine import apply_realistic_paint
+
+# VISUALIZER_PAINT_KERNEL: "auto" (Numba if installed), "numpy" (always the reference)
+KERNEL_ENV = "VISUALIZER_PAINT_KERNEL"
+FINISH_CODES = {"matte": 0, "silk": 1, "gloss": 2}
+# Tolerance against the NumPy reference, in levels per channel (float32 rounding may
+# differ from NumPy's). Also the fused engines' budget in utils/render_regression.
+MAX_ALLOWED_DIFF = 1
+
+try:
+    import numba
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+    # Kernels launch from Streamlit's script threads, concurrently across sessions: prefer
+    # OpenMP (thread-safe, exits cleanly) over TBB, which hangs interpreter shutdown after
+    # launches from non-main threads. NUMBA_THREADING_LAYER still wins when set.
+    if "NUMBA_THREADING_LAYER" not in os.environ:
+        numba.config.THREADING_LAYER_PRIORITY = ["omp", "tbb", "workqueue"]
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _paint_rows(roi, alpha, l_norm, shadow, texture, t_l, t_a, t_b, finish_code, reflectance, lut, a_min, b_min):
+        h, w = alpha.shape
+        opacity = np.float32(0.85) if finish_code == 0 else np.float32(0.75)
+        tex_scale = np.float32(reflectance) * np.float32(1.5)
+        for y in prange(h):
+            for x in range(w):
+                al = alpha[y, x]
+                if al <= 0.0:
+                    continue
+                # 1. Paint in 8-bit LAB (same float32 expressions as the reference)
+                ln = l_norm[y, x]
+                if finish_code == 2:
+                    sim_l = t_l * ln ** np.float32(1.2)
+                else:
+                    sim_l = t_l * (ln * (np.float32(1.0) - opacity) + np.float32(0.5) * opacity) * np.float32(2.0)
+                desat = np.float32(1.0) - shadow[y, x] * np.float32(0.4)
+                sim_l = sim_l * desat + texture[y, x] * tex_scale
+                sim_l = min(max(sim_l, np.float32(0.0)), np.float32(255.0))
+                L8 = np.int64(sim_l)
+                A8 = np.int64((t_a - np.float32(128.0)) * desat + np.float32(128.0))
+                B8 = np.int64((t_b - np.float32(128.0)) * desat + np.float32(128.0))
+
+                # 2. LAB -> RGB via the per-call table, 3. blend in place
+                for c in range(3):
+                    painted = np.float32(lut[L8, A8 - a_min, B8 - b_min, c])
+                    v = (np.float32(1.0) - al) * np.float32(roi[y, x, c]) + al * painted
+                    roi[y, x, c] = np.uint8(v)
+
+
+def _lab_to_rgb_table(t_a, t_b):
+    """
+    cv2 LAB->RGB for every (L, a, b) the kernel can produce for this color: the shadow
+    desaturation (factor 0.6-1.0) keeps a/b within a few dozen codes of the target,
+    so one small cvtColor gives an exact table. Returns (lut, a_min, b_min).
+    """
+    import cv2
+    bounds = []
+    for t in (t_a, t_b):
+        lo = int(np.floor(min((t - 128) * 0.6 + 128, t))) - 1
+        hi = int(np.floor(max((t - 128) * 0.6 + 128, t))) + 1
+        bounds.append((max(lo, 0), min(hi, 255)))
+    (a_min, a_max), (b_min, b_max) = bounds
+    L, A, B = np.meshgrid(np.arange(256), np.arange(a_min, a_max + 1), np.arange(b_min, b_max + 1), indexing="ij")
+    lab = np.stack([L, A, B], axis=-1).astype(np.uint8)
+    lut = cv2.cvtColor(lab.reshape(-1, 1, 3), cv2.COLOR_LAB2RGB).reshape(lab.shape)
+    return lut, a_min, b_min
+
+
+def kernel_enabled():
+    return NUMBA_AVAILABLE and os.environ.get(KERNEL_ENV, "auto").lower() != "numpy"
+
+
+def apply_realistic_paint_fused(final_image_rgb, mask, target_lab, finish="matte", reflectance=0.5, lighting_maps=None, inplace=False):
+    """
+    Same contract as apply_realistic_paint (returns a new image); uses the fused
+    kernel when available. benchmark() checks it against the reference.
+    inplace=True paints straight into final_image_rgb (a buffer the caller owns)
+    instead of copying the whole image for every layer. Always use the return
+    value: the NumPy fallback still returns a new image.
+    """
+    if not kernel_enabled() or lighting_maps is None:
+        return apply_realistic_paint(final_image_rgb, mask, target_lab, finish, reflectance, lighting_maps)
+    if not np.any(mask):
+        return final_image_rgb
+
+    import cv2
+    from utils.mask_utils import feather_mask
+    x, y, w, h = cv2.boundingRect(mask.astype(np.uint8))
+    sy, sx = slice(y, y+h), slice(x, x+w)
+    alpha = feather_mask(mask[sy, sx], blur_radius=1)
+
+    output = final_image_rgb if inplace else final_image_rgb.copy()
+    t_l, t_a, t_b = (np.float32(v) for v in target_lab)
+    lut, a_min, b_min = _lab_to_rgb_table(float(t_a), float(t_b))
+    _paint_rows(
+        output[sy, sx], alpha,
+        lighting_maps["l_norm"][sy, sx], lighting_maps["shadow_strength"][sy, sx], lighting_maps["texture_detail"][sy, sx],
+        t_l, t_a, t_b, FINISH_CODES.get(finish, 1), float(reflectance), lut, a_min, b_min, # Unknown -> silk, like the reference
+    )
+    return output
+
+
+def get_paint_function():
+    """
+    The fastest available apply_realistic_paint implementation. Always the fused
+    entry point (it falls back to the NumPy reference itself), so callers can pass inplace=True.
+    """
+    return apply_realistic_paint_fused
+
+
+def benchmark(size=(2000, 2800), repeats=5, seed=0):
+    """
+    Tolerance check and timing of the fused kernel against the NumPy reference.
+    Returns rows of {finish, max_diff, mismatch_fraction, numpy_s, fused_s}.
+    """
+    import cv2
+    from utils.lighting_utils import extract_lighting_maps
+    from utils.color_utils import hex_to_lab
+
+    rng = np.random.default_rng(seed)
+    h, w = size
+    gradient = np.linspace(60, 220, w, dtype=np.float32)[None, :, None]
+    image = np.clip(gradient + rng.normal(0, 12, (h, w, 3)), 0, 255).astype(np.uint8)
+    lighting = extract_lighting_maps(image)
+    mask = np.zeros((h, w), dtype=np.uint8)
+    cv2.ellipse(mask, (w // 2, h // 2), (w // 3, h // 3), 0, 0, 360, 1, -1)
+    mask = mask.astype(bool)
+
+    rows = []
+    apply_realistic_paint_fused(image, mask, hex_to_lab("#808080"), "matte", 0.5, lighting) # JIT compile
+    for finish in FINISH_CODES:
+        for hex_code in ("#C06C59", "#36454F", "#F5F5F0"):
+            lab = hex_to_lab(hex_code)
+            t0 = time.perf_counter()
+            for _ in range(repeats):
+                ref = apply_realistic_paint(image, mask, lab, finish, 0.4, lighting)
+            t1 = time.perf_counter()
+            for _ in range(repeats):
+                fused = apply_realistic_paint_fused(image, mask, lab, finish, 0.4, lighting)
+            t2 = time.perf_counter()
+            diff = np.abs(ref.astype(np.int16) - fused)
+            rows.append({
+                'finish': finish, 'hex': hex_code, 'max_diff': int(diff.max()),
+                'mismatch_fraction': float((diff > 0).any(axis=2).mean()),
+                'numpy_s': (t1 - t0) / repeats, 'fused_s': (t2 - t1) / repeats,
+            })
+    return rows
+
+
+if __name__ == "__main__":
+    if not kernel_enabled():
+        print("Numba not available (or disabled): nothing to compare.")
+    else:
+        rows = benchmark()
+        for r in rows:
+            print(f"{r['finish']:6s} {r['hex']}  max diff {r['max_diff']}  "
+                  f"differing px {r['mismatch_fraction'] * 100:.3f}%  "
+                  f"numpy {r['numpy_s'] * 1000:.0f} ms  fused {r['fused_s'] * 1000:.0f} ms  "
+                  f"x{r['numpy_s'] / r['fused_s']:.1f}")
+        if max(r['max_diff'] for r in rows) > MAX_ALLOWED_DIFF:
+            raise SystemExit(f"Fused kernel differs from the reference by more than {MAX_ALLOWED_DIFF} level(s)")
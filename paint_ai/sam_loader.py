@@ -1,38 +1,29 @@
 import os
-import requests
 import streamlit as st
+from utils.model_utils import MODEL_ARTIFACTS, fetch_model, get_model_path, verify_artifact
 
 # Switched to ViT-B for Speed Optimization (with high density scan)
-SAM_CHECKPOINT_URL = "https://dl.fbaipublicfiles.com/segment_anything/sam_vit_b_01ec64.pth"
-SAM_CHECKPOINT_PATH = "sam_vit_b_01ec64.pth"
 MODEL_TYPE = "vit_b"
+SAM_CHECKPOINT_URL = MODEL_ARTIFACTS[MODEL_TYPE]["url"]
+SAM_CHECKPOINT_PATH = get_model_path(MODEL_TYPE)
 
 def download_model_if_needed():
-    """Downloads the SAM checkpoint if it doesn't exist."""
-    if not os.path.exists(SAM_CHECKPOINT_PATH):
+    """Downloads (resumable, verified, atomic) the SAM checkpoint if it isn't in the model cache."""
+    if not verify_artifact(SAM_CHECKPOINT_PATH, MODEL_ARTIFACTS[MODEL_TYPE]["sha256"]):
         st.info(f"Downloading SAM model ({MODEL_TYPE})... this is ~375MB. Please wait.")
         try:
-            response = requests.get(SAM_CHECKPOINT_URL, stream=True)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            block_size = 8 * 1024 # 8KB
-            
             # Progress bar
             progress_bar = st.progress(0)
             status_text = st.empty()
-            
-            downloaded = 0
-            
-            with open(SAM_CHECKPOINT_PATH, "wb") as f:
-                for chunk in response.iter_content(chunk_size=block_size):
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    if total_size > 0:
-                        percent = downloaded / total_size
-                        progress_bar.progress(min(percent, 1.0))
-                        status_text.text(f"Downloaded {downloaded // (1024*1024)} MB / {total_size // (1024*1024)} MB")
-            
+
+            def report(downloaded, total_size):
+                if total_size > 0:
+                    percent = downloaded / total_size
+                    progress_bar.progress(min(percent, 1.0))
+                    status_text.text(f"Downloaded {downloaded // (1024*1024)} MB / {total_size // (1024*1024)} MB")
+
+            fetch_model(MODEL_TYPE, progress=report)
+
             progress_bar.empty()
             status_text.empty()
             st.success("Model downloaded successfully!")
@@ -41,21 +32,85 @@ def download_model_if_needed():
             return False
     return True
 
+# SAM's only non-persistent buffers (not in the checkpoint); see segment_anything.modeling.Sam
+SAM_PIXEL_MEAN = [123.675, 116.28, 103.53]
+SAM_PIXEL_STD = [58.395, 57.12, 57.375]
+
+def get_mmap_checkpoint_path(checkpoint_path):
+    """Path of the memory-mappable copy of a checkpoint."""
+    return os.path.splitext(checkpoint_path)[0] + ".mmap.pt"
+
+def convert_checkpoint_for_mmap(checkpoint_path):
+    """
+    One-time conversion of a SAM .pth into a plain state dict in torch's zip format,
+    which torch.load(mmap=True) can map instead of unpickling into fresh memory.
+    Written to a temp file and renamed, so a crash never leaves a half-written copy.
+    """
+    import torch
+    mmap_path = get_mmap_checkpoint_path(checkpoint_path)
+    if os.path.exists(mmap_path):
+        return mmap_path
+
+    state_dict = torch.load(checkpoint_path, map_location="cpu", weights_only=True)
+    tmp_path = f"{mmap_path}.{os.getpid()}.tmp"
+    torch.save({k: v.contiguous() for k, v in state_dict.items()}, tmp_path)
+    os.replace(tmp_path, mmap_path)
+    return mmap_path
+
+def get_model_builder(model_type):
+    """sam_model_registry entry for a model type (vit_t comes from the MobileSAM package)."""
+    import importlib
+    package = MODEL_ARTIFACTS[model_type].get("package", "segment_anything")
+    return importlib.import_module(package).sam_model_registry[model_type]
+
+def build_sam_mmap(model_type, mmap_path):
+    """
+    Builds SAM on the meta device (no weight allocation, no random init) and binds
+    the parameters directly to the memory-mapped checkpoint. The weight pages are
+    read-only file pages, so every worker on the host shares them via the page cache.
+    """
+    import torch
+
+    builder = get_model_builder(model_type)
+    state_dict = torch.load(mmap_path, map_location="cpu", mmap=True, weights_only=True)
+    try:
+        with torch.device("meta"):
+            sam = builder(checkpoint=None)
+    except Exception:
+        # Older torch without device context managers: plain build, still mapped below
+        sam = builder(checkpoint=None)
+
+    sam.load_state_dict(state_dict, assign=True)
+    sam.register_buffer("pixel_mean", torch.tensor(SAM_PIXEL_MEAN).view(-1, 1, 1), False)
+    sam.register_buffer("pixel_std", torch.tensor(SAM_PIXEL_STD).view(-1, 1, 1), False)
+
+    if any(t.is_meta for t in list(sam.parameters()) + list(sam.buffers())):
+        raise RuntimeError("Checkpoint did not cover every tensor of the model")
+    return sam
+
 @st.cache_resource
-def load_sam_model():
-    """Loads the SAM model and returns it. Cached by Streamlit."""
+def load_sam_model(model_type=MODEL_TYPE):
+    """Loads the SAM model and returns it. Cached by Streamlit (one instance per model type)."""
     import torch
-    from segment_anything import sam_model_registry
-    if not os.path.exists(SAM_CHECKPOINT_PATH):
-        # We don't want to auto-download inside a cached function if it's large
+    # GLOBAL RAM TUNING (moved here from app.py so torch only loads in AI modes)
+    torch.set_grad_enabled(False)
+    checkpoint_path = get_model_path(model_type)
+    if not verify_artifact(checkpoint_path, MODEL_ARTIFACTS[model_type]["sha256"]):
+        # Missing or truncated. We don't want to auto-download inside a cached function if it's large
         return None
     
     device = "cuda" if torch.cuda.is_available() else "cpu"
     
     try:
-        import torch
+        # FAST PATH: memory-mapped weights (converted once, shared across workers)
+        try:
+            sam = build_sam_mmap(model_type, convert_checkpoint_for_mmap(checkpoint_path))
+        except Exception:
+            # torch < 2.1 (no mmap/assign), unwritable model dir or non-persistent
+            # buffers (MobileSAM's TinyViT): classic load
+            sam = get_model_builder(model_type)(checkpoint=checkpoint_path)
+
         with torch.inference_mode():
-            sam = sam_model_registry[MODEL_TYPE](checkpoint=SAM_CHECKPOINT_PATH)
             # On CPU, we stay in float32 for compatibility, but we can limit threads
             if device == "cpu":
                 torch.set_num_threads(1) 
@@ -83,6 +138,73 @@ def get_predictor(sam):
     from segment_anything import SamPredictor
     return SamPredictor(sam)
 
+def embed_image(predictor, image_np):
+    """
+    Computes the image embedding unless the predictor already holds it for this image.
+    Returns the embedding id (content hash), usable as a cache key for decoded masks.
+    """
+    embedding_id = image_embedding_id(image_np)
+    if predictor.is_image_set and getattr(predictor, 'embedding_id', None) == embedding_id:
+        return embedding_id
+    predictor.set_image(image_np)
+    predictor.embedding_id = embedding_id
+    return embedding_id
+
+def image_embedding_id(image_np):
+    """Content hash of an image, as recorded by embed_image."""
+    import hashlib
+    import numpy as np
+    image_np = np.ascontiguousarray(image_np)
+    return hashlib.blake2b(image_np.tobytes(), digest_size=16).hexdigest() + f"_{image_np.shape[1]}x{image_np.shape[0]}"
+
+def snapshot_predictor(predictor):
+    """
+    Private copy of an embedded predictor for another thread: it shares the model
+    weights but owns a copy of the image features, so the owner can set_image /
+    reset_image while the copy keeps decoding against the old embedding.
+    """
+    import copy
+    if not predictor.is_image_set:
+        raise ValueError("Predictor has no image embedding to snapshot")
+    clone = copy.copy(predictor)
+    clone.features = predictor.features.clone()
+    return clone
+
+def export_embedding(predictor):
+    """
+    Snapshot of the predictor's current image embedding for a project file, or None.
+    Features are stored as float16 (2MB for ViT models) with the sizes SamPredictor needs.
+    """
+    import numpy as np
+    if predictor is None or not predictor.is_image_set:
+        return None
+    return {
+        'features': predictor.features.detach().cpu().numpy().astype(np.float16),
+        'input_size': list(predictor.input_size),
+        'original_size': list(predictor.original_size),
+        'embedding_id': getattr(predictor, 'embedding_id', None),
+        'model_type': getattr(predictor, 'model_type', None),
+    }
+
+def restore_embedding(predictor, snapshot):
+    """
+    Installs a saved embedding on the predictor, skipping the image encoder.
+    Returns False (and leaves the predictor untouched) if it was made by another model.
+    """
+    import torch
+    if snapshot is None or snapshot.get('model_type') != getattr(predictor, 'model_type', None):
+        return False
+    features = torch.from_numpy(snapshot['features']).to(device=predictor.device, dtype=torch.float32)
+    if features.shape[1] != predictor.model.prompt_encoder.embed_dim:
+        return False
+    predictor.reset_image()
+    predictor.features = features
+    predictor.input_size = tuple(snapshot['input_size'])
+    predictor.original_size = tuple(snapshot['original_size'])
+    predictor.is_image_set = True
+    predictor.embedding_id = snapshot.get('embedding_id')
+    return True
+
 def get_sam_predictor():
     """Convenience function to load model and return predictor."""
     sam = load_sam_model()
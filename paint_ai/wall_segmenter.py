@@ -1,18 +1,35 @@
+import copy
+import threading
 import numpy as np
 import cv2
 import streamlit as st
-from .sam_loader import get_mask_generator
+from .sam_loader import get_mask_generator, get_predictor, embed_image, image_embedding_id, snapshot_predictor
 
 class WallSegmenter:
-    def __init__(self, sam_model):
+    # Fast mode thresholds (as permissive as get_mask_generator, plus wall heuristics)
+    PRED_IOU_THRESH = 0.70
+    STABILITY_THRESH = 0.80
+    BOX_NMS_THRESH = 0.70 # Box IoU above which the lower-scored candidate is dropped
+    MASK_NMS_THRESH = 0.80 # Mask IoU above which two candidates are the same region
+    MIN_AREA_FRACTION = 0.005 # Walls cover at least 0.5% of the frame
+    MIN_VERTICAL_EXTENT = 0.15 # ... and span at least 15% of its height
+    MAX_TEXTURE = 12.0 # Mean |texture_detail| (L units): painted walls are uniform
+
+    def __init__(self, sam_model, predictor=None):
         self.sam = sam_model
         self.mask_generator = get_mask_generator(sam_model)
+        # Share the app's predictor to reuse its cached image embedding
+        self.predictor = predictor if predictor is not None else get_predictor(sam_model)
 
-    def detect_potential_walls(self, image_np):
+    def detect_potential_walls(self, image_np, fast=False, lighting_maps=None):
         """
         Runs automatic mask generation and filters for wall-like regions.
         Returns a list of masks (dict with 'segmentation', 'area', etc.)
+        fast=True uses the batched low-resolution pipeline (detect_potential_walls_fast).
         """
+        if fast:
+            return self.detect_potential_walls_fast(image_np, lighting_maps=lighting_maps)
+
         # SAM expects RGB 0-255
         masks = self.mask_generator.generate(image_np)
         
@@ -30,6 +47,248 @@ class WallSegmenter:
         filtered_masks.sort(key=lambda x: x['area'], reverse=True)
         return filtered_masks
 
+    def detect_potential_walls_fast(self, image_np, lighting_maps=None, points_per_side=24, points_per_batch=128):
+        """
+        Accelerated whole-room pre-segmentation. Same output format as detect_potential_walls.
+        1. Reuses the predictor's image embedding (no re-encode if already set for this image)
+        2. Decodes the point grid in large batches, keeping only low-res (256px) logits
+        3. Drops weak/unstable and non-wall-like candidates at low resolution
+        4. Removes duplicates with box NMS, then vectorized mask-IoU NMS
+        5. Upsamples only the survivors to full resolution
+        """
+        from segment_anything.utils.amg import build_point_grid
+
+        embed_image(self.predictor, image_np)
+        features = self._lowres_lighting(image_np, lighting_maps)
+
+        h, w = image_np.shape[:2]
+        points = build_point_grid(points_per_side) * np.array([w, h], dtype=np.float64)
+
+        candidates = None
+        for start in range(0, len(points), points_per_batch):
+            batch = self._decode_and_filter(points[start:start + points_per_batch], features)
+            candidates = batch if candidates is None else self._concat(candidates, batch)
+
+        if candidates is None or len(candidates['scores']) == 0:
+            return []
+        candidates, _ = self._dedupe(candidates)
+        return self._materialize(candidates)
+
+    def iter_potential_walls(self, image_np, lighting_maps=None, levels=(8, 16, 24), points_per_batch=64, cancel_event=None):
+        """
+        Streaming variant of detect_potential_walls_fast: yields mask dicts as soon as they
+        are decoded, coarse-to-fine. Each level is a denser point grid; grid points already
+        inside an emitted mask are skipped, so densification only spends decoder time on
+        uncovered areas. Within a batch, large regions are yielded first.
+        Stops early when cancel_event (threading.Event) is set or the generator is closed.
+        """
+        import torch
+
+        embed_image(self.predictor, image_np)
+        features = self._lowres_lighting(image_np, lighting_maps)
+
+        h, w = image_np.shape[:2]
+        covered = np.zeros((h, w), dtype=bool)
+        emitted = None # Flat low-res masks already yielded (for cross-batch dedupe)
+        seen = set()
+
+        from segment_anything.utils.amg import build_point_grid
+        for level, points_per_side in enumerate(levels):
+            grid = build_point_grid(points_per_side) * np.array([w, h], dtype=np.float64)
+            for start in range(0, len(grid), points_per_batch):
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+
+                # Skip points already explained by a region (or decoded at a coarser level)
+                batch = []
+                for px, py in grid[start:start + points_per_batch]:
+                    ix, iy = min(int(px), w - 1), min(int(py), h - 1)
+                    if covered[iy, ix] or (ix, iy) in seen:
+                        continue
+                    seen.add((ix, iy))
+                    batch.append((px, py))
+                if not batch:
+                    continue
+
+                c = self._decode_and_filter(np.array(batch), features)
+                if len(c['scores']) == 0:
+                    continue
+                c, flat = self._dedupe(c, existing=emitted)
+                if len(c['scores']) == 0:
+                    continue
+                emitted = flat if emitted is None else torch.cat([emitted, flat])
+
+                for mask in self._materialize(c):
+                    covered |= mask['segmentation']
+                    mask['level'] = level
+                    yield mask
+
+    # --- Fast pipeline stages ---
+
+    def _lowres_frame(self):
+        """(rows, cols) of the image-covered part of the decoder's 256x256 logit grid."""
+        ih, iw = self.predictor.input_size
+        scale = 256 / self.predictor.model.image_encoder.img_size
+        return int(np.ceil(ih * scale)), int(np.ceil(iw * scale))
+
+    def _lowres_lighting(self, image_np, lighting_maps):
+        """Lighting statistics resampled onto the low-res logit grid (torch tensors)."""
+        import torch
+        if lighting_maps is None:
+            from utils.lighting_utils import extract_lighting_maps
+            lighting_maps = extract_lighting_maps(image_np)
+
+        lh, lw = self._lowres_frame()
+        texture = np.abs(lighting_maps['texture_detail']).astype(np.float32)
+        texture_low = cv2.resize(texture, (lw, lh), interpolation=cv2.INTER_AREA)
+        device = self.predictor.device
+        return {'texture': torch.as_tensor(texture_low, device=device).flatten()}
+
+    def _decode_points(self, points_xy):
+        """Batched mask decoding for single-point prompts. Returns padded low-res logits (N*3, 256, 256)."""
+        import torch
+        predictor = self.predictor
+        model = predictor.model
+
+        coords = predictor.transform.apply_coords(points_xy, predictor.original_size)
+        coords_t = torch.as_tensor(coords, dtype=torch.float, device=predictor.device)[:, None, :]
+        labels_t = torch.ones(coords_t.shape[:2], dtype=torch.int, device=predictor.device)
+
+        with torch.inference_mode():
+            sparse, dense = model.prompt_encoder(points=(coords_t, labels_t), boxes=None, masks=None)
+            low_res, iou = model.mask_decoder(
+                image_embeddings=predictor.features,
+                image_pe=model.prompt_encoder.get_dense_pe(),
+                sparse_prompt_embeddings=sparse,
+                dense_prompt_embeddings=dense,
+                multimask_output=True,
+            )
+        points_rep = np.repeat(points_xy, low_res.shape[1], axis=0)
+        return low_res.flatten(0, 1), iou.flatten(), points_rep
+
+    def _decode_and_filter(self, points_xy, features):
+        """Decodes a batch of points and keeps confident, stable, wall-like candidates."""
+        import torch
+        from segment_anything.utils.amg import calculate_stability_score
+
+        logits, iou, points_rep = self._decode_points(points_xy)
+        threshold = self.predictor.model.mask_threshold
+        lh, lw = self._lowres_frame()
+        cropped = logits[:, :lh, :lw]
+
+        # A. Model confidence and stability (cheap, prunes most of the grid)
+        stability = calculate_stability_score(cropped, threshold, 1.0)
+        keep = (iou > self.PRED_IOU_THRESH) & (stability > self.STABILITY_THRESH)
+
+        # B. Wall-likeness on the binary low-res masks
+        binary = cropped > threshold
+        area = binary.flatten(1).sum(-1).float()
+        keep &= area >= self.MIN_AREA_FRACTION * lh * lw
+        rows_covered = binary.any(-1).sum(-1).float()
+        keep &= rows_covered >= self.MIN_VERTICAL_EXTENT * lh
+        mean_texture = (binary.flatten(1).float() @ features['texture']) / area.clamp(min=1)
+        keep &= mean_texture <= self.MAX_TEXTURE
+
+        idx = torch.nonzero(keep).flatten()
+        return {
+            'logits': logits[idx],
+            'scores': iou[idx],
+            'stability': stability[idx],
+            'points': points_rep[idx.cpu().numpy()],
+        }
+
+    @staticmethod
+    def _concat(a, b):
+        import torch
+        return {
+            'logits': torch.cat([a['logits'], b['logits']]),
+            'scores': torch.cat([a['scores'], b['scores']]),
+            'stability': torch.cat([a['stability'], b['stability']]),
+            'points': np.concatenate([a['points'], b['points']]),
+        }
+
+    @staticmethod
+    def _select(c, idx):
+        return {
+            'logits': c['logits'][idx],
+            'scores': c['scores'][idx],
+            'stability': c['stability'][idx],
+            'points': c['points'][idx.cpu().numpy()],
+        }
+
+    def _dedupe(self, c, existing=None):
+        """
+        Box NMS, then greedy mask-IoU NMS over the survivors (one matrix product).
+        existing: flat low-res masks already emitted (streaming); duplicates of them are dropped too.
+        Returns (candidates, their flat low-res masks).
+        """
+        import torch
+        from torchvision.ops.boxes import batched_nms
+        from segment_anything.utils.amg import batched_mask_to_box
+
+        lh, lw = self._lowres_frame()
+        binary = c['logits'][:, :lh, :lw] > self.predictor.model.mask_threshold
+        rank = c['scores'] * c['stability']
+
+        # 1. Box NMS (catches most duplicates at near-zero cost)
+        boxes = batched_mask_to_box(binary).float()
+        keep = batched_nms(boxes, rank, torch.zeros_like(rank), iou_threshold=self.BOX_NMS_THRESH)
+        c = self._select(c, keep)
+        binary = binary[keep]
+        rank = rank[keep]
+
+        # 2. Mask NMS: pairwise IoU for all survivors at once
+        flat = binary.flatten(1).float()
+        iou_np = self._mask_iou(flat, flat).cpu().numpy()
+        suppressed = np.zeros(len(rank), dtype=bool)
+        if existing is not None and len(existing):
+            suppressed |= (self._mask_iou(flat, existing) > self.MASK_NMS_THRESH).any(-1).cpu().numpy()
+
+        order = torch.argsort(rank, descending=True).tolist()
+        survivors = []
+        for i in order:
+            if suppressed[i]:
+                continue
+            survivors.append(i)
+            suppressed |= iou_np[i] > self.MASK_NMS_THRESH
+        idx = torch.as_tensor(survivors, dtype=torch.long, device=c['logits'].device)
+        return self._select(c, idx), flat[idx]
+
+    @staticmethod
+    def _mask_iou(a, b):
+        """Pairwise IoU between two sets of flat float masks (A, P) x (B, P)."""
+        inter = a @ b.T
+        union = a.sum(-1)[:, None] + b.sum(-1)[None, :] - inter
+        return inter / union.clamp(min=1)
+
+    def _materialize(self, c, batch_size=16):
+        """Upsamples surviving logits to full resolution and builds generator-style dicts."""
+        import torch
+        predictor = self.predictor
+        model = predictor.model
+        results = []
+
+        for start in range(0, len(c['scores']), batch_size):
+            logits = c['logits'][start:start + batch_size, None]
+            with torch.inference_mode():
+                full = model.postprocess_masks(logits, predictor.input_size, predictor.original_size)
+            full = (full[:, 0] > model.mask_threshold).cpu().numpy()
+
+            for j, seg in enumerate(full):
+                k = start + j
+                x, y, bw, bh = cv2.boundingRect(seg.astype(np.uint8))
+                results.append({
+                    'segmentation': seg,
+                    'area': int(seg.sum()),
+                    'bbox': [x, y, bw, bh],
+                    'predicted_iou': float(c['scores'][k]),
+                    'stability_score': float(c['stability'][k]),
+                    'point_coords': [c['points'][k].tolist()],
+                })
+
+        results.sort(key=lambda x: x['area'], reverse=True)
+        return results
+
     @staticmethod
     def get_mask_by_point(masks, x, y):
         """
@@ -50,3 +309,78 @@ class WallSegmenter:
             
         # Return smallest candidate (most specific)
         return min(candidates, key=lambda x: x['area'])
+
+
+class AutoSegmentationJob:
+    """
+    Runs WallSegmenter.iter_potential_walls in a background thread.
+    Partial results can be hit-tested while the scan continues; cancel() stops
+    the remaining work (e.g. new upload or leaving the AI tools).
+    The image must already be embedded (embed_image) by the caller's thread. The
+    scan decodes on a snapshot of that predictor, so the session can keep
+    clicking, re-embedding or resetting its own predictor meanwhile.
+    With a scheduler (utils.job_scheduler), each step of the scan (one decode batch,
+    or handing out a mask already decoded) runs in its own "scan" slot, so queued
+    clicks, embeds and exports get the slot between batches instead of waiting for
+    the whole scan.
+    """
+    def __init__(self, segmenter, image_np, lighting_maps=None, scheduler=None, session_id=None):
+        # Never embed from the background thread: it would run outside any "embed" slot
+        if getattr(segmenter.predictor, 'embedding_id', None) != image_embedding_id(image_np):
+            raise ValueError("Image must be embedded before starting a background scan")
+        segmenter = copy.copy(segmenter)
+        segmenter.predictor = snapshot_predictor(segmenter.predictor)
+
+        self.masks = []
+        self.done = False
+        self.error = None
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, args=(segmenter, image_np, lighting_maps, scheduler, session_id), daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, segmenter, image_np, lighting_maps, scheduler, session_id):
+        walls = segmenter.iter_potential_walls(image_np, lighting_maps, cancel_event=self.cancel_event)
+        try:
+            if scheduler is None:
+                for mask in walls:
+                    self._add(mask)
+            else:
+                from utils.job_scheduler import JobCancelled
+                try:
+                    while True:
+                        # The generator decodes lazily: next() is one step of work
+                        with scheduler.slot("scan", session_id, cancel_event=self.cancel_event):
+                            mask = next(walls, None)
+                        if mask is None:
+                            break
+                        self._add(mask)
+                except JobCancelled:
+                    pass
+        except Exception as e:
+            self.error = e
+        finally:
+            walls.close()
+            self.done = True
+
+    def _add(self, mask):
+        with self._lock:
+            self.masks.append(mask)
+
+    def cancel(self):
+        """Stops the scan and waits for the thread (at most one decode batch) to exit."""
+        self.cancel_event.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def hit_test(self, x, y):
+        """Smallest region found so far that contains (x, y), or None."""
+        with self._lock:
+            masks = list(self.masks)
+        return WallSegmenter.get_mask_by_point(masks, x, y)
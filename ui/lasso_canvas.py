@@ -4,11 +4,14 @@ from PIL import Image
 import numpy as np
 import cv2
 
-def render_lasso_tool(background_image, key="lasso", canvas_width=None):
+def render_lasso_tool(background_image, key="lasso", canvas_width=None, return_polygons=False):
     """
     Renders the drawing canvas for Lasso selection.
     Returns the mask drawn by the user (boolean array at ORIGINAL image size).
+    With return_polygons=True returns (mask, polygons): the lasso polygons in
+    ORIGINAL image coordinates, which can be re-rasterized at any resolution.
     """
+    from utils.mask_utils import fabric_object_to_polygon, polygon_to_mask
     img_w, img_h = background_image.size
     
     if canvas_width and canvas_width < img_w:
@@ -42,19 +45,30 @@ def render_lasso_tool(background_image, key="lasso", canvas_width=None):
         key=key,
     )
     
-    if canvas_result.image_data is not None:
-        # Extract drawing mask (binary)
+    mask, polygons = None, []
+    if canvas_result.json_data is not None:
+        # Vector path: rasterize the polygons directly at the original size (no bitmap round-trip)
+        for obj in canvas_result.json_data.get("objects", []):
+            points = fabric_object_to_polygon(obj)
+            if points is not None:
+                polygons.append((points / scale_display).astype(np.float32))
+        if polygons:
+            mask = polygon_to_mask(polygons, (img_h, img_w))
+
+    if mask is None and canvas_result.image_data is not None:
+        # Fallback: objects we can't parse, use the drawn bitmap
         mask_drawn = canvas_result.image_data[:, :, 3] > 0
         
         if scale_display != 1.0:
             # Upscale the mask back to the original image dimensions
             mask_uint8 = (mask_drawn.astype(np.uint8)) * 255
             mask_orig = cv2.resize(mask_uint8, (img_w, img_h), interpolation=cv2.INTER_NEAREST)
-            return mask_orig > 0
-            
-        return mask_drawn
+            mask_drawn = mask_orig > 0
+        mask = mask_drawn
     
-    return None
+    if return_polygons:
+        return mask, polygons
+    return mask
 
 def render_click_tool(background_image, key="click_tool", canvas_width=None):
     """
@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+
+from utils.color_utils import lab8_to_cielab
+
+MAX_SAMPLES = 20000 # Pixels per estimate; larger masks are subsampled evenly
+TRIM_PERCENTILES = (10, 90) # Drop specular highlights and dark crevices
+
+
+def sample_mask_color(image_rgb, mask, lighting_maps):
+    """
+    Robust estimate of the color already on a surface (e.g. "what paint is on this wall?").
+    Shading compensation uses the lighting maps: lightness is divided by the local
+    illumination (luminance - texture_detail) and rescaled to the mask's typical
+    level, chroma lost to shadow desaturation (1 - 0.4 * shadow_strength, as in the
+    paint engine) is restored, and shadowed pixels get lower weight. The statistic is
+    a weighted mean over the trimmed lightness range.
+    Returns {'lab': true CIELAB, 'lab8': OpenCV 8-bit LAB, 'pixels': samples used}, or None.
+    """
+    if not isinstance(image_rgb, np.ndarray):
+        image_rgb = np.array(image_rgb)
+    if mask is None or not np.any(mask):
+        return None
+
+    # 1. BOUNDING BOX CROP, then the masked pixels (evenly subsampled)
+    x, y, w, h = cv2.boundingRect(np.asarray(mask, dtype=np.uint8))
+    crop = (slice(y, y + h), slice(x, x + w))
+    idx = np.flatnonzero(mask[crop])
+    if idx.size > MAX_SAMPLES:
+        idx = idx[::idx.size // MAX_SAMPLES]
+
+    lab = cv2.cvtColor(np.ascontiguousarray(image_rgb[crop]), cv2.COLOR_RGB2LAB).reshape(-1, 3)[idx].astype(np.float32)
+    luminance = lighting_maps['luminance'][crop].reshape(-1)[idx].astype(np.float32)
+    illumination = np.maximum(luminance - lighting_maps['texture_detail'][crop].reshape(-1)[idx], 1.0)
+    shadow = lighting_maps['shadow_strength'][crop].reshape(-1)[idx]
+
+    # 2. SHADING COMPENSATION
+    weights = np.clip(1.0 - shadow, 0.05, 1.0)
+    reference = np.average(illumination, weights=weights)
+    lightness = np.clip(lab[:, 0] * (reference / illumination), 0, 255)
+    desat = 1.0 - shadow * 0.4
+    chroma = (lab[:, 1:] - 128) / desat[:, None] + 128
+
+    # 3. TRIMMED WEIGHTED MEAN
+    lo, hi = np.percentile(lightness, TRIM_PERCENTILES)
+    keep = (lightness >= lo) & (lightness <= hi)
+    if not np.any(keep):
+        keep[:] = True
+    w = weights[keep]
+    lab8 = np.array([
+        np.average(lightness[keep], weights=w),
+        np.average(chroma[keep, 0], weights=w),
+        np.average(chroma[keep, 1], weights=w),
+    ], dtype=np.float32)
+    return {'lab': lab8_to_cielab(lab8), 'lab8': np.clip(np.round(lab8), 0, 255).astype(np.uint8), 'pixels': int(keep.sum())}
+
+
+def match_mask_to_catalog(image_rgb, mask, lighting_maps, k=5, **filters):
+    """
+    Top-k catalog paints closest (CIEDE2000) to the sampled color of a mask.
+    filters: brand / collection / finish for brands.catalog. Returns (sample, matches).
+    """
+    from brands.catalog import get_catalog
+
+    sample = sample_mask_color(image_rgb, mask, lighting_maps)
+    if sample is None:
+        return None, []
+    return sample, get_catalog().closest(sample['lab'], k=k, **filters)
@@ -0,0 +1,120 @@
+import cv2
+import numpy as np
+
+
+def hex_to_rgb(hex_codes):
+    """'#RRGGBB' (or a list of them) -> uint8 RGB array of shape (3,) or (N, 3)."""
+    single = isinstance(hex_codes, str)
+    codes = [hex_codes] if single else list(hex_codes)
+    rgb = np.array([[int(h.lstrip('#')[i:i+2], 16) for i in (0, 2, 4)] for h in codes], dtype=np.uint8).reshape(-1, 3)
+    return rgb[0] if single else rgb
+
+
+def hex_to_lab(hex_code):
+    """Converts hex string to OpenCV 8-bit LAB (the paint engine's color space)."""
+    rgb_pixel = hex_to_rgb(hex_code).reshape(1, 1, 3)
+    return cv2.cvtColor(rgb_pixel, cv2.COLOR_RGB2LAB)[0][0]
+
+
+def rgb_to_lab8(rgb):
+    """uint8 RGB (..., 3) -> OpenCV 8-bit LAB, vectorized (one cvtColor for all colors)."""
+    rgb = np.asarray(rgb, dtype=np.uint8)
+    return cv2.cvtColor(rgb.reshape(-1, 1, 3), cv2.COLOR_RGB2LAB).reshape(rgb.shape)
+
+
+_SRGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+_D65_WHITE = np.array([0.95047, 1.0, 1.08883])
+
+
+def rgb_to_cielab(rgb):
+    """uint8 RGB (..., 3) -> true CIELAB floats (L 0-100, a/b signed, D65), exact float math."""
+    c = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = (linear @ _SRGB_TO_XYZ.T) / _D65_WHITE
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    lab = np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+    return lab.astype(np.float32)
+
+
+def lab8_to_cielab(lab8):
+    """OpenCV 8-bit LAB -> true CIELAB floats."""
+    lab = np.asarray(lab8, dtype=np.float32).copy()
+    lab[..., 0] *= 100.0 / 255.0
+    lab[..., 1:] -= 128.0
+    return lab
+
+
+def delta_e_2000(lab1, lab2):
+    """
+    CIEDE2000 color difference between true CIELAB colors, vectorized with
+    broadcasting: (3,) vs (N, 3) -> (N,), (M, 1, 3) vs (N, 3) -> (M, N), ...
+    """
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    L1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    L2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+
+    # 1. Chroma-dependent a* rescaling
+    C1 = np.hypot(a1, b1)
+    C2 = np.hypot(a2, b2)
+    C_bar7 = ((C1 + C2) / 2) ** 7
+    G = 0.5 * (1 - np.sqrt(C_bar7 / (C_bar7 + 25.0 ** 7)))
+    a1p = (1 + G) * a1
+    a2p = (1 + G) * a2
+    C1p = np.hypot(a1p, b1)
+    C2p = np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+
+    # 2. Differences (hue difference is undefined when either chroma is 0)
+    dLp = L2 - L1
+    dCp = C2p - C1p
+    dhp = h2p - h1p
+    dhp = np.where(dhp > 180, dhp - 360, np.where(dhp < -180, dhp + 360, dhp))
+    chroma_zero = (C1p * C2p) == 0
+    dhp = np.where(chroma_zero, 0.0, dhp)
+    dHp = 2 * np.sqrt(C1p * C2p) * np.sin(np.radians(dhp) / 2)
+
+    # 3. Means
+    Lp_bar = (L1 + L2) / 2
+    Cp_bar = (C1p + C2p) / 2
+    h_sum = h1p + h2p
+    hp_bar = np.where(np.abs(h1p - h2p) > 180,
+                      np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2),
+                      h_sum / 2)
+    hp_bar = np.where(chroma_zero, h_sum, hp_bar)
+
+    # 4. Weighting functions
+    T = (1 - 0.17 * np.cos(np.radians(hp_bar - 30)) + 0.24 * np.cos(np.radians(2 * hp_bar))
+         + 0.32 * np.cos(np.radians(3 * hp_bar + 6)) - 0.20 * np.cos(np.radians(4 * hp_bar - 63)))
+    d_theta = 30 * np.exp(-(((hp_bar - 275) / 25) ** 2))
+    Cp_bar7 = Cp_bar ** 7
+    R_C = 2 * np.sqrt(Cp_bar7 / (Cp_bar7 + 25.0 ** 7))
+    S_L = 1 + (0.015 * (Lp_bar - 50) ** 2) / np.sqrt(20 + (Lp_bar - 50) ** 2)
+    S_C = 1 + 0.045 * Cp_bar
+    S_H = 1 + 0.015 * Cp_bar * T
+    R_T = -np.sin(np.radians(2 * d_theta)) * R_C
+
+    return np.sqrt(
+        (dLp / S_L) ** 2 + (dCp / S_C) ** 2 + (dHp / S_H) ** 2 + R_T * (dCp / S_C) * (dHp / S_H)
+    )
+
+
+def cielab_to_din99o(lab):
+    """
+    CIELAB -> DIN99o coordinates. Euclidean distance there tracks CIEDE2000 far
+    better than CIE76 does (compressed chroma and lightness), so it is the space
+    to index for nearest-color pre-selection.
+    """
+    lab = np.asarray(lab, dtype=np.float64)
+    L, a, b = lab[..., 0], lab[..., 1], lab[..., 2]
+    cos26, sin26 = np.cos(np.radians(26)), np.sin(np.radians(26))
+    e = a * cos26 + b * sin26
+    f = 0.83 * (-a * sin26 + b * cos26)
+    C = np.log1p(0.075 * np.hypot(e, f)) / 0.0435
+    h = np.arctan2(f, e) + np.radians(26)
+    return np.stack([303.67 * np.log1p(0.0039 * L), C * np.cos(h), C * np.sin(h)], axis=-1)
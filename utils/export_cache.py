@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+# Encoded full-resolution exports, keyed by render spec (shared by all sessions on this host)
+EXPORT_CACHE_DIR = os.environ.get("VISUALIZER_EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "visualizer_exports"))
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get("VISUALIZER_EXPORT_CACHE_MB", "512")) * 1024 * 1024
+# Bump when render_high_res or the paint engine changes output, so old renders are not served
+RENDER_VERSION = 2
+# Partial writes older than this belong to a worker that died mid-write
+PART_MAX_AGE_SECONDS = 3600
+
+
+def _update(digest, value):
+    """Feeds a render input (arrays, dicts, lists, scalars) into digest, structure included."""
+    if isinstance(value, np.ndarray):
+        digest.update(f"nd{value.dtype.str}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        digest.update(b"{")
+        for key in sorted(value, key=str):
+            digest.update(repr(key).encode())
+            _update(digest, value[key])
+        digest.update(b"}")
+    elif isinstance(value, (list, tuple)):
+        digest.update(b"[")
+        for item in value:
+            _update(digest, item)
+        digest.update(b"]")
+    else:
+        digest.update(json.dumps(value, default=str).encode())
+
+
+def render_spec_key(original_id, masks, wall_assignments, mask_logits=None, mask_polygons=None, fmt="png", size="full",
+                    refine_model=None):
+    """
+    Hash of everything render_high_res + encoding depend on: the original (its spool
+    content hash), each painted mask with its logits/polygons and paint, in paint order,
+    the paint kernel (fused and NumPy may differ by a level), the export refinement
+    model (paint_ai/model_registry.select_export_model), the output format and size.
+    Unpainted masks and session ids don't enter it, so identical renders from different
+    sessions share one entry.
+    """
+    from paint_ai.paint_kernel import kernel_enabled
+    digest = hashlib.blake2b(digest_size=20)
+    _update(digest, {'version': RENDER_VERSION, 'kernel': "fused" if kernel_enabled() else "numpy",
+                     'refine': refine_model, 'original': original_id, 'format': fmt, 'size': size})
+    for m_idx, data in wall_assignments.items():
+        if m_idx >= len(masks):
+            continue
+        _update(digest, [
+            masks[m_idx],
+            (mask_logits or {}).get(m_idx),
+            (mask_polygons or {}).get(m_idx),
+            {'lab': data['lab'], 'finish': data['finish'], 'reflectance': data.get('reflectance', 0.5)},
+        ])
+    return digest.hexdigest()
+
+
+def _path(key, directory):
+    return os.path.join(directory, key + ".bin")
+
+
+def get_export(key, directory=EXPORT_CACHE_DIR):
+    """Cached encoded export for key, or None. A hit counts as a use for the LRU."""
+    path = _path(key, directory)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)
+        return data
+    except OSError:
+        return None
+
+
+def put_export(key, data, directory=EXPORT_CACHE_DIR, max_bytes=EXPORT_CACHE_MAX_BYTES):
+    """Stores an encoded export, then evicts least recently used entries over max_bytes."""
+    if len(data) > max_bytes:
+        return
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        os.replace(tmp_path, _path(key, directory)) # Atomic: concurrent readers see whole files only
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return # Cache write failed (disk full): the export itself was still served
+    trim_cache(directory, max_bytes)
+
+
+def trim_cache(directory=EXPORT_CACHE_DIR, max_bytes=EXPORT_CACHE_MAX_BYTES):
+    """
+    Deletes least recently used exports until the cache fits in max_bytes, and
+    partial writes older than PART_MAX_AGE_SECONDS (like upload_spool.prune_spool).
+    """
+    try:
+        files = [e for e in os.scandir(directory) if e.is_file()]
+    except OSError:
+        return
+    cutoff = time.time() - PART_MAX_AGE_SECONDS
+    entries = []
+    for e in files:
+        try:
+            stat = e.stat()
+            if e.name.endswith(".bin"):
+                entries.append((stat.st_mtime, stat.st_size, e.path))
+            elif e.name.endswith(".part") and stat.st_mtime < cutoff: # Recent ones are writes in progress
+                os.remove(e.path)
+        except OSError:
+            pass # Removed concurrently by another session
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass # Removed concurrently by another session
+        total -= size
+
+
+def cache_usage(directory=EXPORT_CACHE_DIR):
+    """(entries, bytes) currently cached."""
+    try:
+        sizes = [e.stat().st_size for e in os.scandir(directory) if e.is_file() and e.name.endswith(".bin")]
+    except OSError:
+        return 0, 0
+    return len(sizes), sum(sizes)
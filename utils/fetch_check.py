@@ -0,0 +1,190 @@
+"""
+Offline check of the model-artifact fetcher against a local HTTP stand-in.
+
+A throwaway http.server serves a random "checkpoint" with HTTP Range support and
+can drop the connection part-way, the way a flaky CDN does. The scenarios drive
+model_utils.fetch_artifact through an interrupted-then-resumed download, a server
+that ignores Range, a checksum mismatch, a lock abandoned by a dead worker and
+concurrent workers sharing one download. No network access is needed.
+
+    python -m utils.fetch_check
+    python -m utils.fetch_check --size-mb 64
+"""
+import argparse
+import hashlib
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from utils import model_utils
+
+# The interrupted download is cut after at least two write chunks, with data left to resume
+MIN_SIZE_BYTES = 3 * model_utils.CHUNK_SIZE
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Serves server.payload at any path; honours Range unless server.ranges is off."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.headers.get("Range"))
+        payload = server.payload
+        start = 0
+        rng = self.headers.get("Range")
+        if rng and server.ranges:
+            start = int(rng.split("=")[1].split("-")[0])
+            if start >= len(payload):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(payload) - 1}/{len(payload)}")
+        else:
+            self.send_response(200)
+        body = payload[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        # Drop the connection after cut_after bytes (once), like an interrupted transfer
+        limit = len(body)
+        if server.cut_after is not None:
+            limit, server.cut_after = min(limit, server.cut_after), None
+        self.wfile.write(body[:limit])
+        self.wfile.flush()
+        if limit < len(body):
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve(payload):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.payload, server.ranges, server.cut_after, server.requests = payload, True, None, []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _reset(server, workdir, name):
+    server.ranges, server.cut_after, server.requests = True, None, []
+    dest = os.path.join(workdir, name)
+    url = f"http://127.0.0.1:{server.server_address[1]}/{name}"
+    return url, dest
+
+
+def _fails(fn):
+    try:
+        fn()
+    except Exception as e:
+        return type(e).__name__
+    return None
+
+
+def run(size_bytes):
+    """Runs every scenario; returns [(name, passed, detail)]."""
+    payload = os.urandom(size_bytes)
+    digest = hashlib.sha256(payload).hexdigest()
+    server = _serve(payload)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        # 1. Interrupted download: fails, keeps the .part, then resumes with Range
+        url, dest = _reset(server, workdir, "resume.pth")
+        server.cut_after = max(size_bytes // 3, 2 * model_utils.CHUNK_SIZE) # Whole chunks reach the .part
+        error = _fails(lambda: model_utils.fetch_artifact(url, dest, digest, timeout=5))
+        part = os.path.getsize(dest + ".part") if os.path.exists(dest + ".part") else 0
+        model_utils.fetch_artifact(url, dest, digest, timeout=5)
+        resumed = server.requests[-1] == f"bytes={part}-"
+        results.append(("interrupted download resumes",
+                        bool(error) and 0 < part < size_bytes and resumed
+                        and model_utils.file_sha256(dest) == digest,
+                        f"first attempt {error}, kept {part} bytes, resumed with {server.requests[-1]!r}"))
+
+        # 2. Server ignores Range: the partial file is discarded, not corrupted
+        url, dest = _reset(server, workdir, "norange.pth")
+        with open(dest + ".part", "wb") as f:
+            f.write(payload[:size_bytes // 2])
+        server.ranges = False
+        model_utils.fetch_artifact(url, dest, digest, timeout=5)
+        results.append(("range ignored restarts cleanly", model_utils.file_sha256(dest) == digest,
+                        f"requests {server.requests}"))
+
+        # 3. Wrong checksum: raises and never publishes the file
+        url, dest = _reset(server, workdir, "corrupt.pth")
+        error = _fails(lambda: model_utils.fetch_artifact(url, dest, "0" * 64, timeout=5))
+        results.append(("checksum mismatch rejected", error == "ValueError" and not os.path.exists(dest),
+                        f"raised {error}"))
+
+        # 4. Lock left behind by a dead worker (never refreshed) is taken over
+        url, dest = _reset(server, workdir, "stale.pth")
+        with open(dest + ".lock", "w") as f:
+            f.write("999999")
+        old = time.time() - model_utils.LOCK_STALE_SECONDS - 5
+        os.utime(dest + ".lock", (old, old))
+        start = time.monotonic()
+        model_utils.fetch_artifact(url, dest, digest, timeout=5, lock_timeout=10)
+        results.append(("stale lock taken over", model_utils.file_sha256(dest) == digest
+                        and not os.path.exists(dest + ".lock"), f"{time.monotonic() - start:.2f}s"))
+
+        # 5. A fresh lock is respected: the waiter times out instead of downloading
+        url, dest = _reset(server, workdir, "held.pth")
+        with open(dest + ".lock", "w") as f:
+            f.write(str(os.getpid()))
+        error = _fails(lambda: model_utils.fetch_artifact(url, dest, digest, timeout=5, lock_timeout=1.5))
+        os.remove(dest + ".lock")
+        results.append(("live lock respected", error == "TimeoutError" and not server.requests,
+                        f"raised {error}, {len(server.requests)} requests"))
+
+        # 6. Concurrent workers: one download, every worker gets the verified file
+        url, dest = _reset(server, workdir, "shared.pth")
+        errors = []
+
+        def worker():
+            try:
+                model_utils.fetch_artifact(url, dest, digest, timeout=5)
+            except Exception as e:
+                errors.append(repr(e))
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        results.append(("concurrent workers share one download",
+                        not errors and len(server.requests) == 1 and model_utils.file_sha256(dest) == digest,
+                        f"{len(server.requests)} requests, errors {errors}"))
+
+        # 7. A metadata-less copy is hashed once, then quick-checked from the record
+        url, dest = _reset(server, workdir, "manual.pth")
+        with open(dest, "wb") as f:
+            f.write(payload)
+        first = model_utils.verify_artifact(dest, digest)
+        recorded = os.path.exists(dest + ".meta.json")
+        results.append(("manual copy verified and recorded", first and recorded
+                        and not model_utils.verify_artifact(dest, "0" * 64), f"recorded {recorded}"))
+    server.shutdown()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the checkpoint fetcher against a local HTTP server.")
+    parser.add_argument("--size-mb", type=float, default=16, help="Size of the served test artifact")
+    args = parser.parse_args(argv)
+    size_bytes = int(args.size_mb * 1024 * 1024)
+    if size_bytes < MIN_SIZE_BYTES:
+        parser.error(f"--size-mb must be at least {MIN_SIZE_BYTES / (1024 * 1024):g} (the interrupted "
+                     f"download has to keep whole {model_utils.CHUNK_SIZE // (1024 * 1024)}MB chunks)")
+
+    results = run(size_bytes)
+    for name, passed, detail in results:
+        print(f"{'ok  ' if passed else 'FAIL'} {name:40s} {detail}")
+    ok = all(passed for _, passed, _ in results)
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
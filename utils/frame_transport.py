@@ -0,0 +1,125 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+# Preview frames are backgrounds, not deliverables: lossy is fine and much smaller.
+# Override per deployment, e.g. PREVIEW_FRAME_FORMAT=WEBP PREVIEW_FRAME_QUALITY=80
+FRAME_FORMAT = os.environ.get("PREVIEW_FRAME_FORMAT", "JPEG").upper()
+FRAME_QUALITY = int(os.environ.get("PREVIEW_FRAME_QUALITY", "85"))
+
+MIMETYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "PNG": "image/png",
+}
+
+# Encoded frames keyed by pixel digest (process-wide, shared by all sessions)
+_MAX_CACHE_BYTES = 64 * 1024 * 1024
+_encoded_cache = OrderedDict()
+_encoded_cache_bytes = 0
+_encoded_cache_lock = threading.Lock() # Every session's script thread shares the cache
+
+
+def _to_array(image):
+    """Returns a contiguous uint8 array view of a PIL image or numpy frame."""
+    if isinstance(image, Image.Image):
+        return np.asarray(image)
+    return np.ascontiguousarray(image)
+
+
+def frame_digest(image):
+    """Cheap content hash of the raw pixels (shape included)."""
+    arr = _to_array(image)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(arr.shape).encode())
+    h.update(arr.tobytes())
+    return h.hexdigest()
+
+
+def encode_frame(image, fmt=None, quality=None):
+    """
+    Encodes a frame for the browser.
+    Returns (bytes, mimetype). Frames with alpha always go out as PNG.
+    """
+    fmt = (fmt or FRAME_FORMAT).upper()
+    quality = quality or FRAME_QUALITY
+
+    if not isinstance(image, Image.Image):
+        image = Image.fromarray(_to_array(image))
+    if image.mode in ("RGBA", "LA", "P"):
+        fmt = "PNG"
+    if fmt not in MIMETYPES:
+        fmt = "JPEG"
+
+    buf = io.BytesIO()
+    if fmt == "PNG":
+        # compress_level=1: the PNG fallback is for alpha, favour encode speed
+        image.save(buf, format="PNG", compress_level=1)
+    elif fmt == "WEBP":
+        image.save(buf, format="WEBP", quality=quality, method=2)
+    else:
+        image.convert("RGB").save(buf, format="JPEG", quality=quality, subsampling="4:2:0")
+    return buf.getvalue(), MIMETYPES[fmt]
+
+
+def _cache_put(key, value):
+    """Caller holds _encoded_cache_lock."""
+    global _encoded_cache_bytes
+    if key in _encoded_cache: # Encoded concurrently by another session
+        return
+    _encoded_cache[key] = value
+    _encoded_cache_bytes += len(value[0])
+    while _encoded_cache_bytes > _MAX_CACHE_BYTES and len(_encoded_cache) > 1:
+        _, (old_bytes, _) = _encoded_cache.popitem(last=False)
+        _encoded_cache_bytes -= len(old_bytes)
+
+
+def get_encoded_frame(image, fmt=None, quality=None):
+    """
+    Returns (bytes, mimetype) for a frame, encoding only on first sight.
+    Identical pixels produce identical bytes, so the media manager hands back
+    the same media ID and the browser can reuse its cached copy.
+    """
+    fmt = (fmt or FRAME_FORMAT).upper()
+    quality = quality or FRAME_QUALITY
+    key = (frame_digest(image), fmt, quality)
+
+    with _encoded_cache_lock:
+        cached = _encoded_cache.get(key)
+        if cached is not None:
+            _encoded_cache.move_to_end(key)
+            return cached
+
+    encoded = encode_frame(image, fmt, quality) # Outside the lock: encodes run in parallel
+    with _encoded_cache_lock:
+        _cache_put(key, encoded)
+    return encoded
+
+
+def _sniff_mimetype(data):
+    """Guesses the mimetype of already-encoded image bytes."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/png"
+
+
+def frame_to_url(media_file_mgr, data, coordinates, fmt=None, quality=None):
+    """
+    Registers a preview frame with Streamlit's media file manager and returns its URL.
+    Accepts PIL images, numpy frames or already-encoded bytes.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        return media_file_mgr.add(bytes(data), _sniff_mimetype(data), coordinates)
+
+    encoded, mimetype = get_encoded_frame(data, fmt, quality)
+    return media_file_mgr.add(encoded, mimetype, coordinates)
+
@@ -1,6 +1,5 @@
 from PIL import Image, ImageOps
 import numpy as np
-import cv2
 
 def resize_image_max_side(image_pil, max_side=1024):
     """Resizes image so its longest side is at most max_side."""
@@ -12,6 +11,22 @@ def resize_image_max_side(image_pil, max_side=1024):
         return image_pil.resize((new_w, new_h), Image.Resampling.LANCZOS)
     return image_pil
 
+def load_preview(source, max_side=1024):
+    """
+    Opens a photo (path or file object) at preview size, longest side max_side.
+    JPEGs are decoded at reduced resolution (libjpeg DCT scaling via Image.draft,
+    never below the target size), so large photos are never decoded in full;
+    the result is LANCZOS-resized to the same size resize_image_max_side gives.
+    """
+    image = Image.open(source)
+    w, h = image.size
+    if max(w, h) <= max_side:
+        return image.convert("RGB")
+    scale = max_side / max(w, h)
+    size = (int(w * scale), int(h * scale))
+    image.draft("RGB", size) # No-op for formats without scaled decoding (PNG)
+    return image.convert("RGB").resize(size, Image.Resampling.LANCZOS)
+
 def load_image_from_bytes(file_bytes):
     """Loads image from bytes and handles orientation."""
     image = Image.open(file_bytes)
@@ -0,0 +1,207 @@
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+# Operation classes: priority (lower runs first), concurrent slots, max queued before rejecting
+OPERATIONS = {
+    "decode": {"priority": 0, "limit": 4, "max_queue": 64}, # SAM mask decode for clicks/boxes (tens of ms)
+    "embed": {"priority": 1, "limit": 2, "max_queue": 16}, # SAM image encoder (seconds)
+    "export": {"priority": 2, "limit": 1, "max_queue": 8}, # Full-resolution render
+    "video": {"priority": 2, "limit": 1, "max_queue": 4}, # Walkthrough render (minutes; own limit so stills still export)
+    "scan": {"priority": 3, "limit": 1, "max_queue": 8}, # Background wall scan (one slot per decode batch)
+}
+# VISUALIZER_JOB_LIMITS: per-class slot overrides, e.g. "export=2,embed=1"
+for _item in filter(None, os.environ.get("VISUALIZER_JOB_LIMITS", "").split(",")):
+    _name, _limit = _item.split("=")
+    OPERATIONS[_name.strip()]["limit"] = int(_limit)
+# Slots shared by all classes (one per core is plenty: each job is itself multi-threaded)
+JOB_WORKERS = int(os.environ.get("VISUALIZER_JOB_WORKERS", str(max(2, min(4, os.cpu_count() or 2)))))
+INTERACTIVE_RESERVE = 1 # Slots only priority-0 work (clicks) may use, so exports never block a click
+AGING_SECONDS = 15 # A waiting job gains one priority level per AGING_SECONDS (no starvation)
+POLL_SECONDS = 0.25
+
+
+class SchedulerBusy(Exception):
+    """The operation's queue is full; the caller should ask the user to retry."""
+
+
+class JobCancelled(Exception):
+    """The job was cancelled while queued (session disconnected or replaced the work)."""
+
+
+class Ticket:
+    def __init__(self, op, session_id, seq, cancel_event=None):
+        self.op = op
+        self.session_id = session_id
+        self.seq = seq
+        self.enqueued = time.time()
+        self.started = None
+        self.cancel_event = cancel_event or threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+
+def _session_connected(session_id):
+    """False once the browser tab behind session_id has disconnected."""
+    try:
+        from streamlit.runtime import Runtime
+        return bool(Runtime.instance().is_active_session(session_id))
+    except Exception:
+        return True # No runtime (scripts, tests): nothing to cancel on
+
+
+class JobScheduler:
+    """
+    Admission control for expensive operations, shared by all sessions.
+    Jobs still run in the caller's thread; slot() only decides when they may start:
+      - bounded concurrency per class (OPERATIONS) and overall (JOB_WORKERS),
+        with INTERACTIVE_RESERVE slots kept free for clicks
+      - priority decode > embed > export, video > scan, aged so nothing waits forever
+      - within a priority, the session served least recently goes first
+      - full queues raise SchedulerBusy instead of piling up work
+    Queued jobs are cancelled when their session disconnects or cancel_session()
+    is called; running jobs see ticket.cancel_event and may stop cooperatively.
+    """
+    def __init__(self, workers=JOB_WORKERS, operations=None):
+        self.workers = workers
+        self.operations = operations or OPERATIONS
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._running = []
+        self._served = {} # session_id -> last admission time
+        self._seq = itertools.count()
+        self.stats = {op: {'admitted': 0, 'rejected': 0, 'cancelled': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+                      for op in self.operations}
+
+    def _eligible(self, ticket):
+        running_op = sum(t.op == ticket.op for t in self._running)
+        if running_op >= self.operations[ticket.op]['limit']:
+            return False
+        workers = self.workers if self.operations[ticket.op]['priority'] == 0 else self.workers - INTERACTIVE_RESERVE
+        if len(self._running) >= max(1, workers):
+            return False
+        # One job per class per session at a time (a session can't take every export slot)
+        return not any(t.session_id == ticket.session_id and t.op == ticket.op for t in self._running)
+
+    def _order_key(self, ticket, now):
+        aged = int((now - ticket.enqueued) // AGING_SECONDS)
+        return (self.operations[ticket.op]['priority'] - aged,
+                self._served.get(ticket.session_id, 0.0), ticket.seq)
+
+    def _admit(self):
+        """Starts waiting tickets while slots allow, best first. Caller holds the lock."""
+        now = time.time()
+        while True:
+            candidates = [t for t in self._waiting if self._eligible(t)]
+            if not candidates:
+                return
+            ticket = min(candidates, key=lambda t: self._order_key(t, now))
+            self._waiting.remove(ticket)
+            self._running.append(ticket)
+            ticket.started = now
+            self._served[ticket.session_id] = now
+            stats = self.stats[ticket.op]
+            stats['admitted'] += 1
+            stats['wait_seconds'] += now - ticket.enqueued
+            stats['max_wait_seconds'] = max(stats['max_wait_seconds'], now - ticket.enqueued)
+            self._cond.notify_all()
+
+    def submit(self, op, session_id, cancel_event=None):
+        """Queues a job of class op and returns its Ticket (raises SchedulerBusy if the queue is full)."""
+        with self._cond:
+            if sum(t.op == op for t in self._waiting) >= self.operations[op]['max_queue']:
+                self.stats[op]['rejected'] += 1
+                raise SchedulerBusy(f"Too many {op} jobs queued")
+            ticket = Ticket(op, session_id, next(self._seq), cancel_event)
+            self._waiting.append(ticket)
+            self._admit()
+            return ticket
+
+    def wait(self, ticket, timeout=None):
+        """Blocks until the ticket starts (True), timeout passes or it is cancelled (False)."""
+        with self._cond:
+            return self._cond.wait_for(lambda: ticket.started is not None or ticket.cancelled, timeout) \
+                and ticket.started is not None
+
+    def release(self, ticket):
+        """Ends a running job or withdraws a queued one."""
+        with self._cond:
+            if ticket in self._running:
+                self._running.remove(ticket)
+            elif ticket in self._waiting:
+                self._waiting.remove(ticket)
+                self.stats[ticket.op]['cancelled'] += 1
+            self._admit()
+            self._cond.notify_all()
+
+    def position(self, ticket):
+        """1-based place of a queued ticket in admission order (0 once it has started)."""
+        with self._cond:
+            if ticket.started is not None:
+                return 0
+            now = time.time()
+            key = self._order_key(ticket, now)
+            return 1 + sum(self._order_key(t, now) < key for t in self._waiting)
+
+    def cancel_session(self, session_id):
+        """Cancels a session's queued jobs and signals its running ones (e.g. on disconnect)."""
+        with self._cond:
+            for ticket in self._waiting + self._running:
+                if ticket.session_id == session_id:
+                    ticket.cancel_event.set()
+            self._served.pop(session_id, None)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, op, session_id, on_wait=None, cancel_event=None):
+        """
+        Holds a slot of class op for the with-block, waiting in line first.
+        on_wait(position) is called every POLL_SECONDS while queued (Streamlit calls in it
+        let a rerun or stop interrupt the wait). Raises JobCancelled if the job is cancelled
+        or the session disconnects before it starts.
+        """
+        ticket = self.submit(op, session_id, cancel_event)
+        try:
+            while not self.wait(ticket, POLL_SECONDS):
+                if ticket.cancelled or not _session_connected(session_id):
+                    raise JobCancelled(f"{op} job cancelled while queued")
+                if on_wait is not None:
+                    on_wait(self.position(ticket))
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def report(self):
+        """Per-class running/queued counts and wait statistics."""
+        with self._cond:
+            rows = []
+            for op, stats in self.stats.items():
+                admitted = stats['admitted']
+                rows.append({
+                    'op': op,
+                    'running': sum(t.op == op for t in self._running),
+                    'queued': sum(t.op == op for t in self._waiting),
+                    'admitted': admitted,
+                    'rejected': stats['rejected'],
+                    'cancelled': stats['cancelled'],
+                    'mean_wait_seconds': stats['wait_seconds'] / admitted if admitted else 0.0,
+                    'max_wait_seconds': stats['max_wait_seconds'],
+                })
+            return rows
+
+    def describe(self):
+        busy = [f"{r['op']} {r['running']}+{r['queued']}q (avg wait {r['mean_wait_seconds']:.1f}s)"
+                for r in self.report() if r['admitted'] or r['queued']]
+        return f"{len(self._running)}/{self.workers} slots busy" + (": " + ", ".join(busy) if busy else "")
+
+
+@st.cache_resource(show_spinner=False)
+def get_job_scheduler():
+    """The process-wide JobScheduler."""
+    return JobScheduler()
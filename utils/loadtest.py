@@ -0,0 +1,349 @@
+"""
+Concurrent-session load test: N simulated painters driving the real app.py.
+
+Each session is a streamlit AppTest running app.py in this process (as the
+server would), scripted through upload -> AI click -> recolor -> lasso -> 4K
+export. Browser-only pieces are replaced at their boundary: the drawable canvas
+returns scripted gestures, st_javascript reports a desktop width, and the upload
+widget returns an in-memory file. SAM is a deterministic StubPredictor with
+configurable embed/decode latency, so results reflect the app and not the model.
+
+    python -m utils.loadtest --sessions 1,4,8 --rounds 2
+    python -m utils.loadtest --sessions 16 --embed-ms 900 --decode-ms 60 --json load.json
+
+Reports p50/p95/p99 interaction latency (overall and per step), interactions/s
+and peak RSS for every session count.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+import types
+
+import cv2
+import numpy as np
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+DESKTOP_WIDTH = 1400 # Reported by the st_javascript stand-in (desktop layout)
+SCRIPT_TIMEOUT = 300 # Seconds per AppTest run (4K exports under load are slow)
+STEPS = ("upload", "click", "recolor", "lasso", "export")
+
+
+class StubPredictor:
+    """
+    Deterministic SamPredictor stand-in. set_image/predict sleep for the configured
+    latency; masks are nested flood fills around the prompt (tolerance 6/14/28),
+    so they follow the image like walls do and the app's mask code gets realistic input.
+    """
+    def __init__(self, embed_seconds=0.0, decode_seconds=0.0):
+        self.embed_seconds = embed_seconds
+        self.decode_seconds = decode_seconds
+        self.model = types.SimpleNamespace(image_encoder=types.SimpleNamespace(img_size=1024))
+        self.model_type = "stub"
+        self.is_image_set = False
+        self.features = None
+        self.original_size = None
+        self.input_size = None
+        self._image = None
+
+    def set_image(self, image, image_format="RGB"):
+        time.sleep(self.embed_seconds)
+        self._image = np.ascontiguousarray(image)
+        h, w = image.shape[:2]
+        scale = 1024 / max(h, w)
+        self.original_size = (h, w)
+        self.input_size = (int(h * scale + 0.5), int(w * scale + 0.5))
+        import torch
+        self.features = torch.zeros((1, 256, 64, 64))
+        self.is_image_set = True
+
+    def reset_image(self):
+        self.is_image_set = False
+        self.features = self._image = None
+
+    def _flood(self, x, y, tolerance):
+        h, w = self.original_size
+        fill = np.zeros((h + 2, w + 2), dtype=np.uint8)
+        x, y = min(max(int(x), 0), w - 1), min(max(int(y), 0), h - 1)
+        cv2.floodFill(self._image.copy(), fill, (x, y), 0, (tolerance,) * 3, (tolerance,) * 3,
+                      4 | cv2.FLOODFILL_MASK_ONLY | (255 << 8))
+        return fill[1:-1, 1:-1] > 0
+
+    def predict(self, point_coords=None, point_labels=None, box=None, mask_input=None,
+                multimask_output=True, return_logits=False):
+        time.sleep(self.decode_seconds)
+        h, w = self.original_size
+        if box is not None:
+            x1, y1, x2, y2 = (int(v) for v in box)
+            base = np.zeros((h, w), dtype=bool)
+            base[max(y1, 0):y2, max(x1, 0):x2] = True
+            masks = [base] * 3
+        else:
+            x, y = point_coords[0]
+            masks = [self._flood(x, y, t) for t in (6, 14, 28)]
+            # Extra points: include/exclude a small disk (enough to exercise refinement)
+            for (px, py), label in zip(point_coords[1:], point_labels[1:]):
+                disk = np.zeros((h, w), dtype=np.uint8)
+                cv2.circle(disk, (int(px), int(py)), max(h, w) // 20, 1, -1)
+                masks = [(m | disk.astype(bool)) if label else (m & ~disk.astype(bool)) for m in masks]
+        if not multimask_output:
+            masks = masks[1:2]
+        masks = np.stack(masks)
+        ih, iw = self.input_size
+        logits = np.full((len(masks), 256, 256), -8.0, dtype=np.float32)
+        for i, m in enumerate(masks):
+            small = cv2.resize(m.astype(np.uint8), (round(iw / 4), round(ih / 4)), interpolation=cv2.INTER_NEAREST)
+            logits[i, :small.shape[0], :small.shape[1]] = np.where(small > 0, 8.0, -8.0)
+        scores = np.linspace(0.9, 0.8, len(masks)).astype(np.float32)
+        return masks, scores, logits
+
+
+class _Upload(io.BytesIO):
+    """In-memory stand-in for streamlit's UploadedFile."""
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+        self.type = "image/jpeg"
+
+
+def _canvas_result(st, key, drawing_mode):
+    """st_canvas stand-in: the scripted gesture for this canvas key, if any."""
+    gesture = st.session_state.get('_loadtest_gesture')
+    json_data = None
+    if gesture and gesture['key'] == key and gesture['mode'] == drawing_mode:
+        json_data = {"objects": [gesture['object']]}
+    return types.SimpleNamespace(json_data=json_data, image_data=None)
+
+
+def install_stubs(embed_seconds, decode_seconds):
+    """
+    Replaces the browser components, the upload widget and the SAM loader for
+    this process. Must run before app.py is first executed.
+    """
+    import streamlit as st
+    from streamlit.delta_generator import DeltaGenerator
+    import paint_ai.model_registry as model_registry
+    import paint_ai.sam_loader as sam_loader
+
+    canvas_module = types.ModuleType("streamlit_drawable_canvas")
+    canvas_module.st_canvas = lambda key=None, drawing_mode="freedraw", **kwargs: _canvas_result(st, key, drawing_mode)
+    sys.modules["streamlit_drawable_canvas"] = canvas_module
+    js_module = types.ModuleType("streamlit_javascript")
+    js_module.st_javascript = lambda code, key=None: DESKTOP_WIDTH
+    sys.modules["streamlit_javascript"] = js_module
+    sys.modules.pop("ui.lasso_canvas", None) # Re-import against the canvas stand-in
+
+    original_uploader = DeltaGenerator.file_uploader
+    def file_uploader(self, label, *args, **kwargs):
+        if label == "Upload Room Image":
+            return st.session_state.get('_loadtest_upload')
+        return original_uploader(self, label, *args, **kwargs)
+    DeltaGenerator.file_uploader = file_uploader
+
+    # One runtime for all sessions, like a real server (AppTest swaps a per-run mock in and out)
+    from unittest.mock import MagicMock
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    server = MagicMock(spec=Runtime)
+    server.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/loadtest/media"))
+    server.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: server)
+    Runtime.exists = classmethod(lambda cls: True)
+    # AppTest assumes one run at a time: pin the option each run patches in and out, and
+    # share one compiled script like the server does (concurrent compiles of app.py fail)
+    import contextlib
+    from streamlit import config
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+    config.get_config_options()
+    config._set_option("global.appTest", True, "loadtest")
+    app_test.patch_config_options = lambda overrides: contextlib.nullcontext()
+    script_cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: script_cache
+
+    sam_loader.download_model_if_needed = lambda: True
+    model_registry.get_tiered_predictor = lambda request="interactive": (StubPredictor(embed_seconds, decode_seconds), "stub")
+
+
+def make_room_jpeg(seed, size=(2000, 3000)):
+    """A seeded synthetic room photo (JPEG bytes) at upload resolution."""
+    from utils.render_regression import _synthetic_room
+    image = _synthetic_room(np.random.default_rng(seed), size)
+    ok, data = cv2.imencode(".jpg", cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return data.tobytes()
+
+
+class SimulatedSession:
+    """One painter: an AppTest on app.py plus the scripted interaction sequence."""
+    def __init__(self, index, photo):
+        from streamlit.testing.v1 import AppTest
+        self.index = index
+        self.photo = photo
+        self.rng = np.random.default_rng(index)
+        self.app = AppTest.from_file(APP_PATH, default_timeout=SCRIPT_TIMEOUT)
+        self.timings = [] # (step, seconds)
+        self.errors = []
+
+    def _run(self, step, action=None):
+        start = time.perf_counter()
+        if action is not None:
+            action()
+        self.app.run()
+        self.timings.append((step, time.perf_counter() - start))
+        if self.app.exception:
+            self.errors.append(f"{step}: {self.app.exception[0].message}")
+        # The app catches crashes itself and shows them with st.error
+        self.errors.extend(f"{step}: {e.value}" for e in self.app.error)
+
+    def _gesture(self, tool, mode, obj):
+        self.app.session_state['_loadtest_gesture'] = {
+            'key': f"{tool}_{self.app.session_state['canvas_key_id']}", 'mode': mode, 'object': obj,
+        }
+
+    def _display_scale(self):
+        w, _ = self.app.session_state['base_image'].size
+        return min(w, 800) / w if w > 800 else 1.0
+
+    def play(self, rounds=1):
+        try:
+            self._play(rounds)
+        except Exception as e: # A broken step ends this session; the report lists it
+            self.errors.append(f"{type(e).__name__}: {e}")
+
+    def _play(self, rounds):
+        self.app.run() # Landing page
+        for _ in range(rounds):
+            # 1. UPLOAD (a new name each round resets the room)
+            self._run("upload", lambda: self.app.session_state.__setitem__(
+                '_loadtest_upload', _Upload(self.photo, f"room_{self.index}_{len(self.timings)}.jpg")))
+
+            # 2. AI CLICK on the wall (embeds on first click, then decodes)
+            w, h = self.app.session_state['base_image'].size
+            scale = self._display_scale()
+            x, y = self.rng.uniform(0.3, 0.5) * w, self.rng.uniform(0.2, 0.4) * h
+            self._run("click", lambda: self._gesture("click_tool", "point", {
+                'type': 'circle', 'left': x * scale - 8, 'top': y * scale - 8, 'width': 16, 'height': 16}))
+
+            # 3. RECOLOR the first painted object from the sidebar
+            for picker in self.app.color_picker:
+                if picker.key and picker.key.startswith("sidebar_h_"):
+                    color = "#%02X%02X%02X" % tuple(self.rng.integers(0, 256, 3))
+                    self._run("recolor", lambda: picker.set_value(color))
+                    break
+
+            # 4. LASSO a polygon and apply it
+            self.app.radio(key="sidebar_tool_mode").set_value("🪄 Manual Lasso (Polygon)")
+            self.app.run()
+            pts = [(0.1, 0.75), (0.45, 0.72), (0.5, 0.95), (0.08, 0.97)]
+            path = [["M", pts[0][0] * w * scale, pts[0][1] * h * scale]]
+            path += [["L", px * w * scale, py * h * scale] for px, py in pts[1:]] + [["z"]]
+            self._run("lasso", lambda: self._gesture("lasso_tool", "polygon", {
+                'type': 'path', 'path': path, 'left': 0, 'top': 0, 'strokeWidth': 0}))
+            apply = [b for b in self.app.button if b.label == "Apply Paint"]
+            if apply:
+                self._run("lasso", apply[0].click)
+            self.app.radio(key="sidebar_tool_mode").set_value("🎯 AI Click Object (Point)")
+            self.app.run()
+
+            # 5. 4K EXPORT
+            self._run("export", self.app.button(key="dl_btn_desktop").click)
+            if not self.app.get("download_button"):
+                self.errors.append("export: no download offered")
+
+
+def _percentiles(values):
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'count': 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'count': len(values)}
+
+
+def run_level(n_sessions, rounds, photo):
+    """Runs n_sessions concurrent sessions; returns latency percentiles, throughput and peak RSS."""
+    from utils.memory_utils import process_rss
+
+    import gc
+    gc.collect()
+    sessions = [SimulatedSession(i, photo) for i in range(n_sessions)]
+    baseline = process_rss()
+    peak = [baseline]
+    stop = threading.Event()
+    def sample_rss():
+        while not stop.wait(0.05):
+            peak[0] = max(peak[0], process_rss())
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=s.play, args=(rounds,)) for s in sessions]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+
+    timings = [t for s in sessions for t in s.timings]
+    return {
+        'sessions': n_sessions,
+        'interactions': len(timings),
+        'seconds': elapsed,
+        'throughput': len(timings) / elapsed,
+        'peak_rss_mb': peak[0] / 1e6,
+        'rss_per_session_mb': (peak[0] - baseline) / n_sessions / 1e6,
+        'latency': _percentiles([t for _, t in timings]),
+        'steps': {step: _percentiles([t for name, t in timings if name == step]) for step in STEPS},
+        'errors': [e for s in sessions for e in s.errors],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test app.py with simulated concurrent sessions.")
+    parser.add_argument("--sessions", default="1,2,4", help="Comma-separated concurrent session counts")
+    parser.add_argument("--rounds", type=int, default=1, help="Scenario repetitions per session")
+    parser.add_argument("--embed-ms", type=float, default=0.0, help="Stub image-encoder latency")
+    parser.add_argument("--decode-ms", type=float, default=0.0, help="Stub mask-decoder latency")
+    parser.add_argument("--image", help="Room photo to upload (default: synthetic 3000x2000)")
+    parser.add_argument("--json", help="Write the full report here")
+    args = parser.parse_args(argv)
+
+    install_stubs(args.embed_ms / 1000, args.decode_ms / 1000)
+    if args.image:
+        with open(args.image, "rb") as f:
+            photo = f.read()
+    else:
+        photo = make_room_jpeg(0)
+
+    # Drivers read session state outside a script run: silence streamlit's warning about it
+    import logging
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+
+    # Warm-up (imports, JIT, script compile) so the first level isn't charged for it
+    run_level(1, 1, photo)
+
+    report = []
+    print(f"{'sessions':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'inter/s':>8s} {'peak RSS':>9s} {'/session':>9s}  slowest step (p95)")
+    for n in (int(v) for v in args.sessions.split(",")):
+        level = run_level(n, args.rounds, photo)
+        report.append(level)
+        lat = level['latency']
+        slowest = max((s for s in level['steps'].items() if s[1]['count']), key=lambda s: s[1]['p95'])
+        print(f"{n:8d} {lat['p50'] * 1000:8.0f} {lat['p95'] * 1000:8.0f} {lat['p99'] * 1000:8.0f} "
+              f"{level['throughput']:8.2f} {level['peak_rss_mb']:7.0f}MB {level['rss_per_session_mb']:7.0f}MB  {slowest[0]} {slowest[1]['p95'] * 1000:.0f} ms")
+        for error in level['errors']:
+            print(f"    error: {error}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if any(level['errors'] for level in report) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
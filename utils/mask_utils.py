@@ -2,27 +2,74 @@ import numpy as np
 import cv2
 from PIL import Image, ImageDraw
 
-def mask_to_polygon(mask):
-    """Converts a binary mask to a polygon list."""
-    # ... implementation for saving/loading if needed
-    pass
+# Polygons use continuous image coordinates: pixel (x, y) spans [x, x+1) x [y, y+1),
+# the same convention as the fabric.js canvas. Rasterization is subpixel-precise.
+POLYGON_SHIFT = 4 # cv2.fillPoly fractional bits (1/16 px)
 
-def polygon_to_mask(polygon_data, shape):
+def mask_to_polygon(mask, epsilon=1.0):
     """
-    Converts Streamlit Canvas polygon data to a binary mask.
-    polygon_data: List of objects from fabric.js
-    shape: (height, width)
+    Converts a binary mask to simplified polygons (outer boundaries and holes).
+    Returns a list of (N, 2) float32 arrays in image coordinates; polygon_to_mask
+    fills them back (holes included). epsilon: Douglas-Peucker tolerance in pixels.
+    """
+    mask_uint8 = np.asarray(mask, dtype=np.uint8)
+    contours, _ = cv2.findContours(mask_uint8, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    polygons = []
+    for contour in contours:
+        if epsilon > 0:
+            contour = cv2.approxPolyDP(contour, epsilon, True)
+        if len(contour) >= 3:
+            # Contours run through pixel centres
+            polygons.append(contour.reshape(-1, 2).astype(np.float32) + 0.5)
+    return polygons
+
+def fabric_object_to_polygon(obj):
+    """
+    Vertices of a fabric.js polygon/path object (streamlit-drawable-canvas json_data)
+    in canvas coordinates, or None for other object types. Moves/scales applied with
+    the transform tool are honoured (rotation is not used by the lasso).
+    """
+    kind = obj.get("type")
+    if kind == "path":
+        # [["M", x, y], ["L", x, y], ..., ["z"]]: the last coordinate pair of each command is its end point
+        points = [cmd[-2:] for cmd in obj.get("path", []) if len(cmd) >= 3]
+    elif kind == "polygon":
+        points = [[p["x"], p["y"]] for p in obj.get("points", [])]
+    else:
+        return None
+    if len(points) < 3:
+        return None
+
+    points = np.array(points, dtype=np.float64)
+    # Object origin is the top-left of its stroked bounding box
+    half_stroke = obj.get("strokeWidth", 0) / 2
+    origin = points.min(axis=0)
+    offset = np.array([obj.get("left", origin[0] - half_stroke) + half_stroke,
+                       obj.get("top", origin[1] - half_stroke) + half_stroke])
+    scale = np.array([obj.get("scaleX", 1.0), obj.get("scaleY", 1.0)])
+    return (points - origin) * scale + offset
+
+def polygon_to_mask(polygon_data, shape, scale=1.0):
+    """
+    Rasterizes polygons straight to a binary mask at any resolution.
+    polygon_data: fabric.js objects from the canvas json_data, or (N, 2) point arrays
+    shape: (height, width) of the output mask
+    scale: output pixels per polygon unit (e.g. 4K width / canvas width)
     """
     mask = np.zeros(shape, dtype=np.uint8)
     
-    # If using fabric.js output from streamlit-drawable-canvas
-    # The 'path' or 'objects' need parsing.
-    # Assuming we get a list of points or a path string.
+    polygons = []
+    for item in polygon_data or []:
+        points = fabric_object_to_polygon(item) if isinstance(item, dict) else np.asarray(item, dtype=np.float64)
+        if points is None or len(points) < 3:
+            continue
+        # Continuous coordinates -> pixel centres, in 1/16 px fixed point
+        fixed = np.round((points * scale - 0.5) * (1 << POLYGON_SHIFT)).astype(np.int32)
+        polygons.append(fixed.reshape(-1, 1, 2))
     
-    # Actually, streamlit-drawable-canvas returns an image_data numpy array!
-    # If we use the polygon tool, the alpha channel of the returned image 
-    # effectively acts as the mask.
-    pass
+    if polygons:
+        cv2.fillPoly(mask, polygons, 1, lineType=cv2.LINE_8, shift=POLYGON_SHIFT)
+    return mask.astype(bool)
 
 def merge_masks(base_mask, new_mask, operation="add"):
     """
@@ -35,21 +82,28 @@ def merge_masks(base_mask, new_mask, operation="add"):
         return np.logical_and(base_mask, np.logical_not(new_mask))
     return base_mask
 
-def smooth_mask(mask):
-    """Applies morphological operations to smooth mask edges and fill holes (fixes 'bleaching' in thin regions)."""
+def smooth_mask(mask, scale=1.0):
+    """
+    Applies morphological operations to smooth mask edges and fill holes (fixes 'bleaching' in thin regions).
+    scale: mask resolution relative to the preview (kernels grow with it, so an export-size
+    mask gets the same smoothing as its preview).
+    """
     mask_uint8 = (mask * 255).astype(np.uint8)
-    
+
+    def ksize(base):
+        return max(1, int(round(base * scale)) | 1) # Odd, at least 1
+
     # 1. Median Blur to remove salt-and-pepper noise
-    mask_uint8 = cv2.medianBlur(mask_uint8, 5) # Increased blur for smoother base
+    mask_uint8 = cv2.medianBlur(mask_uint8, ksize(5)) # Increased blur for smoother base
     
     # 2. Closing to fill small/medium holes (Artifact reduction)
     # Reducing slightly from 11x11 to avoid merging distinct objects too aggressively
-    kernel_close = np.ones((9,9), np.uint8)
+    kernel_close = np.ones((ksize(9), ksize(9)), np.uint8)
     closing = cv2.morphologyEx(mask_uint8, cv2.MORPH_CLOSE, kernel_close)
     
     # 3. Slight Dilation (Expand) instead of Open (Erode)
     # Reduced back to 3x3 to prevent "spilling" over edges (like windows/roofs)
-    kernel_dilate = np.ones((3,3), np.uint8)
+    kernel_dilate = np.ones((ksize(3), ksize(3)), np.uint8)
     dilated = cv2.dilate(closing, kernel_dilate, iterations=1)
     
     return dilated > 127
@@ -72,3 +126,23 @@ def dilate_mask(mask, kernel_size=3):
     kernel = np.ones((kernel_size, kernel_size), np.uint8)
     dilated = cv2.dilate(mask_uint8, kernel, iterations=1)
     return dilated > 127
+
+def mask_to_rle(mask):
+    """
+    Run-length encodes a binary mask (row-major).
+    Returns uint32 run lengths, alternating background/foreground, starting with background.
+    """
+    flat = np.asarray(mask, dtype=bool).ravel()
+    # Indices where the value changes, plus both ends
+    change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    bounds = np.concatenate([[0], change, [flat.size]])
+    runs = np.diff(bounds)
+    if flat.size and flat[0]:
+        runs = np.concatenate([[0], runs]) # First run is always background
+    return runs.astype(np.uint32)
+
+def rle_to_mask(runs, shape):
+    """Decodes mask_to_rle output back to a boolean mask of the given (height, width)."""
+    values = np.zeros(len(runs), dtype=bool)
+    values[1::2] = True
+    return np.repeat(values, runs.astype(np.intp)).reshape(shape)
@@ -0,0 +1,141 @@
+import gc
+import os
+import threading
+import time
+
+import streamlit as st
+
+from utils.memory_utils import cgroup_memory_limit, cgroup_memory_usage, process_rss
+
+# Pressure levels, from the fraction of the memory limit in use
+NORMAL, ELEVATED, HIGH, CRITICAL = range(4)
+LEVEL_NAMES = ("normal", "elevated", "high", "critical")
+# VISUALIZER_MEMORY_THRESHOLDS: usage fractions where ELEVATED, HIGH and CRITICAL start
+THRESHOLDS = tuple(float(v) for v in os.environ.get("VISUALIZER_MEMORY_THRESHOLDS", "0.70,0.85,0.93").split(","))
+# Explicit limit for hosts without a cgroup limit (default: physical memory)
+MEMORY_LIMIT_MB = int(os.environ.get("VISUALIZER_MEMORY_LIMIT_MB", "0"))
+# A session holding more than this is degraded on its own, whatever the node's pressure
+SESSION_BUDGET_BYTES = int(os.environ.get("VISUALIZER_SESSION_BUDGET_MB", "512")) * 1024 * 1024
+# Under ELEVATED pressure, sessions idle this long spill (instead of SPILL_IDLE_SECONDS)
+ELEVATED_IDLE_SECONDS = 120
+# Even under HIGH pressure, a session idle for less than this keeps its arrays: spilling
+# one between two clicks only moves the cost to disk reads on its next run
+PRESSURE_IDLE_SECONDS = 30
+CHECK_INTERVAL_SECONDS = 2.0
+# Preview longest-side scale per level (applies to newly opened images; masks are tied to the preview)
+PREVIEW_SCALE = (1.0, 1.0, 0.75, 0.5)
+MIN_PREVIEW_SIDE = 320
+# Tiled exports hold the image plus one strip of lighting maps instead of full-size maps
+EXPORT_TILE_ROWS = int(os.environ.get("VISUALIZER_EXPORT_TILE_ROWS", "512"))
+EXPORT_BYTES_PER_PIXEL = 50 # Untiled render peak (~27 fused, ~54 NumPy): image, result, lighting maps, temporaries
+
+
+def _physical_memory():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError):
+        return None
+
+
+def memory_status():
+    """
+    (used, limit) in bytes: container usage against its cgroup limit, else this
+    process's RSS against VISUALIZER_MEMORY_LIMIT_MB or physical memory.
+    """
+    limit = cgroup_memory_limit()
+    used = cgroup_memory_usage() if limit is not None else None
+    if limit is None:
+        limit = MEMORY_LIMIT_MB * 1024 * 1024 or _physical_memory()
+    if used is None:
+        used = process_rss()
+    return used, limit
+
+
+def pressure_level(used, limit):
+    if not limit:
+        return NORMAL
+    fraction = used / limit
+    return sum(fraction >= t for t in THRESHOLDS)
+
+
+class MemoryGovernor:
+    """
+    Turns memory pressure into graceful degradation instead of OOM kills.
+    check() runs once per script run (throttled) and escalates:
+      ELEVATED  spill sessions idle > ELEVATED_IDLE_SECONDS
+      HIGH      spill sessions idle > PRESSURE_IDLE_SECONDS, smaller previews, tiled exports
+      CRITICAL  also drop the active session's caches
+    A session over SESSION_BUDGET_BYTES loses its own caches at any level. Sessions
+    with a run in progress are never spilled (SessionStore.run holds them).
+    """
+    def __init__(self, store):
+        self.store = store
+        self.level = NORMAL
+        self.used = 0
+        self.limit = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def check(self, session_id, force=False):
+        """Measures pressure, acts on it, and returns the current level."""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_check < CHECK_INTERVAL_SECONDS:
+                return self.level
+            self._last_check = now
+        self.used, self.limit = memory_status()
+        self.level = pressure_level(self.used, self.limit)
+
+        if self.level >= HIGH:
+            self.store.sweep(exclude=session_id, idle_seconds=PRESSURE_IDLE_SECONDS)
+        elif self.level >= ELEVATED:
+            self.store.sweep(exclude=session_id, idle_seconds=ELEVATED_IDLE_SECONDS)
+        if self.level >= CRITICAL or self.store.session_bytes(session_id) > SESSION_BUDGET_BYTES:
+            self.store.evict_caches(session_id)
+        if self.level >= HIGH:
+            gc.collect()
+        return self.level
+
+    def relieve(self, session_id):
+        """Frees everything freeable right now (after a MemoryError), running sessions excepted."""
+        self.store.sweep(exclude=session_id, idle_seconds=0)
+        self.store.evict_caches(session_id)
+        gc.collect()
+
+    def preview_max_side(self, base):
+        """Preview size for a newly opened image at the current pressure."""
+        return max(MIN_PREVIEW_SIDE, int(base * PREVIEW_SCALE[self.level]))
+
+    def export_tile_rows(self, size):
+        """Strip height for a full-resolution export of size=(w, h), or None to render in one pass."""
+        if self.level >= HIGH:
+            return EXPORT_TILE_ROWS
+        w, h = size
+        headroom = (self.limit - self.used) if self.limit else None
+        if headroom is not None and w * h * EXPORT_BYTES_PER_PIXEL > headroom:
+            return EXPORT_TILE_ROWS
+        return None
+
+    def describe(self):
+        limit = f"{self.limit / 1e6:.0f} MB" if self.limit else "unknown"
+        return f"{self.used / 1e6:.0f} MB / {limit} ({LEVEL_NAMES[self.level]})"
+
+
+def retry_on_memory_error(fn, session_id):
+    """
+    Runs fn(); after an allocation failure frees what the governor can and retries once.
+    OpenCV reports its own failed allocations as cv2.error, not MemoryError.
+    """
+    import cv2
+    try:
+        return fn()
+    except (MemoryError, cv2.error):
+        get_memory_governor().relieve(session_id)
+        return fn()
+
+
+@st.cache_resource(show_spinner=False)
+def get_memory_governor():
+    """The process-wide MemoryGovernor."""
+    from utils.session_store import get_session_store
+    return MemoryGovernor(get_session_store())
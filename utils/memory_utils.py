@@ -0,0 +1,89 @@
+import os
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+        return None if value in ("", "max") else int(value)
+    except (OSError, ValueError):
+        return None
+
+
+def cgroup_memory_limit():
+    """Container memory limit in bytes (cgroup v2, then v1), or None if unlimited."""
+    limit = _read_int("/sys/fs/cgroup/memory.max")
+    if limit is None:
+        limit = _read_int("/sys/fs/cgroup/memory/memory.limit_in_bytes")
+        # v1 reports a huge sentinel when unlimited
+        if limit is not None and limit >= 1 << 60:
+            limit = None
+    return limit
+
+
+def _read_stat(path, key):
+    """One counter of a cgroup memory.stat file, or None."""
+    try:
+        with open(path) as f:
+            for line in f:
+                name, _, value = line.partition(" ")
+                if name == key:
+                    return int(value)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def cgroup_memory_usage():
+    """
+    Container working set in bytes (cgroup v2, then v1), or None outside a cgroup.
+    Like the kubelet's eviction signal, this is usage minus inactive file cache:
+    spool files, spill memmaps, cached exports and mmapped checkpoints fill the page
+    cache, which the kernel reclaims before it OOM-kills anything.
+    """
+    usage = _read_int("/sys/fs/cgroup/memory.current")
+    inactive = _read_stat("/sys/fs/cgroup/memory.stat", "inactive_file")
+    if usage is None:
+        usage = _read_int("/sys/fs/cgroup/memory/memory.usage_in_bytes")
+        inactive = _read_stat("/sys/fs/cgroup/memory/memory.stat", "total_inactive_file")
+    if usage is None:
+        return None
+    return max(usage - (inactive or 0), 0)
+
+
+def process_rss():
+    """Resident set size of this process in bytes (0 if unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def system_available_memory():
+    """MemAvailable from /proc/meminfo in bytes, or None if unavailable."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_memory():
+    """
+    Bytes this process can still allocate: the tighter of the container's
+    headroom and the host's MemAvailable. None when neither is known.
+    """
+    candidates = []
+    limit = cgroup_memory_limit()
+    usage = cgroup_memory_usage()
+    if limit is not None and usage is not None:
+        candidates.append(max(limit - usage, 0))
+    host = system_available_memory()
+    if host is not None:
+        candidates.append(host)
+    return min(candidates) if candidates else None
@@ -1,40 +1,271 @@
+import hashlib
+import json
 import os
+import time
+
+import requests
 import streamlit as st
-import urllib.request
 
-def ensure_sam_model_exists(model_type, model_path):
+# Where checkpoints live. Defaults to the working directory (where they always were);
+# point VISUALIZER_MODEL_DIR at a shared volume so every worker on a host uses one copy.
+MODEL_DIR = os.environ.get("VISUALIZER_MODEL_DIR", ".")
+
+# Official SAM checkpoints with their published SHA-256. The hash computed at download
+# time is also recorded next to the file and used to validate it afterwards.
+# package: module providing sam_model_registry for the type; memory_mb: rough
+# resident size once loaded (weights + working set), used for tier selection.
+MODEL_ARTIFACTS = {
+    "vit_t": {
+        "url": "https://github.com/ChaoningZhang/MobileSAM/raw/master/weights/mobile_sam.pt",
+        "filename": "mobile_sam.pt",
+        "sha256": "6dbb90523a35330fedd7f1d3dfc66f995213d81b29a5ca8108dbcdd4e37d6c2f",
+        "size_label": "40MB",
+        "package": "mobile_sam",
+        "memory_mb": 150,
+    },
+    "vit_h": {
+        "url": "https://dl.fbaipublicfiles.com/segment_anything/sam_vit_h_4b8939.pth",
+        "filename": "sam_vit_h_4b8939.pth",
+        "sha256": "a7bf3b02f3ebf1267aba913ff637d9a2d5c33d3173bb679e46d9f338c26f262e",
+        "size_label": "2.5GB",
+        "package": "segment_anything",
+        "memory_mb": 3500,
+    },
+    "vit_l": {
+        "url": "https://dl.fbaipublicfiles.com/segment_anything/sam_vit_l_0b31ee.pth",
+        "filename": "sam_vit_l_0b31ee.pth",
+        "sha256": "3adcc4315b642a4d2101128f611684e8734c41232a17c648ed1693702a49a622",
+        "size_label": "1.2GB",
+        "package": "segment_anything",
+        "memory_mb": 1900,
+    },
+    "vit_b": {
+        "url": "https://dl.fbaipublicfiles.com/segment_anything/sam_vit_b_01ec64.pth",
+        "filename": "sam_vit_b_01ec64.pth",
+        "sha256": "ec2df62732614e57411cdcf32a23ffdf28910380d03139ee0f4fcbe91eb8c912",
+        "size_label": "375MB",
+        "package": "segment_anything",
+        "memory_mb": 700,
+    },
+}
+
+CHUNK_SIZE = 4 * 1024 * 1024  # 4MB reads: far fewer syscalls than 8KB
+LOCK_STALE_SECONDS = 120  # a lock whose holder hasn't refreshed it for this long is abandoned
+LOCK_HEARTBEAT_SECONDS = 10  # how often the holder refreshes the lock's mtime
+
+
+def get_model_dir():
+    """Returns the checkpoint cache directory, creating it if needed."""
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    return MODEL_DIR
+
+
+def get_model_path(model_type):
+    """Local path of the checkpoint for a model type."""
+    return os.path.join(get_model_dir(), MODEL_ARTIFACTS[model_type]["filename"])
+
+
+def _meta_path(path):
+    return path + ".meta.json"
+
+
+def file_sha256(path):
+    """SHA-256 of a file, read in large blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def verify_artifact(path, sha256=None, full=False):
+    """
+    Checks a downloaded artifact.
+    Quick mode compares the size against the recorded metadata (catches truncation);
+    full mode re-hashes the file. Files without metadata (pre-existing manual
+    copies) are hashed once against the expected sha256 and the result recorded;
+    without an expected sha256 they fail, since nothing vouches for them.
+    """
+    if not os.path.exists(path):
+        return False
+
+    meta = {}
+    if os.path.exists(_meta_path(path)):
+        try:
+            with open(_meta_path(path)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+
+    if meta.get("size") is not None and os.path.getsize(path) != meta["size"]:
+        return False
+
+    if sha256 and meta.get("sha256") and meta["sha256"] != sha256:
+        return False
+    expected = sha256 or meta.get("sha256")
+    if not expected:
+        return False
+    if full or not meta:
+        if file_sha256(path) != expected:
+            return False
+        if not meta:
+            # Record the verified copy so later quick checks don't re-hash it
+            with open(_meta_path(path), "w") as f:
+                json.dump({"url": None, "sha256": expected, "size": os.path.getsize(path)}, f)
+    return True
+
+
+def _acquire_lock(lock_path, timeout):
+    """
+    Creates lock_path exclusively, waiting while another worker holds it and taking
+    over abandoned locks. The holder refreshes the lock's mtime (_refresh_lock) while
+    it works, so a lock that stopped being refreshed belongs to a dead worker, even
+    when it died before writing a byte. The caller re-checks the file once acquired.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            with os.fdopen(fd, "w") as f:
+                f.write(str(os.getpid()))
+            return True
+        except FileExistsError:
+            pass
+
+        # Stale lock: the owner stopped refreshing it
+        try:
+            if time.time() - os.path.getmtime(lock_path) > LOCK_STALE_SECONDS:
+                os.remove(lock_path)
+                continue
+        except FileNotFoundError:
+            continue
+
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out waiting for {lock_path}")
+        time.sleep(1.0)
+
+
+def _refresh_lock(lock_path):
+    """Heartbeat: marks the lock as still held by a live worker."""
+    try:
+        os.utime(lock_path)
+    except FileNotFoundError:
+        pass
+
+
+def fetch_artifact(url, dest_path, sha256=None, progress=None, timeout=30, lock_timeout=3600):
     """
-    Checks if the SAM model file exists. If not, provides a download button or auto-downloads.
+    Downloads url to dest_path safely:
+      - resumes a previous partial download (<dest>.part) via an HTTP Range request,
+      - verifies size and SHA-256,
+      - publishes with an atomic rename, so dest_path is either absent or complete,
+      - holds <dest>.lock so concurrent workers don't download the same file twice.
+    progress(downloaded_bytes, total_bytes) is called after every chunk.
+    Returns dest_path. Raises on network errors or checksum mismatch.
     """
-    if os.path.exists(model_path):
+    if verify_artifact(dest_path, sha256):
+        return dest_path
+
+    os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+    part_path = dest_path + ".part"
+    lock_path = dest_path + ".lock"
+
+    _acquire_lock(lock_path, lock_timeout)
+    try:
+        # Another worker may have completed it while we waited for the lock
+        if verify_artifact(dest_path, sha256):
+            return dest_path
+
+        # 1. Resume from the partial file if the server supports ranges
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        response = requests.get(url, stream=True, headers=headers, timeout=timeout)
+        if response.status_code == 416:
+            # Range not satisfiable: the partial file is already complete (or bogus)
+            response.close()
+            offset = os.path.getsize(part_path)
+            total_size = offset
+        else:
+            response.raise_for_status()
+            if offset and response.status_code != 206:
+                offset = 0  # Server ignored the Range header: start over
+            total_size = int(response.headers.get("content-length", 0))
+            if total_size:
+                total_size += offset
+
+            # 2. Stream to the temp file in large chunks
+            downloaded = offset
+            heartbeat = time.monotonic()
+            with open(part_path, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    downloaded += len(chunk)
+                    if progress:
+                        progress(downloaded, total_size)
+                    if time.monotonic() - heartbeat > LOCK_HEARTBEAT_SECONDS:
+                        _refresh_lock(lock_path)
+                        heartbeat = time.monotonic()
+                f.flush()
+                os.fsync(f.fileno())
+
+        # 3. Verify (hashing 2.5GB takes a while: refresh the lock first)
+        _refresh_lock(lock_path)
+        actual_size = os.path.getsize(part_path)
+        if total_size and actual_size != total_size:
+            raise IOError(f"Incomplete download: {actual_size} of {total_size} bytes")
+        digest = file_sha256(part_path)
+        if sha256 and digest != sha256:
+            os.remove(part_path)
+            raise ValueError(f"Checksum mismatch for {url}: got {digest}, expected {sha256}")
+
+        # 4. Publish atomically (metadata first, so the file never appears unverified)
+        with open(_meta_path(dest_path), "w") as f:
+            json.dump({"url": url, "sha256": digest, "size": actual_size}, f)
+        os.replace(part_path, dest_path)
+        return dest_path
+    finally:
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+
+def fetch_model(model_type, progress=None):
+    """Downloads (if needed) and verifies the checkpoint for a model type. Returns its path."""
+    artifact = MODEL_ARTIFACTS[model_type]
+    return fetch_artifact(
+        artifact["url"], get_model_path(model_type), artifact["sha256"], progress=progress
+    )
+
+
+def ensure_sam_model_exists(model_type, model_path=None):
+    """
+    Checks if the SAM model file exists. If not, provides a download button.
+    """
+    if model_path is None and model_type in MODEL_ARTIFACTS:
+        model_path = get_model_path(model_type)
+    if model_path and verify_artifact(model_path, MODEL_ARTIFACTS.get(model_type, {}).get("sha256")):
         return True
-    
+
     st.warning(f"⚠️ SAM Model file ({model_path}) not found!")
-    
-    # Define official URLs
-    urls = {
-        "vit_h": "https://dl.fbaipublicfiles.com/segment_anything/sam_vit_h_4b8939.pth",
-        "vit_b": "https://dl.fbaipublicfiles.com/segment_anything/sam_vit_b_01ec64.pth",
-        "vit_l": "https://dl.fbaipublicfiles.com/segment_anything/sam_vit_l_0b31ee.pth"
-    }
-    
-    url = urls.get(model_type)
-    if not url:
+
+    artifact = MODEL_ARTIFACTS.get(model_type)
+    if not artifact:
         st.error("Unknown model type. Cannot download.")
         return False
-    
-    st.info(f"The AI model is too large for GitHub (2.5GB). You need to download it to the server.")
-    
-    if st.button(f"📥 Download {model_type} Model (2.5GB)"):
+
+    size_label = artifact["size_label"]
+    st.info(f"The AI model is too large for GitHub ({size_label}). You need to download it to the server.")
+
+    if st.button(f"📥 Download {model_type} Model ({size_label})"):
         with st.status(f"Downloading {model_type} model... this will take a few minutes.", expanded=True) as status:
             try:
-                def report(block_num, block_size, total_size):
-                    read_so_far = block_num * block_size
+                def report(downloaded, total_size):
                     if total_size > 0:
-                        percent = read_so_far * 1e2 / total_size
+                        percent = downloaded * 1e2 / total_size
                         status.update(label=f"Downloading: {percent:.1f}% done", state="running")
-                
-                urllib.request.urlretrieve(url, model_path, reporthook=report)
+
+                fetch_artifact(artifact["url"], model_path, artifact["sha256"], progress=report)
                 status.update(label="✅ Download Complete!", state="complete")
                 st.success("Model downloaded! The app will now reload.")
                 st.rerun()
@@ -42,5 +273,5 @@ def ensure_sam_model_exists(model_type, model_path):
                 st.error(f"Download failed: {e}")
                 status.update(label="❌ Download Failed", state="error")
                 return False
-    
+
     return False
@@ -0,0 +1,146 @@
+import hashlib
+import io
+import json
+import zipfile
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.mask_utils import mask_to_rle, rle_to_mask, polygon_to_mask
+
+# Project file (.vizproj): a zip archive
+#   project.json   version, image hash/sizes, wall assignments, object prompt points, lasso polygons
+#   masks.npz      run-length encoded masks (preview resolution; lasso masks are re-rasterized instead)
+#   prompts.npz    float16 low-res SAM logits per refined object
+#   image.jpg      the uploaded image as stored for export (full_res_bytes)
+#   preview.png    the exact preview the masks and embedding belong to (lossless)
+#   embedding.npz  optional float16 SAM image embedding: loading skips the encoder
+PROJECT_VERSION = 1
+PROJECT_EXTENSION = "vizproj"
+
+
+def _npz_bytes(arrays):
+    buf = io.BytesIO()
+    np.savez(buf, **arrays)
+    return buf.getvalue()
+
+
+def _assignment_to_json(data):
+    out = dict(data)
+    if 'lab' in out:
+        out['lab'] = [int(v) for v in np.asarray(out['lab']).ravel()]
+    return out
+
+
+def _assignment_from_json(data):
+    out = dict(data)
+    if 'lab' in out:
+        out['lab'] = np.array(out['lab'], dtype=np.uint8)
+    return out
+
+
+def save_project(state, full_res_bytes, base_image, embedding=None):
+    """
+    Serializes a room (masks, assignments, refinement prompts, images and
+    optionally the SAM embedding from sam_loader.export_embedding) to project bytes.
+    """
+    preview = np.array(base_image)
+    height, width = preview.shape[:2]
+    masks = state.get('masks', [])
+    prompts = state.get('object_prompts', {})
+    polygons = state.get('mask_polygons', {})
+
+    # 1. METADATA (JSON keys are strings: mask indices are restored to ints on load)
+    meta = {
+        'version': PROJECT_VERSION,
+        'image_sha256': hashlib.sha256(full_res_bytes).hexdigest(),
+        'preview_size': [width, height],
+        'mask_count': len(masks),
+        'wall_assignments': {str(k): _assignment_to_json(v) for k, v in state.get('wall_assignments', {}).items()},
+        'object_prompts': {
+            str(k): {'points': v['points'], 'labels': v['labels'], 'frame': list(v['frame']),
+                     'has_logits': v.get('logits') is not None}
+            for k, v in prompts.items()
+        },
+        'mask_polygons': {str(k): [np.round(p, 4).tolist() for p in v] for k, v in polygons.items()},
+        'segmentation_mode': state.get('segmentation_mode', 'Walls (Default)'),
+        'embedding': None,
+    }
+
+    # 2. ARRAYS
+    rle = {f"mask_{i}": mask_to_rle(m) for i, m in enumerate(masks) if i not in polygons}
+    logits = {f"obj_{k}": v['logits'] for k, v in prompts.items() if v.get('logits') is not None}
+    ok, preview_png = cv2.imencode(".png", cv2.cvtColor(preview, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    if not ok:
+        raise ValueError("Could not encode the preview image")
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        zf.writestr("masks.npz", _npz_bytes(rle))
+        zf.writestr("prompts.npz", _npz_bytes(logits))
+        # Already-compressed payloads are stored as-is
+        zf.writestr("image.jpg", full_res_bytes, compress_type=zipfile.ZIP_STORED)
+        zf.writestr("preview.png", preview_png.tobytes(), compress_type=zipfile.ZIP_STORED)
+        if embedding is not None:
+            meta['embedding'] = {k: v for k, v in embedding.items() if k != 'features'}
+            zf.writestr("embedding.npz", _npz_bytes({'features': embedding['features']}))
+        zf.writestr("project.json", json.dumps(meta))
+    return buf.getvalue()
+
+
+def load_project(data):
+    """
+    Reads project bytes. Returns a dict with 'state' (masks, wall_assignments,
+    object_prompts, mask_polygons, segmentation_mode), 'full_res_bytes', 'base_image' (PIL),
+    'image_sha256' and 'embedding' (snapshot for sam_loader.restore_embedding, or None).
+    Raises ValueError for files that are not projects of a supported version.
+    """
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise ValueError("Not a project file")
+
+    with zf:
+        names = set(zf.namelist())
+        if "project.json" not in names:
+            raise ValueError("Not a project file")
+        meta = json.loads(zf.read("project.json"))
+        if meta.get('version', 0) > PROJECT_VERSION:
+            raise ValueError(f"Project version {meta.get('version')} is newer than this app supports")
+
+        full_res_bytes = zf.read("image.jpg")
+        preview = cv2.imdecode(np.frombuffer(zf.read("preview.png"), np.uint8), cv2.IMREAD_COLOR)
+        base_image = Image.fromarray(cv2.cvtColor(preview, cv2.COLOR_BGR2RGB))
+        width, height = meta['preview_size']
+
+        mask_polygons = {int(k): [np.array(p, dtype=np.float32) for p in v]
+                         for k, v in meta.get('mask_polygons', {}).items()}
+        with np.load(io.BytesIO(zf.read("masks.npz"))) as rle:
+            masks = [polygon_to_mask(mask_polygons[i], (height, width)) if i in mask_polygons
+                     else rle_to_mask(rle[f"mask_{i}"], (height, width)) for i in range(meta['mask_count'])]
+        with np.load(io.BytesIO(zf.read("prompts.npz"))) as logits:
+            object_prompts = {
+                int(k): {'points': v['points'], 'labels': v['labels'], 'frame': tuple(v['frame']),
+                         'logits': logits[f"obj_{k}"] if v['has_logits'] else None}
+                for k, v in meta['object_prompts'].items()
+            }
+
+        embedding = None
+        if meta.get('embedding') and "embedding.npz" in names:
+            with np.load(io.BytesIO(zf.read("embedding.npz"))) as emb:
+                embedding = dict(meta['embedding'], features=emb['features'])
+
+    return {
+        'state': {
+            'masks': masks,
+            'wall_assignments': {int(k): _assignment_from_json(v) for k, v in meta['wall_assignments'].items()},
+            'object_prompts': object_prompts,
+            'mask_polygons': mask_polygons,
+            'segmentation_mode': meta.get('segmentation_mode', 'Walls (Default)'),
+        },
+        'full_res_bytes': full_res_bytes,
+        'base_image': base_image,
+        'image_sha256': meta['image_sha256'],
+        'embedding': embedding,
+    }
@@ -0,0 +1,122 @@
+import cv2
+import numpy as np
+
+
+class RegionGraph:
+    """
+    Superpixel region graph of one image, built once per upload.
+    labels:     (H, W) superpixel id per pixel (uint16 when it fits)
+    mean_lab:   (N, 3) mean colour per superpixel in true CIELAB (L 0-100, a/b signed)
+    counts:     (N,) pixel count per superpixel
+    adj_indptr, adj_indices: CSR adjacency (4-connected neighbours)
+    """
+    def __init__(self, labels, mean_lab, counts, adj_indptr, adj_indices):
+        self.labels = labels
+        self.mean_lab = mean_lab
+        self.counts = counts
+        self.adj_indptr = adj_indptr
+        self.adj_indices = adj_indices
+
+    @property
+    def n_regions(self):
+        return len(self.counts)
+
+    def neighbors(self, region):
+        return self.adj_indices[self.adj_indptr[region]:self.adj_indptr[region + 1]]
+
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.labels, self.mean_lab, self.counts, self.adj_indptr, self.adj_indices))
+
+
+def _cv2_lab_to_cielab(lab_u8):
+    """OpenCV 8-bit LAB -> true CIELAB floats."""
+    lab = lab_u8.astype(np.float32)
+    lab[..., 0] *= 100.0 / 255.0
+    lab[..., 1:] -= 128.0
+    return lab
+
+
+def build_region_graph(image_rgb, n_segments=800, compactness=10.0):
+    """
+    Computes SLIC superpixels over the LAB image plus their adjacency and mean colours.
+    ~800 regions on a 700px preview: snapping/growing then works on a few hundred
+    nodes instead of hundreds of thousands of pixels.
+    """
+    from skimage.segmentation import slic
+
+    if not isinstance(image_rgb, np.ndarray):
+        image_rgb = np.array(image_rgb)
+
+    lab = _cv2_lab_to_cielab(cv2.cvtColor(image_rgb, cv2.COLOR_RGB2LAB))
+    labels = slic(lab, n_segments=n_segments, compactness=compactness,
+                  start_label=0, convert2lab=False, channel_axis=-1)
+
+    # Contiguous ids (SLIC can leave gaps after enforcing connectivity)
+    _, labels = np.unique(labels, return_inverse=True)
+    labels = labels.reshape(image_rgb.shape[:2])
+    n = int(labels.max()) + 1
+    labels = labels.astype(np.uint16 if n <= np.iinfo(np.uint16).max else np.int32)
+
+    # 1. Region statistics (vectorized with bincount)
+    flat = labels.ravel().astype(np.intp)
+    counts = np.bincount(flat, minlength=n)
+    mean_lab = np.stack([
+        np.bincount(flat, weights=lab[..., c].ravel(), minlength=n) for c in range(3)
+    ], axis=1) / np.maximum(counts, 1)[:, None]
+
+    # 2. Adjacency from horizontally/vertically neighbouring pixels with different labels
+    pairs = []
+    for a, b in ((labels[:, :-1], labels[:, 1:]), (labels[:-1, :], labels[1:, :])):
+        differ = a != b
+        pairs.append(np.stack([a[differ], b[differ]], axis=1).astype(np.int64))
+    pairs = np.concatenate(pairs)
+    pairs = np.concatenate([pairs, pairs[:, ::-1]])
+    pairs = np.unique(pairs[:, 0] * n + pairs[:, 1])
+    src, dst = pairs // n, pairs % n
+
+    adj_indptr = np.zeros(n + 1, dtype=np.int32)
+    np.cumsum(np.bincount(src, minlength=n), out=adj_indptr[1:])
+    adj_indices = dst.astype(np.int32) # Already sorted by src (unique sorts the encoded pairs)
+
+    return RegionGraph(labels, mean_lab.astype(np.float32), counts.astype(np.int32), adj_indptr, adj_indices)
+
+
+def region_coverage(graph, mask):
+    """Fraction of each superpixel covered by a boolean mask."""
+    covered = np.bincount(graph.labels[mask].astype(np.intp), minlength=graph.n_regions)
+    return covered / np.maximum(graph.counts, 1)
+
+
+def snap_mask_to_regions(graph, mask, min_coverage=0.5):
+    """
+    Snaps a rough selection (e.g. a lasso polygon) to superpixel boundaries:
+    keeps every superpixel that is at least min_coverage inside the selection.
+    """
+    selected = region_coverage(graph, mask) >= min_coverage
+    return selected[graph.labels]
+
+
+def grow_region(graph, seed_mask, max_delta_e=8.0, min_coverage=0.5):
+    """
+    "Grow similar region": breadth-first traversal of the region graph from the
+    superpixels under seed_mask, absorbing neighbours whose mean colour is within
+    max_delta_e (CIE76) of the seed's mean colour. Returns a boolean mask.
+    """
+    seeds = np.flatnonzero(region_coverage(graph, seed_mask) >= min_coverage)
+    if seeds.size == 0:
+        return seed_mask
+
+    weights = graph.counts[seeds].astype(np.float64)
+    seed_lab = (graph.mean_lab[seeds] * weights[:, None]).sum(0) / weights.sum()
+    similar = np.linalg.norm(graph.mean_lab - seed_lab, axis=1) <= max_delta_e
+
+    in_region = np.zeros(graph.n_regions, dtype=bool)
+    in_region[seeds] = True
+    frontier = list(seeds)
+    while frontier:
+        node = frontier.pop()
+        for nb in graph.neighbors(node):
+            if not in_region[nb] and similar[nb]:
+                in_region[nb] = True
+                frontier.append(nb)
+    return in_region[graph.labels]
@@ -0,0 +1,355 @@
+"""
+Golden-image regression harness for the paint/render engines.
+
+Every scene (seeded synthetic rooms, plus the fixture photos) is rendered through
+the reference path (sequential paint_engine.apply_realistic_paint) and through each
+candidate engine. The harness reports per-pixel CIEDE2000 against the reference,
+checks each candidate's error budget and records its speedup. Reference renders can
+be pinned as golden images so changes to the reference itself are caught too; the
+repository ships fixture photos (regression/fixtures) and their goldens
+(regression/golden). Synthetic-scene goldens are keyed by size and seed and are
+only checked once written with --update-golden.
+
+    python -m utils.render_regression                  # compare candidates
+    python -m utils.render_regression --update-golden  # (re)write golden images
+    python -m utils.render_regression --fixtures rooms/ --json report.json
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+import zlib
+
+import cv2
+import numpy as np
+
+from paint_ai.paint_kernel import MAX_ALLOWED_DIFF
+
+REGRESSION_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "regression")
+GOLDEN_DIR = os.environ.get("VISUALIZER_GOLDEN_DIR", os.path.join(REGRESSION_DIR, "golden"))
+FIXTURES_DIR = os.path.join(REGRESSION_DIR, "fixtures")
+FINISHES = ("matte", "silk", "gloss")
+
+# Extreme colors that stress clipping and uint8 wrap-around (e.g. a/b channel casts)
+EDGE_COLORS = ["#000000", "#FFFFFF", "#FF00FF", "#00FF00", "#0000FF", "#FFFF00"]
+
+# name -> {'fn': render(scene) -> RGB, 'max_delta_e': budget, 'max_channel_diff': budget, 'baseline': fn or None}
+CANDIDATES = {}
+# Strip height of the "tiled" candidate: small, so every scene has several halo seams
+TILED_STRIP_ROWS = 96
+
+
+def register_candidate(name, max_delta_e=0.0, max_channel_diff=0, baseline=None):
+    """
+    Decorator: adds a candidate engine with its error budget (0 = must be bit-identical).
+    max_delta_e=None leaves the color error bounded by max_channel_diff alone.
+    baseline(scene) -> RGB replaces the reference for candidates that must match
+    another renderer rather than the reference (e.g. a low-memory variant).
+    """
+    def wrap(fn):
+        CANDIDATES[name] = {'fn': fn, 'max_delta_e': max_delta_e, 'max_channel_diff': max_channel_diff,
+                            'baseline': baseline}
+        return fn
+    return wrap
+
+
+# --- Scenes ---
+
+def _synthetic_room(rng, size):
+    """Wall/floor/ceiling planes with a light gradient, a shadow wedge, a window highlight and grain."""
+    h, w = size
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    base = rng.uniform(120, 230, 3).astype(np.float32)
+    light = 0.55 + 0.5 * (xx / w) * (1 - 0.3 * yy / h)
+    image = base * light[..., None]
+
+    floor = yy > h * rng.uniform(0.65, 0.8)
+    image[floor] = rng.uniform(60, 140, 3) * light[floor][:, None]
+    wedge = (xx + yy * rng.uniform(0.2, 0.6)) < w * rng.uniform(0.2, 0.35)
+    image[wedge] *= 0.45
+
+    wx, wy = int(w * rng.uniform(0.55, 0.7)), int(h * 0.15)
+    image[wy:wy + h // 4, wx:wx + w // 6] = 250
+
+    image += rng.normal(0, 6, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def _seeded_masks(rng, size, count):
+    """Rectangles, ellipses and polygons; overlapping on purpose (paint order matters)."""
+    h, w = size
+    masks = []
+    for i in range(count):
+        m = np.zeros(size, dtype=np.uint8)
+        kind = i % 3
+        if kind == 0:
+            x0, y0 = rng.integers(0, w // 2), rng.integers(0, h // 2)
+            m[y0:y0 + rng.integers(h // 5, h // 2), x0:x0 + rng.integers(w // 5, w // 2)] = 1
+        elif kind == 1:
+            center = (int(rng.integers(w // 4, 3 * w // 4)), int(rng.integers(h // 4, 3 * h // 4)))
+            axes = (int(rng.integers(w // 10, w // 3)), int(rng.integers(h // 10, h // 3)))
+            cv2.ellipse(m, center, axes, float(rng.uniform(0, 180)), 0, 360, 1, -1)
+        else:
+            pts = np.stack([rng.integers(0, w, 6), rng.integers(0, h, 6)], axis=1).astype(np.int32)
+            cv2.fillPoly(m, [cv2.convexHull(pts)], 1)
+        masks.append(m.astype(bool))
+    return masks
+
+
+def _palette_entries(rng, count):
+    """Seeded picks from the brand catalog plus the extreme edge colors."""
+    from brands.catalog import get_catalog
+    from utils.color_utils import hex_to_lab
+
+    catalog = get_catalog()
+    hexes = list(catalog.hexes[rng.permutation(len(catalog))[:count]]) + EDGE_COLORS
+    return [{'hex': h, 'lab': hex_to_lab(h), 'finish': FINISHES[i % 3],
+             'reflectance': float(rng.uniform(0.1, 0.9))} for i, h in enumerate(hexes)]
+
+
+def build_scenes(seed=0, size=(600, 800), n_synthetic=3, fixtures_dir=None, layers=4):
+    """
+    Scenes: dicts with name, golden key, image (RGB uint8), lighting maps and layers
+    [{'mask', 'lab', 'finish', 'reflectance'}]. Fixture photos get seeded masks too.
+    Each scene draws from its own seeded stream, so a scene (and its golden) doesn't
+    change with the number of other scenes.
+    """
+    from utils.lighting_utils import extract_lighting_maps
+
+    h, w = size
+    images = []
+    for i in range(n_synthetic):
+        rng = np.random.default_rng([seed, i])
+        images.append((f"synthetic_{i}", f"synthetic_{i}_{h}x{w}_seed{seed}", rng, _synthetic_room(rng, size)))
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, "*"))) if fixtures_dir else []:
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is not None:
+            name = os.path.splitext(os.path.basename(path))[0]
+            rng = np.random.default_rng([seed, zlib.crc32(name.encode())])
+            images.append((name, f"{name}_seed{seed}", rng, cv2.cvtColor(img, cv2.COLOR_BGR2RGB)))
+
+    palette = _palette_entries(np.random.default_rng(seed), 6)
+    scenes = []
+    for name, key, rng, image in images:
+        masks = _seeded_masks(rng, image.shape[:2], layers)
+        picks = rng.choice(len(palette), size=layers, replace=False)
+        scenes.append({
+            'name': name,
+            'key': key,
+            'image': image,
+            'lighting': extract_lighting_maps(image),
+            'layers': [dict(palette[p], mask=m) for p, m in zip(picks, masks)],
+            # Second color set for incremental (color swap) engines
+            'swap_layers': [dict(palette[(p + 1) % len(palette)], mask=m) for p, m in zip(picks, masks)],
+        })
+    return scenes
+
+
+# --- Engines ---
+
+def render_reference(scene, layers=None):
+    """The reference path: sequential apply_realistic_paint, as the app paints layers."""
+    from paint_ai.paint_engine import apply_realistic_paint
+    image = scene['image']
+    for layer in layers or scene['layers']:
+        image = apply_realistic_paint(image, layer['mask'], layer['lab'], layer['finish'],
+                                      layer['reflectance'], scene['lighting'])
+    return image
+
+
+@register_candidate("fused", max_delta_e=None, max_channel_diff=MAX_ALLOWED_DIFF)
+def _render_fused(scene):
+    """Numba fused kernel, painting in place as the renderers do (falls back to the reference when numba is missing)."""
+    from paint_ai.paint_kernel import apply_realistic_paint_fused
+    image = scene['image'].copy()
+    for layer in scene['layers']:
+        image = apply_realistic_paint_fused(image, layer['mask'], layer['lab'], layer['finish'],
+                                            layer['reflectance'], scene['lighting'], inplace=True)
+    return image
+
+
+@register_candidate("basis")
+def _render_basis(scene):
+    """Per-layer PaintBasis (preview path)."""
+    from paint_ai.paint_engine import PaintBasis
+    image = scene['image']
+    for layer in scene['layers']:
+        image = PaintBasis(layer['mask'], scene['lighting'], layer['finish'], layer['reflectance']).apply(image, layer['lab'])
+    return image
+
+
+@register_candidate("incremental")
+def _render_incremental(scene):
+    """
+    Color swap on prebuilt PaintBasis layers (built once per scene, like the app's
+    paint_bases cache): each call swaps to another color set and back, so the
+    timing covers two swaps and the output checks that a swap leaves no residue.
+    """
+    from paint_ai.paint_engine import PaintBasis
+    if '_bases' not in scene:
+        scene['_bases'] = [PaintBasis(l['mask'], scene['lighting'], l['finish'], l['reflectance']) for l in scene['layers']]
+    for layers in (scene['swap_layers'], scene['layers']):
+        image = scene['image']
+        for basis, layer in zip(scene['_bases'], layers):
+            image = basis.apply(image, layer['lab'])
+    return image
+
+
+@register_candidate("batched", max_delta_e=None, max_channel_diff=MAX_ALLOWED_DIFF) # Paints with the fused kernel
+def _render_batched(scene):
+    """
+    batch_render's union-crop path (prepare_job + render_variant), prepared once per
+    scene. Layer 1 is the target (its own color as the variant); layers 0, 2, 3 keep
+    their saved colors, and 2 and 3 are painted over the target where they overlap.
+    """
+    from batch_render import prepare_job, render_variant
+    from PIL import Image
+    layers = scene['layers']
+    if '_batch_job' not in scene:
+        project_state = {
+            'masks': [l['mask'] for l in layers],
+            'wall_assignments': {i: {'lab': l['lab'], 'finish': l['finish'], 'reflectance': l['reflectance']}
+                                 for i, l in enumerate(layers)},
+        }
+        scene['_batch_job'] = prepare_job(Image.fromarray(scene['image']), project_state, target_indices=[1])
+    target = layers[1]
+    return render_variant(scene['_batch_job'], {'hex': target['hex'], 'finish': target['finish'],
+                                                'reflectance': target['reflectance']})
+
+
+def _high_res_args(scene):
+    from PIL import Image
+    layers = scene['layers']
+    wall_assignments = {i: {'lab': l['lab'], 'finish': l['finish'], 'reflectance': l['reflectance']}
+                        for i, l in enumerate(layers)}
+    return Image.fromarray(scene['image']), [l['mask'] for l in layers], wall_assignments
+
+
+def _render_untiled(scene):
+    """render_high_res in one piece: the baseline of the tiled path (cached per scene)."""
+    from utils.render_utils import render_high_res
+    if '_untiled' not in scene:
+        scene['_untiled'] = render_high_res(*_high_res_args(scene))
+    return scene['_untiled']
+
+
+@register_candidate("tiled", max_delta_e=0.0, max_channel_diff=0, baseline=_render_untiled)
+def _render_tiled(scene):
+    """render_high_res_tiled (low-memory export) in TILED_STRIP_ROWS strips; must equal the untiled render."""
+    from utils.render_utils import render_high_res_tiled
+    return render_high_res_tiled(*_high_res_args(scene), tile_rows=TILED_STRIP_ROWS)
+
+
+# --- Comparison ---
+
+def compare_images(reference, candidate):
+    """Per-pixel error stats: CIEDE2000 (computed only where pixels differ) and channel diff."""
+    from utils.color_utils import rgb_to_cielab, delta_e_2000
+
+    diff = np.abs(reference.astype(np.int16) - candidate.astype(np.int16))
+    differing = diff.any(axis=2)
+    n_diff = int(differing.sum())
+    de = np.zeros(0)
+    if n_diff:
+        de = delta_e_2000(rgb_to_cielab(reference[differing]), rgb_to_cielab(candidate[differing]))
+    total = differing.size
+    return {
+        'max_channel_diff': int(diff.max()),
+        'differing_fraction': n_diff / total,
+        'max_delta_e': float(de.max()) if n_diff else 0.0,
+        'mean_delta_e': float(de.sum() / total),
+        'p99_delta_e': float(np.percentile(np.concatenate([de, np.zeros(total - n_diff)]), 99)) if n_diff else 0.0,
+    }
+
+
+def _timed(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return result, float(np.median(times))
+
+
+def _golden_path(golden_dir, scene_key):
+    return os.path.join(golden_dir, f"{scene_key}.png")
+
+
+def run(scenes, candidates=None, repeats=3, golden_dir=None, update_golden=False):
+    """
+    Renders every scene with the reference and the candidates.
+    Returns (rows, ok): one row per (scene, engine) with error stats, budget
+    verdict, timing and speedup; ok is False if any budget or golden check fails.
+    """
+    names = candidates or list(CANDIDATES)
+    for name in names:
+        if name not in CANDIDATES:
+            raise ValueError(f"Unknown candidate engine: {name}")
+
+    rows, ok = [], True
+    for scene in scenes:
+        render_reference(scene) # Warm caches (and the JIT) outside the timings
+        reference, ref_s = _timed(lambda: render_reference(scene), repeats)
+
+        if golden_dir:
+            path = _golden_path(golden_dir, scene['key'])
+            if update_golden:
+                os.makedirs(golden_dir, exist_ok=True)
+                cv2.imwrite(path, cv2.cvtColor(reference, cv2.COLOR_RGB2BGR))
+            elif os.path.exists(path):
+                golden = cv2.cvtColor(cv2.imread(path, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+                stats = compare_images(golden, reference)
+                passed = stats['max_channel_diff'] == 0
+                ok &= passed
+                rows.append(dict(stats, scene=scene['name'], engine="reference-vs-golden",
+                                 passed=passed, seconds=ref_s, speedup=1.0))
+
+        for name in names:
+            spec = CANDIDATES[name]
+            spec['fn'](scene)
+            output, cand_s = _timed(lambda: spec['fn'](scene), repeats)
+            stats = compare_images(reference if spec['baseline'] is None else spec['baseline'](scene), output)
+            passed = ((spec['max_delta_e'] is None or stats['max_delta_e'] <= spec['max_delta_e'])
+                      and stats['max_channel_diff'] <= spec['max_channel_diff'])
+            ok &= passed
+            rows.append(dict(stats, scene=scene['name'], engine=name, passed=passed,
+                             seconds=cand_s, reference_seconds=ref_s, speedup=ref_s / max(cand_s, 1e-9),
+                             digest=hashlib.blake2b(output.tobytes(), digest_size=8).hexdigest()))
+    return rows, ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare paint engines against the reference renderer.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--size", default="600x800", help="Synthetic scene size HxW")
+    parser.add_argument("--scenes", type=int, default=3, help="Number of synthetic scenes")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="Directory of fixture room photos ('' for none)")
+    parser.add_argument("--engines", help="Comma-separated candidates (default: all registered)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--golden-dir", default=GOLDEN_DIR)
+    parser.add_argument("--update-golden", action="store_true", help="Write reference renders as golden images")
+    parser.add_argument("--json", help="Write the full report here")
+    args = parser.parse_args(argv)
+
+    h, w = (int(v) for v in args.size.lower().split("x"))
+    scenes = build_scenes(args.seed, (h, w), args.scenes, args.fixtures)
+    engines = args.engines.split(",") if args.engines else None
+    rows, ok = run(scenes, engines, args.repeats, args.golden_dir, args.update_golden)
+
+    print(f"{'scene':16s} {'engine':20s} {'maxΔE':>7s} {'p99ΔE':>7s} {'maxdiff':>7s} {'px%':>7s} {'ms':>8s} {'speedup':>7s}")
+    for r in rows:
+        print(f"{r['scene']:16s} {r['engine']:20s} {r['max_delta_e']:7.3f} {r['p99_delta_e']:7.3f} "
+              f"{r['max_channel_diff']:7d} {r['differing_fraction'] * 100:7.3f} {r['seconds'] * 1000:8.1f} "
+              f"{r['speedup']:6.2f}x {'' if r['passed'] else 'FAIL'}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+    print("OK" if ok else "FAILED: outside error budget")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,30 @@
 import cv2
 import numpy as np
 from PIL import Image
-from paint_ai.paint_engine import apply_realistic_paint
+from paint_ai.paint_kernel import get_paint_function
 from utils.lighting_utils import extract_lighting_maps
+from paint_ai.object_refiner import logits_to_mask
+from utils.mask_utils import polygon_to_mask, smooth_mask
 
-def render_high_res(original_image, masks, wall_assignments):
+def upscale_mask(mask_low, size, obj_state=None, polygons=None):
+    """
+    Brings one preview mask to size=(width, height), using the best source available:
+    lasso polygons (exact), SAM low-res logits (smooth), else the binary mask (nearest).
+    """
+    w_full, h_full = size
+    if polygons:
+        # Vector lasso: exact edges at any resolution
+        return polygon_to_mask(polygons, (h_full, w_full), scale=w_full / mask_low.shape[1])
+    if obj_state is not None and obj_state.get('logits') is not None:
+        # Smooth, resolution-independent edges straight from SAM's logits, then the
+        # same cleanup the preview mask got (smooth_mask), scaled to this resolution
+        return smooth_mask(logits_to_mask(obj_state, (w_full, h_full)), scale=w_full / mask_low.shape[1])
+    # Use INTER_NEAREST to preserve binary nature of mask
+    mask_uint8 = (mask_low.astype(np.uint8)) * 255
+    mask_full = cv2.resize(mask_uint8, (w_full, h_full), interpolation=cv2.INTER_NEAREST)
+    return mask_full > 0
+
+def render_high_res(original_image, masks, wall_assignments, mask_logits=None, mask_polygons=None, tile_rows=None):
     """
     Rerenders the final painted image at full resolution.
     
@@ -12,7 +32,17 @@ def render_high_res(original_image, masks, wall_assignments):
         original_image: PIL Image at full resolution.
         masks: List of masks at lower resolution.
         wall_assignments: Dict mapping mask index to color/finish data.
+        mask_logits: Optional dict mapping mask index to object prompt state with
+            low-res SAM logits (paint_ai/object_refiner.py); those masks are
+            upsampled from logits instead of from the binary preview mask.
+        mask_polygons: Optional dict mapping mask index to lasso polygons in
+            preview coordinates; those masks are rasterized at full resolution.
+        tile_rows: Optional strip height for the low-memory mode (same output,
+            see render_high_res_tiled).
     """
+    if tile_rows:
+        return render_high_res_tiled(original_image, masks, wall_assignments, mask_logits, mask_polygons, tile_rows)
+
     # 1. Prepare Full Res Image and Lightingss
     full_res_cv2 = np.array(original_image.convert("RGB"))
     h_full, w_full = full_res_cv2.shape[:2]
@@ -21,7 +51,8 @@ def render_high_res(original_image, masks, wall_assignments):
     # Note: This is computationally expensive but necessary for 4K quality
     full_res_lighting = extract_lighting_maps(full_res_cv2)
     
-    result_image = full_res_cv2.copy()
+    result_image = full_res_cv2 # Painted in place: the lighting maps are already extracted
+    paint = get_paint_function() # Fused Numba kernel when available
     
     # 2. Sequential Application of Masks
     for m_idx, data in wall_assignments.items():
@@ -29,19 +60,65 @@ def render_high_res(original_image, masks, wall_assignments):
             mask_low = masks[m_idx]
             
             # 3. Upscale Mask to Full resolution
-            # Use INTER_NEAREST to preserve binary nature of mask
-            mask_uint8 = (mask_low.astype(np.uint8)) * 255
-            mask_full = cv2.resize(mask_uint8, (w_full, h_full), interpolation=cv2.INTER_NEAREST)
-            mask_full_bool = mask_full > 0
+            mask_full_bool = upscale_mask(
+                mask_low, (w_full, h_full),
+                obj_state=(mask_logits or {}).get(m_idx),
+                polygons=(mask_polygons or {}).get(m_idx),
+            )
             
             # 4. Apply Paint Engine at high resolution
-            result_image = apply_realistic_paint(
+            result_image = paint(
                 result_image, 
                 mask_full_bool, 
                 data['lab'], 
                 finish=data['finish'], 
                 reflectance=data.get('reflectance', 0.5),
-                lighting_maps=full_res_lighting
+                lighting_maps=full_res_lighting,
+                inplace=True
             )
             
     return result_image
+
+TILE_HALO_ROWS = 32 # >= the widest filter in extract_lighting_maps (21x21 blur): strip edges stay exact
+
+def render_high_res_tiled(original_image, masks, wall_assignments, mask_logits=None, mask_polygons=None, tile_rows=512):
+    """
+    Low-memory render_high_res with identical output. Masks are upscaled once and
+    kept bit-packed; the image is painted in place, strip by strip, each strip with
+    a halo of original rows so its lighting maps match the full-image ones. Peak
+    memory is the image plus one strip of lighting maps and paint temporaries.
+    """
+    image = np.array(original_image if original_image.mode == "RGB" else original_image.convert("RGB"))
+    h_full, w_full = image.shape[:2]
+    paint = get_paint_function()
+
+    # 1. UPSCALE MASKS ONCE (1 bit per pixel)
+    layers = []
+    for m_idx, data in wall_assignments.items():
+        if m_idx < len(masks):
+            mask_full = upscale_mask(
+                masks[m_idx], (w_full, h_full),
+                obj_state=(mask_logits or {}).get(m_idx),
+                polygons=(mask_polygons or {}).get(m_idx),
+            )
+            if mask_full.any():
+                layers.append((np.packbits(mask_full, axis=1), data))
+            del mask_full
+
+    # 2. PAINT STRIP BY STRIP
+    carry = None # Original rows above the current strip (already painted in image)
+    for y0 in range(0, h_full, tile_rows):
+        y1 = min(y0 + tile_rows, h_full)
+        top, bottom = max(0, y0 - TILE_HALO_ROWS), min(h_full, y1 + TILE_HALO_ROWS)
+        strip = image[top:bottom].copy()
+        if carry is not None:
+            strip[:y0 - top] = carry
+        carry = strip[max(top, y1 - TILE_HALO_ROWS) - top:y1 - top].copy()
+
+        lighting = extract_lighting_maps(strip)
+        for packed, data in layers:
+            mask = np.unpackbits(packed[top:bottom], axis=1, count=w_full).view(bool)
+            strip = paint(strip, mask, data['lab'], finish=data['finish'],
+                          reflectance=data.get('reflectance', 0.5), lighting_maps=lighting, inplace=True)
+        image[y0:y1] = strip[y0 - top:y1 - top]
+    return image
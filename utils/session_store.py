@@ -0,0 +1,260 @@
+import os
+import shutil
+from contextlib import contextmanager
+import tempfile
+import threading
+import time
+
+import numpy as np
+import streamlit as st
+
+# Sessions idle longer than this spill their large arrays to disk
+SPILL_IDLE_SECONDS = int(os.environ.get("VISUALIZER_SPILL_IDLE_SECONDS", "300"))
+SPILL_DIR = os.environ.get("VISUALIZER_SPILL_DIR", os.path.join(tempfile.gettempdir(), "visualizer_spill"))
+SWEEP_INTERVAL_SECONDS = 30
+MIN_SPILL_BYTES = 64 * 1024 # Smaller arrays aren't worth a file
+
+
+def _is_spilled(value):
+    return isinstance(value, np.memmap)
+
+
+def _array_bytes(value, seen=None):
+    """Resident bytes of numpy arrays reachable through dicts/lists/RegionGraph (memmaps count 0)."""
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, np.ndarray):
+        return 0 if _is_spilled(value) else value.nbytes
+    if isinstance(value, dict):
+        return sum(_array_bytes(v, seen) for v in value.values())
+    if isinstance(value, list):
+        return sum(_array_bytes(v, seen) for v in value)
+    if hasattr(value, "nbytes") and hasattr(value, "labels"): # RegionGraph
+        return sum(_array_bytes(v, seen) for v in vars(value).values())
+    return 0
+
+
+def _spill_container(container, keys, directory, prefix):
+    """Replaces large arrays in a dict/list/object-dict with copy-on-write memmaps of .npy files."""
+    spilled = 0
+    for key in keys:
+        value = container[key]
+        name = f"{prefix}_{key}"
+        if isinstance(value, np.ndarray):
+            if _is_spilled(value) or value.nbytes < MIN_SPILL_BYTES or value.dtype == object:
+                continue
+            path = os.path.join(directory, name + ".npy")
+            np.save(path, value)
+            # mmap_mode='c': pages load lazily on next access, writes stay private
+            container[key] = np.load(path, mmap_mode="c")
+            spilled += value.nbytes
+        elif isinstance(value, dict):
+            spilled += _spill_container(value, list(value.keys()), directory, name)
+        elif isinstance(value, list):
+            spilled += _spill_container(value, range(len(value)), directory, name)
+        elif hasattr(value, "nbytes") and hasattr(value, "labels"): # RegionGraph
+            attrs = vars(value)
+            spilled += _spill_container(attrs, list(attrs.keys()), directory, name)
+    return spilled
+
+
+class SessionStore:
+    """
+    Process-wide registry of session memory. Each script run holds its session
+    (run()); sessions idle longer than SPILL_IDLE_SECONDS get their large arrays (masks,
+    lighting maps, region graph, logits) moved to memory-mapped .npy files and their
+    caches dropped (rendered frame, SAM embedding, candidate masks). Spilled arrays
+    are paged back in lazily by the OS when the session is used again.
+    A session is only ever spilled by another thread while it holds no run: each
+    entry has a lock that the session's run holds throughout and spill() takes.
+    """
+    def __init__(self, spill_dir=SPILL_DIR, idle_seconds=SPILL_IDLE_SECONDS):
+        self.spill_dir = spill_dir
+        self.idle_seconds = idle_seconds
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    @contextmanager
+    def run(self, session_id, state, predictor=None, caches=(), extra_bytes=0):
+        """
+        Holds a session for one script run (or fragment run) and touch()es it.
+        Waits for a spill of this session in progress, then keeps others from
+        spilling or evicting it until the run ends (reruns and st.stop included).
+        """
+        with self._lock:
+            entry = self._sessions.setdefault(session_id, self._new_entry())
+        with entry['lock']:
+            entry['running'] += 1
+            try:
+                self.touch(session_id, state, predictor, caches, extra_bytes)
+                yield
+            finally:
+                entry['running'] -= 1
+
+    @staticmethod
+    def _new_entry():
+        return {'spilled': False, 'lock': threading.RLock(), 'running': 0}
+
+    def touch(self, session_id, state, predictor=None, caches=(), extra_bytes=0):
+        """
+        Marks a session active and records what it holds (run() calls this).
+        state: the session's state dict; predictor: its SamPredictor (embedding);
+        caches: objects with clear()/nbytes(); extra_bytes: other resident data (images).
+        """
+        with self._lock:
+            entry = self._sessions.setdefault(session_id, self._new_entry())
+            entry.update({
+                'state': state,
+                'predictor': predictor,
+                'caches': [c for c in caches if c is not None],
+                'extra_bytes': extra_bytes,
+                'last_active': time.time(),
+            })
+            if entry['spilled']:
+                # Rehydrated lazily: memmaps stay valid after their files are unlinked
+                shutil.rmtree(self._session_dir(session_id), ignore_errors=True)
+                entry['spilled'] = False
+
+        if time.time() - self._last_sweep > SWEEP_INTERVAL_SECONDS:
+            self.sweep(exclude=session_id)
+
+    def _session_dir(self, session_id):
+        return os.path.join(self.spill_dir, session_id)
+
+    @contextmanager
+    def _held(self, session_id):
+        """
+        Yields the session's entry with its lock held, or None if it is unknown or
+        another thread is running it. The calling thread's own run is re-entrant (RLock).
+        """
+        entry = self._sessions.get(session_id)
+        if entry is None or 'state' not in entry or not entry['lock'].acquire(blocking=False):
+            yield None # Mid-run in another thread: never touch its state
+            return
+        try:
+            yield entry
+        finally:
+            entry['lock'].release()
+
+    def spill(self, session_id):
+        """
+        Moves one session's large arrays to disk and drops its caches. Returns bytes
+        freed; 0 if it is already spilled or another thread is running it.
+        """
+        with self._held(session_id) as entry:
+            if entry is None or entry['spilled']:
+                return 0
+            directory = self._session_dir(session_id)
+            os.makedirs(directory, exist_ok=True)
+
+            freed = self._evict_caches(entry)
+            state = entry['state']
+            freed += _spill_container(state, [k for k in state.keys() if k != 'history'], directory, "state")
+            entry['spilled'] = True
+            return freed
+
+    def evict_caches(self, session_id):
+        """
+        Drops one session's caches (rendered frame, SAM embedding, candidate masks)
+        but keeps its arrays resident. Returns bytes freed (0 if another thread is
+        running the session).
+        """
+        with self._held(session_id) as entry:
+            return self._evict_caches(entry) if entry is not None else 0
+
+    def _evict_caches(self, entry):
+        # Pure caches: cheaper to recompute than to store
+        state = entry['state']
+        freed = 0
+        cached = state.get('cached_paint_cv2')
+        if isinstance(cached, np.ndarray):
+            freed += cached.nbytes
+            state['cached_paint_cv2'] = None
+            state['cached_assignments_hash'] = None
+
+        predictor = entry['predictor']
+        if predictor is not None and getattr(predictor, 'is_image_set', False):
+            features = getattr(predictor, 'features', None)
+            freed += features.numel() * features.element_size() if features is not None else 0
+            predictor.reset_image()
+            predictor.embedding_id = None
+            state['ai_image_embedded'] = False # Re-embed on the next AI click
+        for cache in entry['caches']:
+            freed += cache.nbytes()
+            cache.clear()
+        return freed
+
+    def sweep(self, exclude=None, idle_seconds=None):
+        """Spills sessions idle longer than idle_seconds (default: the store's) and forgets closed ones."""
+        self._last_sweep = time.time()
+        now = time.time()
+        idle_seconds = self.idle_seconds if idle_seconds is None else idle_seconds
+        for session_id in list(self._sessions.keys()):
+            if session_id == exclude:
+                continue
+            if not _session_exists(session_id):
+                with self._lock:
+                    self._sessions.pop(session_id, None)
+                shutil.rmtree(self._session_dir(session_id), ignore_errors=True)
+                from utils.job_scheduler import get_job_scheduler
+                get_job_scheduler().cancel_session(session_id) # Stops its background scan, if any
+                continue
+            entry = self._sessions.get(session_id)
+            if entry is None or entry['running']:
+                continue # Mid-run: its arrays are in use (spill() would skip it too)
+            if now - entry.get('last_active', now) > idle_seconds:
+                self.spill(session_id)
+
+    def session_bytes(self, session_id):
+        """Estimated resident bytes of a session (arrays, embedding, caches, images)."""
+        entry = self._sessions.get(session_id)
+        if entry is None or 'state' not in entry:
+            return 0
+        total = _array_bytes(entry['state']) + entry['extra_bytes']
+        predictor = entry['predictor']
+        if predictor is not None and getattr(predictor, 'is_image_set', False):
+            total += predictor.features.numel() * predictor.features.element_size()
+        total += sum(c.nbytes() for c in entry['caches'])
+        return total
+
+    def report(self):
+        """Per-session memory: list of dicts sorted by size, largest first."""
+        now = time.time()
+        rows = [{
+            'session_id': sid,
+            'bytes': self.session_bytes(sid),
+            'idle_seconds': int(now - entry['last_active']),
+            'spilled': entry['spilled'],
+            'running': entry['running'] > 0,
+        } for sid, entry in list(self._sessions.items()) if 'state' in entry]
+        return sorted(rows, key=lambda r: r['bytes'], reverse=True)
+
+
+def _session_exists(session_id):
+    """True while Streamlit still holds state for the session (connected or not)."""
+    try:
+        from streamlit.runtime import Runtime
+        runtime = Runtime.instance()
+        mgr = getattr(runtime, "_session_mgr", None)
+        if mgr is not None and hasattr(mgr, "get_session_info"):
+            return mgr.get_session_info(session_id) is not None
+        return runtime.is_active_session(session_id)
+    except Exception:
+        return True # Unknown: keep it (never drop state we can't account for)
+
+
+@st.cache_resource(show_spinner=False)
+def get_session_store():
+    """The process-wide SessionStore."""
+    return SessionStore()
+
+
+def current_session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "local"
@@ -0,0 +1,108 @@
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import streamlit as st
+
+# Modules needed as soon as an image is uploaded (paint, lighting, canvas)
+ENGINE_MODULES = [
+    "cv2",
+    "utils.lighting_utils",
+    "utils.mask_utils",
+    "paint_ai.paint_engine",
+    "utils.render_utils",
+    "ui.lasso_canvas",
+]
+
+# Only needed in AI modes; large (torch alone is hundreds of MB resident)
+AI_MODULES = [
+    "torch",
+    "segment_anything",
+    "paint_ai.sam_loader",
+]
+
+# VISUALIZER_WARMUP: "0"/"off" = disabled, "1"/"engine" = engine modules (default),
+# "ai" = engine + SAM stack (for GPU / AI-first deployments)
+WARMUP_ENV = "VISUALIZER_WARMUP"
+
+
+def _warmup_modules(level):
+    if level in ("0", "off", "false", "no"):
+        return []
+    if level == "ai":
+        return ENGINE_MODULES + AI_MODULES
+    return list(ENGINE_MODULES)
+
+
+def warm_up(modules=None):
+    """
+    Imports the given modules (default: per VISUALIZER_WARMUP) into this process.
+    Returns {module: seconds}; failures are recorded as None and never raised.
+    """
+    if modules is None:
+        modules = _warmup_modules(os.environ.get(WARMUP_ENV, "1").lower())
+
+    timings = {}
+    for name in modules:
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            timings[name] = time.perf_counter() - t0
+        except Exception:
+            timings[name] = None
+    return timings
+
+
+@st.cache_resource(show_spinner=False)
+def start_warmup():
+    """
+    Starts the warm-up once per server process, in a background thread so the
+    first page renders immediately. By the time the first image is uploaded
+    the engine modules are already in sys.modules.
+    """
+    result = {}
+
+    def _run():
+        result.update(warm_up())
+
+    thread = threading.Thread(target=_run, name="visualizer-warmup", daemon=True)
+    thread.start()
+    return {"thread": thread, "timings": result}
+
+
+def profile_imports(modules=None, python=None):
+    """
+    Import-time breakdown in a fresh interpreter (python -X importtime).
+    Returns a list of (module, cumulative_seconds), slowest first.
+    """
+    modules = modules or ["streamlit"] + ENGINE_MODULES + AI_MODULES
+    code = "\n".join(
+        f"try:\n    import {m}\nexcept Exception:\n    pass" for m in modules
+    )
+    proc = subprocess.run(
+        [python or sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+
+    # Lines look like: "import time:  self [us] | cumulative | imported package"
+    totals = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        name = parts[2].strip()
+        if name in modules:
+            totals[name] = int(parts[1]) / 1e6
+    return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)
+
+
+if __name__ == "__main__":
+    # Startup profile: python -m utils.startup
+    for name, seconds in profile_imports():
+        print(f"{seconds * 1000:9.1f} ms  {name}")
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+# Original uploads live here undecoded until export (content-addressed: identical photos share a file)
+SPOOL_DIR = os.environ.get("VISUALIZER_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "visualizer_spool"))
+SPOOL_MAX_AGE_SECONDS = int(os.environ.get("VISUALIZER_SPOOL_MAX_AGE_SECONDS", str(24 * 3600)))
+CHUNK_SIZE = 1024 * 1024
+
+
+def spool_upload(fileobj, directory=SPOOL_DIR):
+    """
+    Streams an uploaded file to the spool in chunks, without decoding it.
+    Returns the spool path (named by the content's SHA-256).
+    """
+    os.makedirs(directory, exist_ok=True)
+    fileobj.seek(0)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    with os.fdopen(fd, "wb") as out:
+        for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            out.write(chunk)
+    fileobj.seek(0)
+    path = os.path.join(directory, digest.hexdigest())
+    os.replace(tmp_path, path) # Atomic; open readers of an identical file keep their copy
+    prune_spool(directory)
+    return path
+
+
+def spool_bytes(data, directory=SPOOL_DIR):
+    """spool_upload for bytes already in memory (e.g. the image inside a project file)."""
+    import io
+    return spool_upload(io.BytesIO(data), directory)
+
+
+def open_spooled(path):
+    """The full-resolution original as a lazily decoded PIL image, or None if it was pruned."""
+    if not path or not os.path.exists(path):
+        return None
+    os.utime(path) # In use: keep it out of the next prune
+    return Image.open(path)
+
+
+def read_spooled(path):
+    """Raw bytes of a spooled original (for project files), or None if it was pruned."""
+    if not path or not os.path.exists(path):
+        return None
+    os.utime(path)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def prune_spool(directory=SPOOL_DIR, max_age=SPOOL_MAX_AGE_SECONDS):
+    """Deletes spool files not used for max_age seconds (and stale partial writes)."""
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass # Removed concurrently by another session